@@ -1,11 +1,11 @@
 from __future__ import annotations
-from datetime import datetime, timedelta, timezone
+from datetime import UTC, datetime, timedelta
 import uuid
 import jwt
 
 
 def create_access_token(*, secret: str, algorithm: str, subject: str, role: str, exp_minutes: int):
-    now = datetime.now(timezone.utc)
+    now = datetime.now(UTC)
     payload = {
         "sub": subject,
         "role": role,
@@ -18,7 +18,7 @@ def create_access_token(*, secret: str, algorithm: str, subject: str, role: str,
 
 
 def create_refresh_token(*, secret: str, algorithm: str, subject: str, exp_days: int):
-    now = datetime.now(timezone.utc)
+    now = datetime.now(UTC)
     payload = {
         "sub": subject,
         "type": "refresh",
@@ -30,4 +30,33 @@ def create_refresh_token(*, secret: str, algorithm: str, subject: str, exp_days:
 
 
 def decode_token(token: str, secret: str, algorithm: str):
-    return jwt.decode(token, secret, algorithms=[algorithm])
\ No newline at end of file
+    return jwt.decode(token, secret, algorithms=[algorithm])
+
+
+def create_attendance_ticket(
+    *,
+    secret: str,
+    algorithm: str,
+    subject: str,
+    code: str,
+    session_id: int,
+    session_start: int | None,
+    class_location: tuple[float, float],
+    exp_seconds: int,
+):
+    """
+    Short-lived proof that a student passed the attendance preflight for a session.
+    Carries no role, so it is never accepted as an access token.
+    """
+    now = datetime.now(UTC)
+    payload = {
+        "sub": subject,
+        "type": "attendance_ticket",
+        "code": code,
+        "sid": session_id,
+        "start": session_start,
+        "loc": list(class_location),
+        "iat": now,
+        "exp": now + timedelta(seconds=exp_seconds),
+    }
+    return jwt.encode(payload, secret, algorithm=algorithm)
@@ -31,6 +31,19 @@ class Config:
     # Attendance policy
     max_distance_feet: int = _get_env_int("MAX_DISTANCE_FEET", 30)
     time_window_minutes: int = _get_env_int("TIME_WINDOW_MINUTES", 30)
+    # Re-run face verification even when the student is already marked present
+    attendance_force_reverify: bool = bool(_get_env_int("ATTENDANCE_FORCE_REVERIFY", 0))
+    # Lifetime of the ticket POST /attendance/preflight issues (lets /attendance skip its checks)
+    attendance_ticket_ttl_seconds: int = _get_env_int("ATTENDANCE_TICKET_TTL_SECONDS", 120)
+    # POST /attendance/batch: most check-ins per request, and how old a capture may be
+    attendance_batch_max_items: int = _get_env_int("ATTENDANCE_BATCH_MAX_ITEMS", 10)
+    attendance_batch_max_age_hours: int = _get_env_int("ATTENDANCE_BATCH_MAX_AGE_HOURS", 24)
+    # Idempotency-Key on POST /attendance and /auth/face-login: how long responses are kept
+    # for replay (0 disables), the in-memory front's size, and how long a duplicate waits
+    # for the first request with its key
+    idempotency_ttl_seconds: int = _get_env_int("IDEMPOTENCY_TTL_SECONDS", 3600)
+    idempotency_cache_max_entries: int = _get_env_int("IDEMPOTENCY_CACHE_MAX_ENTRIES", 1024)
+    idempotency_wait_seconds: int = _get_env_int("IDEMPOTENCY_WAIT_SECONDS", 30)
 
     # User storage
     user_data_dir: Path = Path(os.getenv("USER_DATA_DIR", "./data/users")).resolve()
@@ -46,9 +59,62 @@ class Config:
 
     # Join code
     join_code_ttl_hours: int = _get_env_int("JOIN_CODE_TTL_HOURS", 168)  # 7 days
+    # Bulk roster enrollment: largest accepted zip of <euid>.jpg photos
+    roster_archive_max_bytes: int = _get_env_int("ROSTER_ARCHIVE_MAX_BYTES", 200 * 1024 * 1024)
 
-    # Face recognition knobs (optional)
-    # face_tolerance: float = float(os.getenv("FACE_TOLERANCE", "0.6"))
+    # Reference encoding cache (per worker process)
+    face_cache_max_entries: int = _get_env_int("FACE_CACHE_MAX_ENTRIES", 4096)
+    face_cache_max_bytes: int = _get_env_int("FACE_CACHE_MAX_BYTES", 16 * 1024 * 1024)
+    # Verification results for retried identical photos (per worker process; 0 TTL disables)
+    face_match_cache_max_entries: int = _get_env_int("FACE_MATCH_CACHE_MAX_ENTRIES", 1024)
+    face_match_cache_ttl_seconds: int = _get_env_int("FACE_MATCH_CACHE_TTL_SECONDS", 120)
+    # Reference templates per student (enrollment photo + added captures); 1 disables adding
+    face_max_templates: int = _get_env_int("FACE_MAX_TEMPLATES", 5)
+    # Also match against the templates' mean, and use it as the student's 1:N search vector
+    face_template_centroid: bool = bool(_get_env_int("FACE_TEMPLATE_CENTROID", 1))
+    # Encoding storage: float64 | float32 | float16 | int8 (sidecars, caches, roster matrices)
+    face_encoding_dtype: str = os.getenv("FACE_ENCODING_DTYPE", "float64")
+    # Reference images: face crop bounded to this size (0 = whole frame); originals archive
+    face_reference_crop_dim: int = _get_env_int("FACE_REFERENCE_CROP_DIM", 400)
+    face_reference_archive_dir: str = os.getenv("FACE_REFERENCE_ARCHIVE_DIR", "")
+
+    # Face backend: dlib (face_recognition) | fake (deterministic, for load tests)
+    face_backend: str = os.getenv("FACE_BACKEND", "dlib")
+    # Load models and run one dummy inference (here and in every face worker) at startup
+    face_warmup: bool = bool(_get_env_int("FACE_WARMUP", 0))
+    face_warmup_timeout_seconds: int = _get_env_int("FACE_WARMUP_TIMEOUT_SECONDS", 120)
+
+    # Face worker pool (0 workers = run face work inline on the request thread)
+    face_workers: int = _get_env_int("FACE_WORKERS", 0)
+    face_queue_size: int = _get_env_int("FACE_QUEUE_SIZE", 8)
+    face_job_timeout_seconds: int = _get_env_int("FACE_JOB_TIMEOUT_SECONDS", 15)
+    face_retry_after_seconds: int = _get_env_int("FACE_RETRY_AFTER_SECONDS", 2)
+
+    # Submitted photo pipeline: detect on a downscaled copy, encode at a moderate resolution
+    face_max_dim: int = _get_env_int("FACE_MAX_DIM", 640)
+    face_encode_max_dim: int = _get_env_int("FACE_ENCODE_MAX_DIM", 1280)
+    # Oversized JPEGs are decoded at 1/2, 1/4 or 1/8 scale, keeping the longest edge >= this
+    face_decode_target_dim: int = _get_env_int("FACE_DECODE_TARGET_DIM", 1280)
+    # Group (classroom) photos: small faces need more pixels for detection
+    face_group_max_dim: int = _get_env_int("FACE_GROUP_MAX_DIM", 2048)
+
+    # Campus-wide k-NN index (face login without an euid). Flat scan below the train size.
+    face_index_nprobe: int = _get_env_int("FACE_INDEX_NPROBE", 8)
+    face_index_min_train_size: int = _get_env_int("FACE_INDEX_MIN_TRAIN_SIZE", 1024)
+    # 1:N across the whole campus has more chances of a false accept than 1:1, so be stricter
+    face_identify_tolerance: float = float(os.getenv("FACE_IDENTIFY_TOLERANCE", "0.5"))
+    # Identify-mode attempts per minute from one client address (a campus NAT is shared by
+    # many students); requests carrying a device_id are also limited per device
+    face_identify_max_attempts_per_address: int = _get_env_int(
+        "FACE_IDENTIFY_MAX_ATTEMPTS_PER_ADDRESS", 60
+    )
+
+    # Face recognition knobs
+    face_tolerance: float = float(os.getenv("FACE_TOLERANCE", "0.6"))
+    # Engine preset per endpoint: fast | balanced | accurate (see face_service.FACE_PRESETS)
+    face_preset_attendance: str = os.getenv("FACE_PRESET_ATTENDANCE", "balanced")
+    face_preset_login: str = os.getenv("FACE_PRESET_LOGIN", "balanced")
+    face_preset_enrollment: str = os.getenv("FACE_PRESET_ENROLLMENT", "balanced")
 
     @property
     def is_production(self) -> bool:
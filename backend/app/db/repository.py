@@ -19,6 +19,17 @@ class SessionRow:
     session_time: str  # HH:MM:SS
 
 
+@dataclass(frozen=True)
+class AttendancePrecheck:
+    lat: float
+    lon: float
+    enrolled: bool
+    session_id: int | None  # None: no session on the date
+    session_start: int | None  # epoch seconds (session date/time read as local time)
+    attended: bool  # already marked present in the session
+    templates: list[bytes]  # the student's template BLOBs, slot order
+
+
 def _row_to_dict(row: sqlite3.Row) -> dict[str, Any]:
     return {k: row[k] for k in row.keys()}
 
@@ -109,6 +120,26 @@ def rotate_join_code(db: sqlite3.Connection, *, code: str) -> dict[str, str]:
     return {"join_code": new_code, "join_code_created_at": now_iso}
 
 
+def get_user_role(db: sqlite3.Connection, *, euid: str) -> str | None:
+    cur = db.execute("SELECT fld_us_role FROM tbl_users WHERE fld_us_euid = ? LIMIT 1", (euid,))
+    row = cur.fetchone()
+    return row["fld_us_role"] if row else None
+
+
+def create_student_users(db: sqlite3.Connection, *, euids: list[str], password_hash: str) -> None:
+    """
+    Inserts student rows for euids that don't exist yet. Does not commit.
+    """
+    created_at = _now_iso_utc()
+    db.executemany(
+        """
+        INSERT OR IGNORE INTO tbl_users (fld_us_euid, fld_us_role, fld_us_password_hash, fld_us_created_at)
+        VALUES (?, 'student', ?, ?)
+        """,
+        [(euid, password_hash, created_at) for euid in euids],
+    )
+
+
 def enroll_student(db: sqlite3.Connection, *, code: str, student_euid: str) -> None:
     db.execute(
         """
@@ -123,6 +154,22 @@ def enroll_student(db: sqlite3.Connection, *, code: str, student_euid: str) -> N
 # Student enrollment
 # -------------------------
 
+def get_class_roster(db: sqlite3.Connection, *, code: str) -> list[str]:
+    """
+    Returns the euids enrolled in a class, sorted.
+    """
+    cur = db.execute(
+        """
+        SELECT fld_st_euid AS euid
+        FROM tbl_students
+        WHERE fld_st_code_fk = ?
+        ORDER BY fld_st_euid ASC
+        """,
+        (code,),
+    )
+    return [row["euid"] for row in cur.fetchall()]
+
+
 def student_is_enrolled(db: sqlite3.Connection, *, student_euid: str, code: str) -> bool:
     cur = db.execute(
         """
@@ -136,6 +183,31 @@ def student_is_enrolled(db: sqlite3.Connection, *, student_euid: str, code: str)
     return cur.fetchone() is not None
 
 
+def get_enrolled_face_templates(
+    db: sqlite3.Connection, *, student_euid: str, code: str, model: str
+) -> list[bytes] | None:
+    """
+    Enrollment check and reference templates in one query.
+    Returns None if the student is not enrolled in the class, otherwise the student's
+    template BLOBs for model in slot order (empty if none are stored).
+    """
+    cur = db.execute(
+        """
+        SELECT t.fld_ft_encoding AS encoding
+        FROM tbl_students st
+        LEFT JOIN tbl_face_templates t
+          ON t.fld_ft_euid_fk = st.fld_st_euid AND t.fld_ft_model = ?
+        WHERE st.fld_st_euid = ? AND st.fld_st_code_fk = ?
+        ORDER BY t.fld_ft_slot ASC
+        """,
+        (model, student_euid, code),
+    )
+    rows = cur.fetchall()
+    if not rows:
+        return None
+    return [bytes(row["encoding"]) for row in rows if row["encoding"] is not None]
+
+
 def enroll_student_in_class(db: sqlite3.Connection, *, student_euid: str, code: str) -> None:
     """
     Enroll a student in a class.
@@ -178,6 +250,72 @@ def get_student_classes(db: sqlite3.Connection, *, student_euid: str) -> list[di
     return [dict(row) for row in cur.fetchall()]
 
 
+# -------------------------
+# Face templates
+# -------------------------
+
+
+def replace_face_templates(
+    db: sqlite3.Connection, *, euid: str, encodings: list[bytes], dim: int, model: str
+) -> None:
+    """
+    Replaces a student's stored templates (float32 BLOBs, enrollment template first).
+    An empty list just clears them. Does not commit, so it joins the caller's transaction.
+    """
+    created_at = _now_iso_utc()
+    db.execute("DELETE FROM tbl_face_templates WHERE fld_ft_euid_fk = ?", (euid,))
+    db.executemany(
+        """
+        INSERT INTO tbl_face_templates (
+          fld_ft_euid_fk, fld_ft_slot, fld_ft_encoding, fld_ft_dim, fld_ft_model, fld_ft_created_at
+        )
+        VALUES (?, ?, ?, ?, ?, ?)
+        """,
+        [
+            (euid, slot, sqlite3.Binary(blob), dim, model, created_at)
+            for slot, blob in enumerate(encodings)
+        ],
+    )
+
+
+def get_student_euids(db: sqlite3.Connection) -> set[str]:
+    cur = db.execute("SELECT fld_us_euid AS euid FROM tbl_users WHERE fld_us_role = 'student'")
+    return {row["euid"] for row in cur.fetchall()}
+
+
+def get_euids_with_face_templates(db: sqlite3.Connection, *, model: str) -> set[str]:
+    cur = db.execute(
+        "SELECT DISTINCT fld_ft_euid_fk AS euid FROM tbl_face_templates WHERE fld_ft_model = ?",
+        (model,),
+    )
+    return {row["euid"] for row in cur.fetchall()}
+
+
+def get_student_face_templates(
+    db: sqlite3.Connection, *, euid: str, model: str
+) -> list[bytes] | None:
+    """
+    Student lookup and reference templates in one query.
+    Returns None if euid is not a student, otherwise their template BLOBs for model in
+    slot order (empty if none are stored).
+    """
+    cur = db.execute(
+        """
+        SELECT u.fld_us_role AS role, t.fld_ft_encoding AS encoding
+        FROM tbl_users u
+        LEFT JOIN tbl_face_templates t
+          ON t.fld_ft_euid_fk = u.fld_us_euid AND t.fld_ft_model = ?
+        WHERE u.fld_us_euid = ?
+        ORDER BY t.fld_ft_slot ASC
+        """,
+        (model, euid),
+    )
+    rows = cur.fetchall()
+    if not rows or rows[0]["role"] != "student":
+        return None
+    return [bytes(row["encoding"]) for row in rows if row["encoding"] is not None]
+
+
 # -------------------------
 # Class creation
 # -------------------------
@@ -340,6 +478,92 @@ def get_session_for_date(db: sqlite3.Connection, *, code: str, on_date: str) ->
     )
 
 
+def get_attendance_precheck(
+    db: sqlite3.Connection, *, code: str, student_euid: str, on_date: str, model: str
+) -> AttendancePrecheck | None:
+    """
+    Everything a student check-in needs before any photo work, in one indexed query: class
+    location, enrollment, the session on on_date (YYYY-MM-DD) with its start as an epoch,
+    whether the student is already marked present in it, and the student's reference
+    templates for model.
+    Returns None if the class does not exist.
+    """
+    cur = db.execute(
+        """
+        SELECT
+            c.fld_ci_lat AS lat,
+            c.fld_ci_lon AS lon,
+            st.fld_st_euid IS NOT NULL AS enrolled,
+            se.fld_se_id_pk AS session_id,
+            CAST(strftime('%s', se.fld_se_date || ' ' || se.fld_se_time, 'utc') AS INTEGER)
+                AS session_start,
+            COALESCE(a.fld_at_attended, 0) AS attended,
+            t.fld_ft_encoding AS encoding
+        FROM tbl_class_info c
+        LEFT JOIN tbl_students st
+          ON st.fld_st_code_fk = c.fld_ci_code_pk AND st.fld_st_euid = ?
+        LEFT JOIN tbl_sessions se
+          ON se.fld_se_id_pk = (
+            SELECT fld_se_id_pk
+            FROM tbl_sessions
+            WHERE fld_se_code_fk = c.fld_ci_code_pk AND fld_se_date = ?
+            ORDER BY fld_se_id_pk
+            LIMIT 1
+          )
+        LEFT JOIN tbl_attendance a
+          ON a.fld_at_id_fk = se.fld_se_id_pk AND a.fld_at_euid_fk = st.fld_st_euid
+        LEFT JOIN tbl_face_templates t
+          ON t.fld_ft_euid_fk = st.fld_st_euid AND t.fld_ft_model = ?
+        WHERE c.fld_ci_code_pk = ?
+        ORDER BY t.fld_ft_slot ASC
+        """,
+        (student_euid, on_date, model, code),
+    )
+    rows = cur.fetchall()
+    if not rows:
+        return None
+    first = rows[0]
+    return AttendancePrecheck(
+        lat=float(first["lat"]),
+        lon=float(first["lon"]),
+        enrolled=bool(first["enrolled"]),
+        session_id=first["session_id"],
+        session_start=first["session_start"],
+        attended=bool(first["attended"]),
+        templates=[bytes(row["encoding"]) for row in rows if row["encoding"] is not None],
+    )
+
+
+def get_session_check_in(
+    db: sqlite3.Connection, *, session_id: int, student_euid: str, model: str
+) -> tuple[bool, list[bytes]]:
+    """
+    For a check-in whose session is already known (a preflight ticket), in one query:
+    whether the student is already marked present in it, and their reference templates for
+    model in slot order.
+    """
+    cur = db.execute(
+        """
+        SELECT
+            EXISTS (
+                SELECT 1 FROM tbl_attendance
+                WHERE fld_at_id_fk = ? AND fld_at_euid_fk = ? AND fld_at_attended = 1
+            ) AS attended,
+            t.fld_ft_encoding AS encoding
+        FROM (SELECT 1)
+        LEFT JOIN tbl_face_templates t
+          ON t.fld_ft_euid_fk = ? AND t.fld_ft_model = ?
+        ORDER BY t.fld_ft_slot ASC
+        """,
+        (session_id, student_euid, student_euid, model),
+    )
+    rows = cur.fetchall()
+    return (
+        bool(rows[0]["attended"]),
+        [bytes(row["encoding"]) for row in rows if row["encoding"] is not None],
+    )
+
+
 def get_class_by_code(db: sqlite3.Connection, *, code: str) -> dict[str, Any] | None:
     """
     Returns class info as a dict:
@@ -392,6 +616,43 @@ def upsert_attendance(
     db.commit()
 
 
+def upsert_attendance_many(
+    db: sqlite3.Connection, *, session_id: int, student_euids: list[str], attended: int = 1
+) -> None:
+    """
+    Bulk upsert_attendance: one statement batch, one commit.
+    """
+    db.executemany(
+        """
+        INSERT INTO tbl_attendance (fld_at_id_fk, fld_at_euid_fk, fld_at_attended)
+        VALUES (?, ?, ?)
+        ON CONFLICT(fld_at_id_fk, fld_at_euid_fk)
+        DO UPDATE SET fld_at_attended = excluded.fld_at_attended
+        """,
+        [(session_id, euid, attended) for euid in student_euids],
+    )
+    db.commit()
+
+
+def upsert_attendance_rows(
+    db: sqlite3.Connection, *, rows: list[tuple[int, str]], attended: int = 1
+) -> None:
+    """
+    Bulk upsert_attendance across sessions: rows are (session_id, student_euid) pairs, written
+    in one statement batch and one commit.
+    """
+    db.executemany(
+        """
+        INSERT INTO tbl_attendance (fld_at_id_fk, fld_at_euid_fk, fld_at_attended)
+        VALUES (?, ?, ?)
+        ON CONFLICT(fld_at_id_fk, fld_at_euid_fk)
+        DO UPDATE SET fld_at_attended = excluded.fld_at_attended
+        """,
+        [(session_id, euid, attended) for session_id, euid in rows],
+    )
+    db.commit()
+
+
 # -------------------------
 # Student upcoming sessions
 # -------------------------
@@ -560,4 +821,67 @@ def get_professor_class_codes_paginated(
         """,
         (professor_euid, limit, offset),
     )
-    return [dict(row) for row in cur.fetchall()], total
\ No newline at end of file
+    return [dict(row) for row in cur.fetchall()], total
+
+
+# -------------------------
+# Idempotency keys
+# -------------------------
+
+
+def get_idempotency_record(
+    db: sqlite3.Connection, *, scope: str, key: str, now: int
+) -> dict[str, Any] | None:
+    """
+    Returns {euid, fingerprint, status, body, expires_at} of a stored response, or None if
+    there is none or it has expired.
+    """
+    cur = db.execute(
+        """
+        SELECT
+            fld_ik_euid AS euid,
+            fld_ik_fingerprint AS fingerprint,
+            fld_ik_status AS status,
+            fld_ik_body AS body,
+            fld_ik_expires_at AS expires_at
+        FROM tbl_idempotency_keys
+        WHERE fld_ik_scope = ? AND fld_ik_key = ? AND fld_ik_expires_at > ?
+        """,
+        (scope, key, now),
+    )
+    row = cur.fetchone()
+    return dict(row) if row else None
+
+
+def put_idempotency_record(
+    db: sqlite3.Connection,
+    *,
+    scope: str,
+    key: str,
+    euid: str,
+    fingerprint: str,
+    status: int,
+    body: str,
+    expires_at: int,
+) -> None:
+    """
+    Stores (or replaces an expired) response snapshot. Does not commit.
+    """
+    db.execute(
+        """
+        INSERT OR REPLACE INTO tbl_idempotency_keys (
+          fld_ik_scope, fld_ik_key, fld_ik_euid, fld_ik_fingerprint,
+          fld_ik_status, fld_ik_body, fld_ik_expires_at
+        )
+        VALUES (?, ?, ?, ?, ?, ?, ?)
+        """,
+        (scope, key, euid, fingerprint, status, body, expires_at),
+    )
+
+
+def delete_expired_idempotency_records(db: sqlite3.Connection, *, now: int) -> int:
+    """
+    Deletes expired response snapshots. Does not commit. Returns the number deleted.
+    """
+    cur = db.execute("DELETE FROM tbl_idempotency_keys WHERE fld_ik_expires_at <= ?", (now,))
+    return cur.rowcount
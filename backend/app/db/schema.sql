@@ -66,6 +66,32 @@ CREATE TABLE IF NOT EXISTS tbl_refresh_tokens (
     FOREIGN KEY (fld_rt_euid) REFERENCES tbl_users(fld_us_euid) ON DELETE CASCADE
 );
 
+-- Reference face templates (float32 encodings, little-endian) for each student.
+-- The enrollment template comes first; added captures follow in fld_ft_slot order.
+CREATE TABLE IF NOT EXISTS tbl_face_templates (
+    fld_ft_euid_fk TEXT NOT NULL,
+    fld_ft_slot INTEGER NOT NULL,         -- 0 = enrollment template
+    fld_ft_encoding BLOB NOT NULL,        -- fld_ft_dim float32 values
+    fld_ft_dim INTEGER NOT NULL,
+    fld_ft_model TEXT NOT NULL,           -- encoder that produced the vector
+    fld_ft_created_at TEXT NOT NULL,
+    PRIMARY KEY (fld_ft_euid_fk, fld_ft_slot),
+    FOREIGN KEY (fld_ft_euid_fk) REFERENCES tbl_users(fld_us_euid) ON DELETE CASCADE,
+    CONSTRAINT encoding_size CHECK(length(fld_ft_encoding) = 4 * fld_ft_dim)
+);
+
+-- Response snapshots of requests sent with an Idempotency-Key header, replayed to retries.
+CREATE TABLE IF NOT EXISTS tbl_idempotency_keys (
+    fld_ik_scope TEXT NOT NULL,           -- endpoint, e.g. "attendance"
+    fld_ik_key TEXT NOT NULL,             -- client-chosen Idempotency-Key
+    fld_ik_euid TEXT NOT NULL,            -- who sent it ("" for face login without an euid)
+    fld_ik_fingerprint TEXT NOT NULL,     -- sha256 of the request body
+    fld_ik_status INTEGER NOT NULL,       -- HTTP status of the stored response
+    fld_ik_body TEXT NOT NULL,            -- JSON response body
+    fld_ik_expires_at INTEGER NOT NULL,   -- epoch seconds
+    PRIMARY KEY (fld_ik_scope, fld_ik_key)
+);
+
 -- Helpful indexes for common queries
 CREATE INDEX IF NOT EXISTS idx_sessions_code_date
 ON tbl_sessions(fld_se_code_fk, fld_se_date);
@@ -77,4 +103,7 @@ CREATE INDEX IF NOT EXISTS idx_attendance_euid
 ON tbl_attendance(fld_at_euid_fk);
 
 CREATE INDEX IF NOT EXISTS idx_students_euid
-ON tbl_students(fld_st_euid);
\ No newline at end of file
+ON tbl_students(fld_st_euid);
+
+CREATE INDEX IF NOT EXISTS idx_idempotency_expires
+ON tbl_idempotency_keys(fld_ik_expires_at);
\ No newline at end of file
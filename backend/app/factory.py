@@ -1,6 +1,8 @@
 from __future__ import annotations
 
 import logging
+import multiprocessing
+from pathlib import Path
 
 from dotenv import load_dotenv
 from flask import Flask
@@ -9,6 +11,25 @@ from app.config import Config
 from app.db.connection import close_db
 from app.routes import bp as api_bp
 from app.openapi import register_openapi
+from app.services.face_index import configure_face_index
+from app.services.face_pool import FacePool, configure_face_pool
+from app.services.face_service import (
+    FACE_ENDPOINTS,
+    FacePipelineOptions,
+    apply_face_preset,
+    configure_encoding_storage,
+    configure_face_backend,
+    configure_face_pipeline,
+    configure_match_cache,
+    configure_reference_cache,
+    configure_reference_storage,
+    configure_reference_templates,
+    init_face_worker,
+    warm_up_face_backend,
+)
+from app.services.idempotency import configure_idempotency
+
+logger = logging.getLogger(__name__)
 
 
 def _configure_logging(level_name: str) -> None:
@@ -19,6 +40,19 @@ def _configure_logging(level_name: str) -> None:
     )
 
 
+def _warm_up_face(pool: FacePool, cfg: Config) -> None:
+    """
+    Pays model loading before the first request instead of on it. A failure is logged and
+    the app still starts; requests then just take the cold-start hit.
+    """
+    try:
+        warm_up_face_backend()
+    except Exception:
+        logger.warning("face warm-up failed", exc_info=True)
+    if not pool.prestart(timeout_seconds=cfg.face_warmup_timeout_seconds):
+        logger.warning("face workers not ready after %ss", cfg.face_warmup_timeout_seconds)
+
+
 def create_app() -> Flask:
     load_dotenv()
     cfg = Config()
@@ -26,6 +60,70 @@ def create_app() -> Flask:
 
     app = Flask(__name__)
     app.config["APP_CONFIG"] = cfg
+    configure_face_backend(cfg.face_backend)
+    configure_reference_cache(
+        max_entries=cfg.face_cache_max_entries,
+        max_bytes=cfg.face_cache_max_bytes,
+    )
+    configure_match_cache(
+        max_entries=cfg.face_match_cache_max_entries,
+        ttl_seconds=cfg.face_match_cache_ttl_seconds,
+    )
+    configure_encoding_storage(cfg.face_encoding_dtype)
+    configure_reference_templates(
+        max_templates=cfg.face_max_templates,
+        centroid=cfg.face_template_centroid,
+    )
+    configure_reference_storage(
+        crop_dim=cfg.face_reference_crop_dim,
+        archive_dir=(
+            Path(cfg.face_reference_archive_dir).resolve()
+            if cfg.face_reference_archive_dir
+            else None
+        ),
+    )
+    pipeline = FacePipelineOptions(
+        detect_max_dim=cfg.face_max_dim,
+        encode_max_dim=cfg.face_encode_max_dim,
+        decode_target_dim=cfg.face_decode_target_dim,
+    )
+    presets = {
+        "attendance": cfg.face_preset_attendance,
+        "face_login": cfg.face_preset_login,
+        "enrollment": cfg.face_preset_enrollment,
+    }
+    configure_face_pipeline(
+        pipeline,
+        endpoints={e: apply_face_preset(pipeline, presets[e]) for e in FACE_ENDPOINTS},
+        group=FacePipelineOptions(
+            detect_max_dim=cfg.face_group_max_dim,
+            encode_max_dim=cfg.face_group_max_dim,
+            decode_target_dim=cfg.face_group_max_dim,
+        ),
+    )
+    configure_face_index(
+        nprobe=cfg.face_index_nprobe,
+        min_train_size=cfg.face_index_min_train_size,
+        # the index has always kept float32; only go smaller
+        dtype="float32" if cfg.face_encoding_dtype == "float64" else cfg.face_encoding_dtype,
+    )
+    pool = configure_face_pool(
+        workers=cfg.face_workers,
+        max_queue=cfg.face_queue_size,
+        timeout_seconds=cfg.face_job_timeout_seconds,
+        retry_after_seconds=cfg.face_retry_after_seconds,
+        initializer=init_face_worker,
+        initargs=(cfg.face_backend, cfg.face_warmup),
+    )
+    # A face worker that imports the app (e.g. via the main module) must not spawn workers
+    # of its own; its initializer already warms its backend up
+    if cfg.face_warmup and multiprocessing.parent_process() is None:
+        _warm_up_face(pool, cfg)
+    configure_idempotency(
+        ttl_seconds=cfg.idempotency_ttl_seconds,
+        max_entries=cfg.idempotency_cache_max_entries,
+        wait_seconds=cfg.idempotency_wait_seconds,
+    )
     app.register_blueprint(api_bp)
     register_openapi(app)
 
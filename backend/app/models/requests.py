@@ -1,5 +1,6 @@
 from __future__ import annotations
 
+from datetime import datetime
 from typing import Literal
 
 from pydantic import BaseModel, Field, field_validator, model_validator
@@ -9,7 +10,9 @@ from app.models.validation import (
     validate_base64_image,
     validate_class_code,
     validate_date_yyyymmdd,
+    validate_device_id,
     validate_euid,
+    validate_face_box,
     validate_join_code,
     validate_location,
     validate_time_hhmmss,
@@ -103,6 +106,8 @@ class AddAttendanceRequest(BaseModel):
     euid: str
     location: tuple[float, float]
     photo: str
+    face_box: tuple[float, float, float, float] | None = None  # client-framed face (fractions)
+    ticket: str | None = None  # from POST /attendance/preflight
 
     @field_validator("code")
     @classmethod
@@ -124,6 +129,106 @@ class AddAttendanceRequest(BaseModel):
     def _photo(cls, v: str) -> str:
         return validate_base64_image(v)
 
+    @field_validator("face_box", mode="before")
+    @classmethod
+    def _face_box(cls, v):
+        return None if v is None else validate_face_box(v)
+
+
+class AttendancePreflightRequest(BaseModel):
+    code: str
+    euid: str
+    location: tuple[float, float]
+
+    @field_validator("code")
+    @classmethod
+    def _code(cls, v: str) -> str:
+        return validate_class_code(v)
+
+    @field_validator("euid")
+    @classmethod
+    def _euid(cls, v: str) -> str:
+        return validate_euid(v)
+
+    @field_validator("location", mode="before")
+    @classmethod
+    def _location(cls, v):
+        return validate_location(v)
+
+
+class AttendanceBatchItem(BaseModel):
+    code: str
+    location: tuple[float, float]
+    photo: str
+    captured_at: datetime = Field(..., description="ISO 8601 or epoch seconds; naive = server time")
+    face_box: tuple[float, float, float, float] | None = None
+
+    @field_validator("code")
+    @classmethod
+    def _code(cls, v: str) -> str:
+        return validate_class_code(v)
+
+    @field_validator("location", mode="before")
+    @classmethod
+    def _location(cls, v):
+        return validate_location(v)
+
+    @field_validator("photo")
+    @classmethod
+    def _photo(cls, v: str) -> str:
+        return validate_base64_image(v)
+
+    @field_validator("face_box", mode="before")
+    @classmethod
+    def _face_box(cls, v):
+        return None if v is None else validate_face_box(v)
+
+
+class AttendanceBatchRequest(BaseModel):
+    """
+    Check-ins queued offline, in capture order. The item limit is
+    ATTENDANCE_BATCH_MAX_ITEMS (checked in the route).
+    """
+
+    euid: str
+    items: list[AttendanceBatchItem] = Field(..., min_length=1)
+
+    @field_validator("euid")
+    @classmethod
+    def _euid(cls, v: str) -> str:
+        return validate_euid(v)
+
+
+class GroupPhotoAttendanceRequest(BaseModel):
+    code: str
+    photo: str
+
+    @field_validator("code")
+    @classmethod
+    def _code(cls, v: str) -> str:
+        return validate_class_code(v)
+
+    @field_validator("photo")
+    @classmethod
+    def _photo(cls, v: str) -> str:
+        # Wide classroom shots run larger than selfies
+        return validate_base64_image(v, max_bytes=12_000_000)
+
+
+class KioskIdentifyRequest(BaseModel):
+    code: str
+    photo: str
+
+    @field_validator("code")
+    @classmethod
+    def _code(cls, v: str) -> str:
+        return validate_class_code(v)
+
+    @field_validator("photo")
+    @classmethod
+    def _photo(cls, v: str) -> str:
+        return validate_base64_image(v)
+
 
 class GetStudentAttendanceRequest(BaseModel):
     euid: str
@@ -237,16 +342,43 @@ class StudentEnrollRequest(BaseModel):
         return validate_base64_image(v)
 
 
+class AddFaceTemplateRequest(BaseModel):
+    photo: str
+    face_box: tuple[float, float, float, float] | None = None  # client-framed face (fractions)
+
+    @field_validator("photo")
+    @classmethod
+    def _photo(cls, v: str) -> str:
+        return validate_base64_image(v)
+
+    @field_validator("face_box", mode="before")
+    @classmethod
+    def _face_box(cls, v):
+        return None if v is None else validate_face_box(v)
+
+
 class FaceLoginRequest(BaseModel):
-    euid: str
+    euid: str | None = None  # omitted: identify the student among everyone enrolled
     photo: str
+    face_box: tuple[float, float, float, float] | None = None  # client-framed face (fractions)
+    device_id: str | None = None  # identify mode: rate limited per device, not per address
 
     @field_validator("euid")
     @classmethod
-    def _euid(cls, v: str) -> str:
-        return validate_euid(v)
+    def _euid(cls, v: str | None) -> str | None:
+        return None if v is None else validate_euid(v)
+
+    @field_validator("device_id")
+    @classmethod
+    def _device_id(cls, v: str | None) -> str | None:
+        return None if v is None else validate_device_id(v)
 
     @field_validator("photo")
     @classmethod
     def _photo(cls, v: str) -> str:
-        return validate_base64_image(v)
\ No newline at end of file
+        return validate_base64_image(v)
+
+    @field_validator("face_box", mode="before")
+    @classmethod
+    def _face_box(cls, v):
+        return None if v is None else validate_face_box(v)
\ No newline at end of file
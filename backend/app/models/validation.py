@@ -8,6 +8,7 @@ from typing import Any
 EUID_RE = re.compile(r"^[a-z]{3}\d{4}$")  # gdb2356
 CLASS_CODE_RE = re.compile(r"^[a-z]{4}_\d{4}_\d{3}$")  # csce_4900_500
 JOIN_CODE_RE = re.compile(r"^[A-Z0-9]{6,12}$")  # e.g. 8 chars, uppercase letters+digits
+DEVICE_ID_RE = re.compile(r"^[A-Za-z0-9._:-]{1,64}$")  # app install id, kiosk name, ...
 
 WEEKDAYS = {"Monday", "Tuesday", "Wednesday", "Thursday", "Friday", "Saturday", "Sunday"}
 
@@ -21,6 +22,12 @@ def validate_euid(euid: str) -> str:
     return euid
 
 
+def validate_device_id(device_id: str) -> str:
+    if not DEVICE_ID_RE.fullmatch(device_id):
+        raise ValueError("device_id must be 1-64 letters, digits or ._:-")
+    return device_id
+
+
 def validate_class_code(code: str) -> str:
     code = code.strip()
     if code != code.lower():
@@ -42,6 +49,27 @@ def validate_location(location: Any) -> tuple[float, float]:
     return (lat, lon)
 
 
+def validate_face_box(box: Any) -> tuple[float, float, float, float]:
+    """
+    Client-supplied face box: [top, right, bottom, left] as fractions (0..1) of the upright
+    image's height/width, so it survives server-side downscaling.
+    """
+    if not isinstance(box, (list, tuple)) or len(box) != 4:
+        raise ValueError("face_box must be a 4-item list: [top, right, bottom, left]")
+    try:
+        top, right, bottom, left = (float(v) for v in box)
+    except (TypeError, ValueError) as e:
+        # TypeError (null, objects) would escape pydantic as a 500
+        raise ValueError("face_box values must be numbers") from e
+    if not all(0.0 <= v <= 1.0 for v in (top, right, bottom, left)):
+        raise ValueError("face_box values must be fractions between 0 and 1")
+    if not (top < bottom and left < right):
+        raise ValueError("face_box must satisfy top < bottom and left < right")
+    if (bottom - top) < 0.02 or (right - left) < 0.02:
+        raise ValueError("face_box is too small")
+    return (top, right, bottom, left)
+
+
 def validate_time_hhmmss(t: str) -> str:
     t = t.strip()
     if not re.fullmatch(r"\d{2}:\d{2}:\d{2}", t):
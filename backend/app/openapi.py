@@ -127,10 +127,55 @@ def _openapi_spec() -> dict[str, Any]:
                 "FaceLoginRequest": {
                     "type": "object",
                     "properties": {
-                        "euid": {"type": "string", "example": "stu1234"},
+                        "euid": {
+                            "type": "string",
+                            "example": "stu1234",
+                            "description": "Omit to identify the student among everyone enrolled",
+                        },
                         "photo": {"type": "string", "description": "Base64-encoded image"},
+                        "face_box": {
+                            "type": "array",
+                            "items": {"type": "number", "minimum": 0, "maximum": 1},
+                            "minItems": 4,
+                            "maxItems": 4,
+                            "example": [0.2, 0.7, 0.65, 0.3],
+                            "description": "Optional client-framed face: [top, right, bottom, left] as fractions of the upright image",
+                        },
+                        "device_id": {
+                            "type": "string",
+                            "maxLength": 64,
+                            "example": "kiosk-library-2",
+                            "description": "Optional; identify-mode attempts are also rate limited per device",
+                        },
                     },
-                    "required": ["euid", "photo"],
+                    "required": ["photo"],
+                },
+                "AddFaceTemplateRequest": {
+                    "type": "object",
+                    "properties": {
+                        "photo": {"type": "string", "description": "Base64-encoded image"},
+                        "face_box": {
+                            "type": "array",
+                            "items": {"type": "number", "minimum": 0, "maximum": 1},
+                            "minItems": 4,
+                            "maxItems": 4,
+                            "description": "Optional client-framed face: [top, right, bottom, left] as fractions of the upright image",
+                        },
+                    },
+                    "required": ["photo"],
+                },
+                "AddFaceTemplateResponse": {
+                    "type": "object",
+                    "properties": {
+                        "status": {"type": "string", "example": "success"},
+                        "templates": {
+                            "type": "integer",
+                            "example": 2,
+                            "description": "Templates stored for the student",
+                        },
+                        "request_id": {"type": "string"},
+                    },
+                    "required": ["status", "templates"],
                 },
                 "AddAttendanceRequest": {
                     "type": "object",
@@ -145,9 +190,138 @@ def _openapi_spec() -> dict[str, Any]:
                             "example": [33.214, -97.133],
                         },
                         "photo": {"type": "string", "description": "Base64-encoded image"},
+                        "face_box": {
+                            "type": "array",
+                            "items": {"type": "number", "minimum": 0, "maximum": 1},
+                            "minItems": 4,
+                            "maxItems": 4,
+                            "example": [0.2, 0.7, 0.65, 0.3],
+                            "description": "Optional client-framed face: [top, right, bottom, left] as fractions of the upright image",
+                        },
+                        "ticket": {
+                            "type": "string",
+                            "description": "Optional ticket from POST /attendance/preflight; skips the class/enrollment/session lookups",
+                        },
                     },
                     "required": ["code", "euid", "location", "photo"],
                 },
+                "AttendancePreflightRequest": {
+                    "type": "object",
+                    "properties": {
+                        "code": {"type": "string", "example": "csce_4900_500"},
+                        "euid": {"type": "string", "example": "stu1234"},
+                        "location": {
+                            "type": "array",
+                            "items": {"type": "number"},
+                            "minItems": 2,
+                            "maxItems": 2,
+                            "example": [33.214, -97.133],
+                        },
+                    },
+                    "required": ["code", "euid", "location"],
+                },
+                "AttendancePreflightResponse": {
+                    "type": "object",
+                    "properties": {
+                        "status": {"type": "string", "example": "success"},
+                        "ticket": {
+                            "type": "string",
+                            "description": "Signed, short-lived; pass to POST /attendance",
+                        },
+                        "expires_in": {
+                            "type": "integer",
+                            "description": "Ticket lifetime in seconds",
+                        },
+                        "already_recorded": {
+                            "type": "boolean",
+                            "description": "Already present in this session; no ticket is issued",
+                        },
+                        "request_id": {"type": "string"},
+                    },
+                    "required": ["status"],
+                },
+                "AttendanceBatchRequest": {
+                    "type": "object",
+                    "properties": {
+                        "euid": {"type": "string", "example": "stu1234"},
+                        "items": {
+                            "type": "array",
+                            "minItems": 1,
+                            "description": "Queued check-ins; at most ATTENDANCE_BATCH_MAX_ITEMS",
+                            "items": {
+                                "type": "object",
+                                "properties": {
+                                    "code": {"type": "string", "example": "csce_4900_500"},
+                                    "location": {"type": "array", "items": {"type": "number"}, "minItems": 2, "maxItems": 2, "example": [33.214, -97.133]},
+                                    "photo": {"type": "string", "description": "Base64-encoded image"},
+                                    "captured_at": {"type": "string", "format": "date-time", "description": "When the photo was taken (ISO 8601 or epoch seconds)"},
+                                    "face_box": {"type": "array", "items": {"type": "number"}, "minItems": 4, "maxItems": 4, "description": "Optional client-framed face (fractions)"},
+                                },
+                                "required": ["code", "location", "photo", "captured_at"],
+                            },
+                        },
+                    },
+                    "required": ["euid", "items"],
+                },
+                "AttendanceBatchResponse": {
+                    "type": "object",
+                    "properties": {
+                        "status": {"type": "string", "example": "success"},
+                        "recorded": {"type": "integer", "description": "Check-ins newly recorded by this request"},
+                        "results": {
+                            "type": "array",
+                            "description": "One per item, in request order",
+                            "items": {
+                                "type": "object",
+                                "properties": {
+                                    "index": {"type": "integer"},
+                                    "code": {"type": "string"},
+                                    "status": {"type": "string", "example": "success"},
+                                    "error": {"type": "string", "example": "Outside time range"},
+                                    "already_recorded": {"type": "boolean"},
+                                },
+                                "required": ["index", "code", "status"],
+                            },
+                        },
+                        "request_id": {"type": "string"},
+                    },
+                    "required": ["status", "recorded", "results"],
+                },
+                "KioskIdentifyRequest": {
+                    "type": "object",
+                    "properties": {
+                        "photo": {"type": "string", "description": "Base64-encoded image"},
+                    },
+                    "required": ["photo"],
+                },
+                "GroupPhotoAttendanceRequest": {
+                    "type": "object",
+                    "properties": {
+                        "photo": {"type": "string", "description": "Base64-encoded classroom photo (max 12 MB)"},
+                    },
+                    "required": ["photo"],
+                },
+                "GroupPhotoAttendanceResponse": {
+                    "type": "object",
+                    "properties": {
+                        "status": {"type": "string", "example": "success"},
+                        "present": {"type": "array", "items": {"type": "string"}, "example": ["stu1234", "stu5678"]},
+                        "faces_detected": {"type": "integer", "example": 3},
+                        "unmatched_faces": {"type": "integer", "example": 1},
+                        "request_id": {"type": "string"},
+                    },
+                    "required": ["status", "present", "faces_detected", "unmatched_faces"],
+                },
+                "KioskIdentifyResponse": {
+                    "type": "object",
+                    "properties": {
+                        "status": {"type": "string", "example": "success"},
+                        "euid": {"type": "string", "example": "stu1234"},
+                        "distance": {"type": "number", "example": 0.41},
+                        "request_id": {"type": "string"},
+                    },
+                    "required": ["status", "euid"],
+                },
                 "SuccessResponse": {
                     "type": "object",
                     "properties": {
@@ -156,6 +330,18 @@ def _openapi_spec() -> dict[str, Any]:
                     },
                     "required": ["status"],
                 },
+                "AttendanceResponse": {
+                    "type": "object",
+                    "properties": {
+                        "status": {"type": "string", "example": "success"},
+                        "request_id": {"type": "string"},
+                        "already_recorded": {
+                            "type": "boolean",
+                            "description": "Already present in this session; the photo was not checked",
+                        },
+                    },
+                    "required": ["status"],
+                },
                 "StudentAttendanceResponse": {
                     "type": "object",
                     "properties": {
@@ -262,6 +448,9 @@ def _openapi_spec() -> dict[str, Any]:
                 "post": {
                     "tags": ["Auth"],
                     "summary": "Student face login (no password); returns tokens",
+                    "parameters": [
+                        {"name": "Idempotency-Key", "in": "header", "required": False, "schema": {"type": "string", "maxLength": 255}, "description": "Retries with the same key get the first response back (header Idempotent-Replayed: true)"}
+                    ],
                     "requestBody": {
                         "required": True,
                         "content": {"application/json": {"schema": {"$ref": "#/components/schemas/FaceLoginRequest"}}},
@@ -270,6 +459,10 @@ def _openapi_spec() -> dict[str, Any]:
                         "200": {"description": "Tokens issued", "content": {"application/json": {"schema": {"$ref": "#/components/schemas/LoginResponse"}}}},
                         "400": {"description": "Validation error", "content": {"application/json": {"schema": {"$ref": "#/components/schemas/ErrorResponse"}}}},
                         "401": {"description": "Face login failed", "content": {"application/json": {"schema": {"$ref": "#/components/schemas/ErrorResponse"}}}},
+                        "409": {"description": "A request with this Idempotency-Key is still in progress", "content": {"application/json": {"schema": {"$ref": "#/components/schemas/ErrorResponse"}}}},
+                        "422": {"description": "Idempotency-Key already used for a different request", "content": {"application/json": {"schema": {"$ref": "#/components/schemas/ErrorResponse"}}}},
+                        "429": {"description": "Face workers busy (see Retry-After)", "content": {"application/json": {"schema": {"$ref": "#/components/schemas/ErrorResponse"}}}},
+                        "503": {"description": "Face verification timed out (see Retry-After)", "content": {"application/json": {"schema": {"$ref": "#/components/schemas/ErrorResponse"}}}},
                     },
                 }
             },
@@ -323,23 +516,191 @@ def _openapi_spec() -> dict[str, Any]:
                     },
                 }
             },
+            "/classes/{code}/roster/photos": {
+                "post": {
+                    "tags": ["Classes"],
+                    "summary": "Bulk-enroll a roster from a zip of <euid>.jpg photos (professor only, must own class)",
+                    "security": [{"bearerAuth": []}],
+                    "parameters": [
+                        {"name": "code", "in": "path", "required": True, "schema": {"type": "string"}}
+                    ],
+                    "requestBody": {
+                        "required": True,
+                        "content": {
+                            "multipart/form-data": {
+                                "schema": {
+                                    "type": "object",
+                                    "properties": {"archive": {"type": "string", "format": "binary"}},
+                                    "required": ["archive"],
+                                }
+                            }
+                        },
+                    },
+                    "responses": {
+                        "200": {
+                            "description": "Per-student report",
+                            "content": {
+                                "application/json": {
+                                    "schema": {
+                                        "type": "object",
+                                        "properties": {
+                                            "status": {"type": "string", "example": "success"},
+                                            "enrolled": {"type": "integer", "example": 41},
+                                            "failed": {"type": "integer", "example": 1},
+                                            "students": {
+                                                "type": "array",
+                                                "items": {
+                                                    "type": "object",
+                                                    "properties": {
+                                                        "file": {"type": "string", "example": "abc1234.jpg"},
+                                                        "euid": {"type": "string", "nullable": True, "example": "abc1234"},
+                                                        "status": {"type": "string", "enum": ["enrolled", "error"]},
+                                                        "error": {"type": "string", "nullable": True, "example": None},
+                                                        "created": {"type": "boolean", "example": True},
+                                                    },
+                                                },
+                                            },
+                                            "request_id": {"type": "string"},
+                                        },
+                                    }
+                                }
+                            },
+                        },
+                        "400": {"description": "Missing or invalid archive", "content": {"application/json": {"schema": {"$ref": "#/components/schemas/ErrorResponse"}}}},
+                        "401": {"description": "Missing/invalid token", "content": {"application/json": {"schema": {"$ref": "#/components/schemas/ErrorResponse"}}}},
+                        "403": {"description": "Forbidden", "content": {"application/json": {"schema": {"$ref": "#/components/schemas/ErrorResponse"}}}},
+                        "413": {"description": "Archive too large", "content": {"application/json": {"schema": {"$ref": "#/components/schemas/ErrorResponse"}}}},
+                        "429": {"description": "Face workers busy (see Retry-After)", "content": {"application/json": {"schema": {"$ref": "#/components/schemas/ErrorResponse"}}}},
+                    },
+                }
+            },
             "/attendance": {
                 "post": {
                     "tags": ["Attendance"],
                     "summary": "Submit attendance (student only, self only)",
+                    "parameters": [
+                        {"name": "Idempotency-Key", "in": "header", "required": False, "schema": {"type": "string", "maxLength": 255}, "description": "Retries with the same key get the first response back (header Idempotent-Replayed: true)"}
+                    ],
                     "security": [{"bearerAuth": []}],
                     "requestBody": {
                         "required": True,
                         "content": {"application/json": {"schema": {"$ref": "#/components/schemas/AddAttendanceRequest"}}},
                     },
                     "responses": {
-                        "200": {"description": "Accepted", "content": {"application/json": {"schema": {"$ref": "#/components/schemas/SuccessResponse"}}}},
+                        "200": {"description": "Accepted", "content": {"application/json": {"schema": {"$ref": "#/components/schemas/AttendanceResponse"}}}},
+                        "400": {"description": "Rejected/validation error", "content": {"application/json": {"schema": {"$ref": "#/components/schemas/ErrorResponse"}}}},
+                        "401": {"description": "Missing/invalid token", "content": {"application/json": {"schema": {"$ref": "#/components/schemas/ErrorResponse"}}}},
+                        "403": {"description": "Forbidden", "content": {"application/json": {"schema": {"$ref": "#/components/schemas/ErrorResponse"}}}},
+                        "409": {"description": "A request with this Idempotency-Key is still in progress", "content": {"application/json": {"schema": {"$ref": "#/components/schemas/ErrorResponse"}}}},
+                        "422": {"description": "Idempotency-Key already used for a different request", "content": {"application/json": {"schema": {"$ref": "#/components/schemas/ErrorResponse"}}}},
+                        "429": {"description": "Face workers busy (see Retry-After)", "content": {"application/json": {"schema": {"$ref": "#/components/schemas/ErrorResponse"}}}},
+                        "503": {"description": "Face verification timed out (see Retry-After)", "content": {"application/json": {"schema": {"$ref": "#/components/schemas/ErrorResponse"}}}},
+                    },
+                }
+            },
+            "/attendance/preflight": {
+                "post": {
+                    "tags": ["Attendance"],
+                    "summary": "Check enrollment, session, time window and distance before uploading a photo (student only, self only)",
+                    "security": [{"bearerAuth": []}],
+                    "requestBody": {
+                        "required": True,
+                        "content": {"application/json": {"schema": {"$ref": "#/components/schemas/AttendancePreflightRequest"}}},
+                    },
+                    "responses": {
+                        "200": {"description": "Check-in would pass these checks; ticket issued", "content": {"application/json": {"schema": {"$ref": "#/components/schemas/AttendancePreflightResponse"}}}},
                         "400": {"description": "Rejected/validation error", "content": {"application/json": {"schema": {"$ref": "#/components/schemas/ErrorResponse"}}}},
                         "401": {"description": "Missing/invalid token", "content": {"application/json": {"schema": {"$ref": "#/components/schemas/ErrorResponse"}}}},
                         "403": {"description": "Forbidden", "content": {"application/json": {"schema": {"$ref": "#/components/schemas/ErrorResponse"}}}},
                     },
                 }
             },
+            "/attendance/batch": {
+                "post": {
+                    "tags": ["Attendance"],
+                    "summary": "Sync check-ins queued offline, each checked as of its capture time (student only, self only)",
+                    "parameters": [
+                        {"name": "Idempotency-Key", "in": "header", "required": False, "schema": {"type": "string", "maxLength": 255}, "description": "Retries with the same key get the first response back (header Idempotent-Replayed: true)"}
+                    ],
+                    "security": [{"bearerAuth": []}],
+                    "requestBody": {
+                        "required": True,
+                        "content": {"application/json": {"schema": {"$ref": "#/components/schemas/AttendanceBatchRequest"}}},
+                    },
+                    "responses": {
+                        "200": {"description": "Processed; see the per-item results", "content": {"application/json": {"schema": {"$ref": "#/components/schemas/AttendanceBatchResponse"}}}},
+                        "400": {"description": "Validation error/too many items", "content": {"application/json": {"schema": {"$ref": "#/components/schemas/ErrorResponse"}}}},
+                        "401": {"description": "Missing/invalid token", "content": {"application/json": {"schema": {"$ref": "#/components/schemas/ErrorResponse"}}}},
+                        "403": {"description": "Forbidden", "content": {"application/json": {"schema": {"$ref": "#/components/schemas/ErrorResponse"}}}},
+                        "409": {"description": "A request with this Idempotency-Key is still in progress", "content": {"application/json": {"schema": {"$ref": "#/components/schemas/ErrorResponse"}}}},
+                        "422": {"description": "Idempotency-Key already used for a different request", "content": {"application/json": {"schema": {"$ref": "#/components/schemas/ErrorResponse"}}}},
+                        "429": {"description": "Face workers busy (see Retry-After)", "content": {"application/json": {"schema": {"$ref": "#/components/schemas/ErrorResponse"}}}},
+                        "503": {"description": "Face verification timed out (see Retry-After)", "content": {"application/json": {"schema": {"$ref": "#/components/schemas/ErrorResponse"}}}},
+                    },
+                }
+            },
+            "/classes/{code}/kiosk/identify": {
+                "post": {
+                    "tags": ["Attendance"],
+                    "summary": "Kiosk check-in: identify a student among the class roster (professor only, must own class)",
+                    "security": [{"bearerAuth": []}],
+                    "parameters": [
+                        {"name": "code", "in": "path", "required": True, "schema": {"type": "string"}}
+                    ],
+                    "requestBody": {
+                        "required": True,
+                        "content": {"application/json": {"schema": {"$ref": "#/components/schemas/KioskIdentifyRequest"}}},
+                    },
+                    "responses": {
+                        "200": {"description": "Identified and recorded", "content": {"application/json": {"schema": {"$ref": "#/components/schemas/KioskIdentifyResponse"}}}},
+                        "400": {"description": "Rejected/no match/validation error", "content": {"application/json": {"schema": {"$ref": "#/components/schemas/ErrorResponse"}}}},
+                        "401": {"description": "Missing/invalid token", "content": {"application/json": {"schema": {"$ref": "#/components/schemas/ErrorResponse"}}}},
+                        "403": {"description": "Forbidden", "content": {"application/json": {"schema": {"$ref": "#/components/schemas/ErrorResponse"}}}},
+                        "429": {"description": "Face workers busy (see Retry-After)", "content": {"application/json": {"schema": {"$ref": "#/components/schemas/ErrorResponse"}}}},
+                    },
+                }
+            },
+            "/classes/{code}/attendance/group-photo": {
+                "post": {
+                    "tags": ["Attendance"],
+                    "summary": "Take attendance from one classroom photo (professor only, must own class)",
+                    "security": [{"bearerAuth": []}],
+                    "parameters": [
+                        {"name": "code", "in": "path", "required": True, "schema": {"type": "string"}}
+                    ],
+                    "requestBody": {
+                        "required": True,
+                        "content": {"application/json": {"schema": {"$ref": "#/components/schemas/GroupPhotoAttendanceRequest"}}},
+                    },
+                    "responses": {
+                        "200": {"description": "Recognized students recorded as present", "content": {"application/json": {"schema": {"$ref": "#/components/schemas/GroupPhotoAttendanceResponse"}}}},
+                        "400": {"description": "Rejected/no faces/validation error", "content": {"application/json": {"schema": {"$ref": "#/components/schemas/ErrorResponse"}}}},
+                        "401": {"description": "Missing/invalid token", "content": {"application/json": {"schema": {"$ref": "#/components/schemas/ErrorResponse"}}}},
+                        "403": {"description": "Forbidden", "content": {"application/json": {"schema": {"$ref": "#/components/schemas/ErrorResponse"}}}},
+                        "429": {"description": "Face workers busy (see Retry-After)", "content": {"application/json": {"schema": {"$ref": "#/components/schemas/ErrorResponse"}}}},
+                    },
+                }
+            },
+            "/students/me/face-templates": {
+                "post": {
+                    "tags": ["Auth"],
+                    "summary": "Add another reference capture for the authenticated student (must match the existing ones)",
+                    "security": [{"bearerAuth": []}],
+                    "requestBody": {
+                        "required": True,
+                        "content": {"application/json": {"schema": {"$ref": "#/components/schemas/AddFaceTemplateRequest"}}},
+                    },
+                    "responses": {
+                        "201": {"description": "Template added", "content": {"application/json": {"schema": {"$ref": "#/components/schemas/AddFaceTemplateResponse"}}}},
+                        "400": {"description": "Validation error / face does not match", "content": {"application/json": {"schema": {"$ref": "#/components/schemas/ErrorResponse"}}}},
+                        "401": {"description": "Missing/invalid token", "content": {"application/json": {"schema": {"$ref": "#/components/schemas/ErrorResponse"}}}},
+                        "403": {"description": "Forbidden", "content": {"application/json": {"schema": {"$ref": "#/components/schemas/ErrorResponse"}}}},
+                        "404": {"description": "Student has no reference image", "content": {"application/json": {"schema": {"$ref": "#/components/schemas/ErrorResponse"}}}},
+                        "429": {"description": "Face workers busy (see Retry-After)", "content": {"application/json": {"schema": {"$ref": "#/components/schemas/ErrorResponse"}}}},
+                        "503": {"description": "Face verification timed out (see Retry-After)", "content": {"application/json": {"schema": {"$ref": "#/components/schemas/ErrorResponse"}}}},
+                    },
+                }
+            },
             "/students/{euid}/attendance": {
                 "get": {
                     "tags": ["Attendance"],
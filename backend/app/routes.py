@@ -3,9 +3,11 @@ from __future__ import annotations
 import logging
 import json
 import uuid
+import zipfile
 
 from datetime import datetime, timezone, timedelta
 from flask import Blueprint, current_app, g, jsonify, request
+from werkzeug.exceptions import RequestEntityTooLarge
 from pydantic import ValidationError
 
 from app.config import Config
@@ -13,7 +15,10 @@ from app.db import repository
 from app.db.connection import get_db
 from app.models.requests import (
     AddAttendanceRequest,
+    AttendanceBatchRequest,
+    AttendancePreflightRequest,
     AddClassRequest,
+    AddFaceTemplateRequest,
     FaceLoginRequest,
     EnrollInClassRequest,
     GetClassAttendanceRequest,
@@ -22,12 +27,34 @@ from app.models.requests import (
     GetProfessorScheduleRequest,
     GetStudentAttendanceRequest,
     GetUpcomingSessionsRequest,
+    GroupPhotoAttendanceRequest,
+    KioskIdentifyRequest,
     PaginationRequest,
     StudentEnrollRequest,
 )
-from app.services.attendance_service import add_attendance
+from app.services.attendance_service import (
+    AttendanceWindow,
+    QueuedCheckIn,
+    add_attendance,
+    batch_attendance,
+    group_photo_attendance,
+    identify_attendance,
+    preflight_attendance,
+)
+from app.services.bulk_enrollment import bulk_enroll_photos, zip_roster_photos
+from app.services.face_pool import FacePoolError
+from app.services.idempotency import (
+    IDEMPOTENCY_KEY_HEADER,
+    IdempotencyError,
+    get_idempotency_store,
+    request_fingerprint,
+    validate_idempotency_key,
+)
+from app.services.roster_service import refresh_class_roster
 from app.auth.decorators import jwt_required
+from app.auth.jwt_utils import create_attendance_ticket, decode_token
 from app.services.auth_service import (
+    add_student_face_template,
     authenticate_user,
     enroll_student_with_join_code,
     face_login_student,
@@ -92,6 +119,45 @@ def _error(status_code: int, message: str):
     )
 
 
+def _idempotent(scope: str, euid: str, handler, **policy):
+    """
+    Runs handler (a view body returning (response, status)) once per Idempotency-Key and
+    replays its response to retries; see IdempotencyStore (policy: replayable, persist).
+    Without the header it just runs.
+    """
+    key = request.headers.get(IDEMPOTENCY_KEY_HEADER)
+    if key is None:
+        return handler()
+    try:
+        validate_idempotency_key(key)
+    except ValueError as e:
+        return _error(400, str(e))
+
+    def snapshot() -> tuple[dict, int]:
+        resp, status = handler()
+        body = resp.get_json()
+        body.pop("request_id", None)
+        return body, status
+
+    try:
+        body, status, replayed = get_idempotency_store().execute(
+            get_db(),
+            scope=scope,
+            key=key,
+            euid=euid,
+            fingerprint=request_fingerprint(request.get_data()),
+            handler=snapshot,
+            **policy,
+        )
+    except IdempotencyError as e:
+        return _error(e.status_code, str(e))
+    resp = jsonify({**body, "request_id": _request_id()})
+    if replayed:
+        resp.headers["Idempotent-Replayed"] = "true"
+        logger.info("idempotent replay | request_id=%s | scope=%s", _request_id(), scope)
+    return resp, status
+
+
 @bp.before_app_request
 def attach_request_id():
     rid = request.headers.get("X-Request-ID") or str(uuid.uuid4())
@@ -104,6 +170,15 @@ def add_request_id_header(response):
     return response
 
 
+@bp.app_errorhandler(FacePoolError)
+def handle_face_pool_error(e: FacePoolError):
+    # Face workers saturated (429) or job deadline missed (503): tell the client when to retry.
+    logger.warning("face pool rejected request | request_id=%s reason=%s", _request_id(), str(e))
+    resp, status = _error(e.status_code, str(e))
+    resp.headers["Retry-After"] = str(e.retry_after)
+    return resp, status
+
+
 @bp.app_errorhandler(Exception)
 def handle_unexpected_error(e: Exception):
     logger.exception("Unhandled exception | request_id=%s", _request_id())
@@ -238,9 +313,29 @@ def face_login():
     except ValidationError as e:
         return _validation_error(e)
 
+    # Failures may be transient (the in-memory rate limit), so only a login is replayed, and
+    # its live token pair stays out of tbl_idempotency_keys.
+    return _idempotent(
+        "face_login",
+        payload.euid or "",
+        lambda: _face_login(payload),
+        replayable=lambda status: status == 200,
+        persist=False,
+    )
+
+
+def _face_login(payload: FaceLoginRequest):
     db = get_db()
     cfg = _cfg()
-    tokens = face_login_student(db=db, cfg=cfg, euid=payload.euid, photo_b64=payload.photo)
+    tokens = face_login_student(
+        db=db,
+        cfg=cfg,
+        euid=payload.euid,
+        photo_b64=payload.photo,
+        client_id=request.remote_addr or "",
+        face_box=payload.face_box,
+        device_id=payload.device_id,
+    )
     if not tokens:
         return _error(401, "Face login failed")
 
@@ -257,6 +352,98 @@ def post_attendance():
     except ValidationError as e:
         return _validation_error(e)
 
+    return _idempotent("attendance", payload.euid, lambda: _post_attendance(payload))
+
+
+def _ticket_window(cfg: Config, payload: AddAttendanceRequest) -> AttendanceWindow | None:
+    """
+    The window carried by a valid preflight ticket for this student and class, else None
+    (the check-in then runs the full checks).
+    """
+    if not payload.ticket:
+        return None
+    try:
+        claims = decode_token(
+            payload.ticket, secret=cfg.jwt_secret_key, algorithm=cfg.jwt_algorithm
+        )
+        if (
+            claims.get("type") != "attendance_ticket"
+            or claims.get("sub") != payload.euid
+            or claims.get("code") != payload.code
+        ):
+            raise ValueError("ticket is for another check-in")
+        lat, lon = claims["loc"]
+        return AttendanceWindow(
+            session_id=int(claims["sid"]),
+            session_start=claims["start"],
+            class_location=(float(lat), float(lon)),
+        )
+    except Exception as e:
+        logger.info("attendance ticket ignored | request_id=%s reason=%s", _request_id(), e)
+        return None
+
+
+@bp.post("/attendance/preflight")
+@jwt_required(role="student")
+def post_attendance_preflight():
+    """
+    Runs the cheap check-in checks (enrollment, session, time window, distance) before the
+    client uploads a photo, and returns a short-lived ticket for POST /attendance.
+    """
+    try:
+        payload = AttendancePreflightRequest.model_validate(request.get_json())
+        if payload.euid != g.current_user:
+            return _error(403, "Forbidden")
+    except ValidationError as e:
+        return _validation_error(e)
+
+    cfg = _cfg()
+    result = preflight_attendance(
+        db=get_db(),
+        code=payload.code,
+        euid=payload.euid,
+        student_location=payload.location,
+        max_distance_feet=float(cfg.max_distance_feet),
+        time_window_minutes=int(cfg.time_window_minutes),
+        force_reverify=cfg.attendance_force_reverify,
+    )
+    if result.status != "success":
+        logger.info(
+            "attendance preflight rejected | request_id=%s | code=%s euid=%s reason=%s",
+            _request_id(),
+            payload.code,
+            payload.euid,
+            result.error,
+        )
+        return _error(400, result.error or "Attendance rejected")
+    if result.already_recorded:
+        body = {"status": "success", "already_recorded": True, "request_id": _request_id()}
+        return jsonify(body), 200
+
+    ticket = create_attendance_ticket(
+        secret=cfg.jwt_secret_key,
+        algorithm=cfg.jwt_algorithm,
+        subject=payload.euid,
+        code=payload.code,
+        session_id=result.window.session_id,
+        session_start=result.window.session_start,
+        class_location=result.window.class_location,
+        exp_seconds=cfg.attendance_ticket_ttl_seconds,
+    )
+    return (
+        jsonify(
+            {
+                "status": "success",
+                "ticket": ticket,
+                "expires_in": cfg.attendance_ticket_ttl_seconds,
+                "request_id": _request_id(),
+            }
+        ),
+        200,
+    )
+
+
+def _post_attendance(payload: AddAttendanceRequest):
     cfg = _cfg()
     db = get_db()
 
@@ -269,16 +456,24 @@ def post_attendance():
         user_data_dir=cfg.user_data_dir,
         max_distance_feet=float(cfg.max_distance_feet),
         time_window_minutes=int(cfg.time_window_minutes),
+        face_tolerance=float(cfg.face_tolerance),
+        face_box=payload.face_box,
+        force_reverify=cfg.attendance_force_reverify,
+        window=_ticket_window(cfg, payload),
     )
 
     if result.status == "success":
         logger.info(
-            "attendance accepted | request_id=%s | code=%s euid=%s",
+            "attendance accepted | request_id=%s | code=%s euid=%s already_recorded=%s",
             _request_id(),
             payload.code,
             payload.euid,
+            result.already_recorded,
         )
-        return jsonify({"status": "success", "request_id": _request_id()}), 200
+        body = {"status": "success", "request_id": _request_id()}
+        if result.already_recorded:
+            body["already_recorded"] = True
+        return jsonify(body), 200
 
     logger.info(
         "attendance rejected | request_id=%s | code=%s euid=%s reason=%s",
@@ -291,6 +486,191 @@ def post_attendance():
     return _error(400, result.error or "Attendance rejected")
 
 
+@bp.post("/attendance/batch")
+@jwt_required(role="student")
+def post_attendance_batch():
+    """
+    Syncs check-ins the app queued while offline. Each is checked as of its capture time;
+    the response has one result per item, in order.
+    """
+    cfg = _cfg()
+    try:
+        payload = AttendanceBatchRequest.model_validate(request.get_json())
+        if payload.euid != g.current_user:
+            return _error(403, "Forbidden")
+    except ValidationError as e:
+        return _validation_error(e)
+    if len(payload.items) > cfg.attendance_batch_max_items:
+        return _error(400, f"At most {cfg.attendance_batch_max_items} check-ins per batch")
+
+    return _idempotent("attendance_batch", payload.euid, lambda: _post_attendance_batch(payload))
+
+
+def _post_attendance_batch(payload: AttendanceBatchRequest):
+    cfg = _cfg()
+    result = batch_attendance(
+        db=get_db(),
+        euid=payload.euid,
+        check_ins=[
+            QueuedCheckIn(
+                code=item.code,
+                location=item.location,
+                photo_b64=item.photo,
+                captured_at=item.captured_at.timestamp(),
+                face_box=item.face_box,
+            )
+            for item in payload.items
+        ],
+        user_data_dir=cfg.user_data_dir,
+        max_distance_feet=float(cfg.max_distance_feet),
+        time_window_minutes=int(cfg.time_window_minutes),
+        face_tolerance=float(cfg.face_tolerance),
+        max_age_seconds=cfg.attendance_batch_max_age_hours * 3600,
+        force_reverify=cfg.attendance_force_reverify,
+    )
+
+    results = []
+    for i, (item, item_result) in enumerate(zip(payload.items, result.items, strict=True)):
+        entry = {"index": i, "code": item.code, "status": item_result.status}
+        if item_result.error:
+            entry["error"] = item_result.error
+        if item_result.already_recorded:
+            entry["already_recorded"] = True
+        results.append(entry)
+    logger.info(
+        "attendance batch | request_id=%s | euid=%s items=%s recorded=%s rejected=%s",
+        _request_id(),
+        payload.euid,
+        len(results),
+        result.recorded,
+        sum(r["status"] != "success" for r in results),
+    )
+    body = {
+        "status": "success",
+        "recorded": result.recorded,
+        "results": results,
+        "request_id": _request_id(),
+    }
+    return jsonify(body), 200
+
+
+@bp.post("/classes/<code>/kiosk/identify")
+@jwt_required(role="professor")
+def kiosk_identify(code: str):
+    """
+    Classroom kiosk check-in: identify the student in the photo among the class roster
+    and record their attendance. The professor must own the class.
+    """
+    try:
+        payload = KioskIdentifyRequest.model_validate({**(request.get_json() or {}), "code": code})
+    except ValidationError as e:
+        return _validation_error(e)
+
+    db = get_db()
+    if not repository.professor_exists_for_class(
+        db, code=payload.code, professor_euid=g.current_user
+    ):
+        return _error(403, "Forbidden")
+
+    cfg = _cfg()
+    result = identify_attendance(
+        db=db,
+        code=payload.code,
+        submitted_photo_b64=payload.photo,
+        user_data_dir=cfg.user_data_dir,
+        time_window_minutes=int(cfg.time_window_minutes),
+        face_tolerance=float(cfg.face_tolerance),
+    )
+
+    if result.status != "success":
+        logger.info(
+            "kiosk identify rejected | request_id=%s | code=%s reason=%s",
+            _request_id(),
+            payload.code,
+            result.error,
+        )
+        return _error(400, result.error or "Identification failed")
+
+    logger.info(
+        "kiosk attendance accepted | request_id=%s | code=%s euid=%s distance=%.3f",
+        _request_id(),
+        payload.code,
+        result.euid,
+        result.distance,
+    )
+    return (
+        jsonify(
+            {
+                "status": "success",
+                "euid": result.euid,
+                "distance": result.distance,
+                "request_id": _request_id(),
+            }
+        ),
+        200,
+    )
+
+
+@bp.post("/classes/<code>/attendance/group-photo")
+@jwt_required(role="professor")
+def group_photo_attendance_route(code: str):
+    """
+    Takes attendance from one classroom photo: every recognized roster student is marked
+    present. The professor must own the class.
+    """
+    try:
+        payload = GroupPhotoAttendanceRequest.model_validate(
+            {**(request.get_json() or {}), "code": code}
+        )
+    except ValidationError as e:
+        return _validation_error(e)
+
+    db = get_db()
+    if not repository.professor_exists_for_class(
+        db, code=payload.code, professor_euid=g.current_user
+    ):
+        return _error(403, "Forbidden")
+
+    cfg = _cfg()
+    result = group_photo_attendance(
+        db=db,
+        code=payload.code,
+        submitted_photo_b64=payload.photo,
+        user_data_dir=cfg.user_data_dir,
+        time_window_minutes=int(cfg.time_window_minutes),
+        face_tolerance=float(cfg.face_tolerance),
+    )
+
+    if result.status != "success":
+        logger.info(
+            "group photo attendance rejected | request_id=%s | code=%s reason=%s",
+            _request_id(),
+            payload.code,
+            result.error,
+        )
+        return _error(400, result.error or "Group photo attendance failed")
+
+    logger.info(
+        "group photo attendance accepted | request_id=%s | code=%s present=%d faces=%d",
+        _request_id(),
+        payload.code,
+        len(result.present),
+        result.faces_detected,
+    )
+    return (
+        jsonify(
+            {
+                "status": "success",
+                "present": list(result.present),
+                "faces_detected": result.faces_detected,
+                "unmatched_faces": result.unmatched_faces,
+                "request_id": _request_id(),
+            }
+        ),
+        200,
+    )
+
+
 @bp.post("/classes/<code>/join-code/rotate")
 @jwt_required(role="professor")
 def rotate_join_code(code: str):
@@ -315,6 +695,65 @@ def rotate_join_code(code: str):
     )
 
 
+@bp.post("/classes/<code>/roster/photos")
+@jwt_required(role="professor")
+def bulk_enroll_roster(code: str):
+    """
+    Bulk-enroll a class roster from a zip of <euid>.jpg reference photos (multipart field
+    "archive"). Returns a per-student report; unusable photos don't block the others.
+    The professor must own the class.
+    """
+    db = get_db()
+    if not repository.professor_exists_for_class(db, code=code, professor_euid=g.current_user):
+        return _error(403, "Forbidden")
+
+    cfg = _cfg()
+    if (request.content_length or 0) > cfg.roster_archive_max_bytes:
+        return _error(413, "Archive too large")
+    # A chunked upload has no Content-Length; the form parser stops reading past this
+    request.max_content_length = cfg.roster_archive_max_bytes
+    try:
+        upload = request.files.get("archive")
+    except RequestEntityTooLarge:
+        return _error(413, "Archive too large")
+    if upload is None:
+        return _error(400, "archive file is required")
+    try:
+        archive = zipfile.ZipFile(upload.stream)
+    except zipfile.BadZipFile:
+        return _error(400, "archive must be a zip file")
+
+    with archive:
+        result = bulk_enroll_photos(
+            db=db,
+            code=code,
+            photos=zip_roster_photos(archive),
+            user_data_dir=cfg.user_data_dir,
+        )
+    if result.status != "success":
+        return _error(400, result.error or "Bulk enrollment failed")
+
+    logger.info(
+        "bulk enrollment | request_id=%s | code=%s enrolled=%d failed=%d",
+        _request_id(),
+        code,
+        result.enrolled,
+        result.failed,
+    )
+    return (
+        jsonify(
+            {
+                "status": "success",
+                "enrolled": result.enrolled,
+                "failed": result.failed,
+                "students": [e.to_dict() for e in result.entries],
+                "request_id": _request_id(),
+            }
+        ),
+        200,
+    )
+
+
 @bp.post("/students/me/classes")
 @jwt_required(role="student")
 def enroll_in_class():
@@ -339,10 +778,40 @@ def enroll_in_class():
         if msg == "Already enrolled":
             return _error(409, msg)
         return _error(400, msg)
+    refresh_class_roster(db, code=payload.code, user_data_dir=_cfg().user_data_dir)
 
     return jsonify({"status": "success", "request_id": _request_id()}), 201
 
 
+@bp.post("/students/me/face-templates")
+@jwt_required(role="student")
+def add_face_template():
+    """
+    Add another reference capture (e.g. different lighting) for the authenticated student.
+    """
+    try:
+        payload = AddFaceTemplateRequest.model_validate(request.get_json())
+    except ValidationError as e:
+        return _validation_error(e)
+
+    result = add_student_face_template(
+        db=get_db(),
+        cfg=_cfg(),
+        euid=g.current_user,
+        photo_b64=payload.photo,
+        face_box=payload.face_box,
+    )
+    if result.status != "success":
+        if result.error == "Reference image not found":
+            return _error(404, result.error)
+        return _error(400, result.error or "Template rejected")
+
+    return (
+        jsonify({"status": "success", "templates": result.templates, "request_id": _request_id()}),
+        201,
+    )
+
+
 @bp.get("/students/me/classes")
 @jwt_required(role="student")
 def get_my_classes():
@@ -1,21 +1,162 @@
 from __future__ import annotations
 
+import time
 from dataclasses import dataclass
 from datetime import datetime
 from pathlib import Path
 
 from app.db import repository
-from app.services.face_service import verify_face_match
+from app.services.face_service import (
+    ENCODING_MODEL,
+    FaceMatchRequest,
+    get_face_pipeline_options,
+    identify_face,
+    identify_group_photo,
+    templates_from_blobs,
+    verify_face_match,
+    verify_face_matches,
+)
 from app.services.geo_service import distance_feet
+from app.services.roster_service import get_roster_matrix
 
 DEFAULT_MAX_DISTANCE_FEET = 30.0
 DEFAULT_TIME_WINDOW_MINUTES = 30
+DEFAULT_BATCH_MAX_AGE_SECONDS = 24 * 3600
+# Device clocks drift; a capture this far "in the future" is still accepted.
+CAPTURE_CLOCK_SKEW_SECONDS = 300
 
 
 @dataclass(frozen=True)
 class AttendanceResult:
     status: str  # "success" | "error"
     error: str | None = None
+    already_recorded: bool = False  # present before this request; the photo wasn't checked
+
+
+@dataclass(frozen=True)
+class AttendanceWindow:
+    """
+    The session a check-in counts for and what it is checked against: read by the precheck
+    query, or carried in a signed preflight ticket.
+    """
+
+    session_id: int
+    session_start: int | None  # epoch seconds
+    class_location: tuple[float, float]
+
+
+@dataclass(frozen=True)
+class PreflightResult:
+    status: str  # "success" | "error"
+    error: str | None = None
+    already_recorded: bool = False
+    window: AttendanceWindow | None = None  # set on success unless already recorded
+
+
+@dataclass(frozen=True)
+class KioskResult:
+    status: str  # "success" | "error"
+    error: str | None = None
+    euid: str | None = None
+    distance: float | None = None
+
+
+@dataclass(frozen=True)
+class GroupPhotoResult:
+    status: str  # "success" | "error"
+    error: str | None = None
+    present: tuple[str, ...] = ()
+    faces_detected: int = 0
+    unmatched_faces: int = 0
+
+
+def _outside_time_window(session: repository.SessionRow, time_window_minutes: int) -> bool:
+    session_dt = datetime.strptime(
+        f"{session.session_date} {session.session_time}",
+        "%Y-%m-%d %H:%M:%S",
+    )
+    diff_seconds = abs((datetime.now() - session_dt).total_seconds())
+    return diff_seconds > time_window_minutes * 60
+
+
+def _outside_start_window(
+    session_start: int | None, time_window_minutes: int, at: float | None = None
+) -> bool:
+    # session_start is NULL when the stored date/time doesn't parse
+    if session_start is None:
+        return True
+    at = time.time() if at is None else at
+    return abs(at - session_start) > time_window_minutes * 60
+
+
+def _window_error(
+    window: AttendanceWindow,
+    student_location: tuple[float, float],
+    max_distance_feet: float,
+    time_window_minutes: int,
+    at: float | None = None,
+) -> str | None:
+    # Time window check (at: when the student was there; defaults to now)
+    if _outside_start_window(window.session_start, time_window_minutes, at):
+        return "Outside time range"
+    # Distance check
+    if distance_feet(student_location, window.class_location) > max_distance_feet:
+        return "Too far from class"
+    return None
+
+
+def _precheck(
+    db, *, code: str, euid: str, on_date: str | None = None
+) -> tuple[repository.AttendancePrecheck | None, str | None]:
+    """
+    Class, enrollment, the session on on_date (default today) and the student's reference
+    templates in one query. Returns (precheck, error); precheck is None when there is an error.
+    """
+    on_date = on_date or datetime.now().date().strftime("%Y-%m-%d")
+    precheck = repository.get_attendance_precheck(
+        db, code=code, student_euid=euid, on_date=on_date, model=ENCODING_MODEL
+    )
+    if precheck is None:
+        return None, "Class does not exist"
+    if not precheck.enrolled:
+        return None, "Not enrolled in class"
+    if precheck.session_id is None:
+        return None, "No class on date"
+    return precheck, None
+
+
+def _precheck_window(precheck: repository.AttendancePrecheck) -> AttendanceWindow:
+    return AttendanceWindow(
+        session_id=precheck.session_id,
+        session_start=precheck.session_start,
+        class_location=(precheck.lat, precheck.lon),
+    )
+
+
+def preflight_attendance(
+    *,
+    db,
+    code: str,
+    euid: str,
+    student_location: tuple[float, float],
+    max_distance_feet: float = DEFAULT_MAX_DISTANCE_FEET,
+    time_window_minutes: int = DEFAULT_TIME_WINDOW_MINUTES,
+    force_reverify: bool = False,
+) -> PreflightResult:
+    """
+    Every check of add_attendance except the face match, before the client uploads a photo.
+    On success the window is what the caller signs into a ticket for add_attendance.
+    """
+    precheck, error = _precheck(db, code=code, euid=euid)
+    if error:
+        return PreflightResult(status="error", error=error)
+    if precheck.attended and not force_reverify:
+        return PreflightResult(status="success", already_recorded=True)
+    window = _precheck_window(precheck)
+    error = _window_error(window, student_location, max_distance_feet, time_window_minutes)
+    if error:
+        return PreflightResult(status="error", error=error)
+    return PreflightResult(status="success", window=window)
 
 
 def add_attendance(
@@ -29,44 +170,50 @@ def add_attendance(
     max_distance_feet: float = DEFAULT_MAX_DISTANCE_FEET,
     time_window_minutes: int = DEFAULT_TIME_WINDOW_MINUTES,
     face_tolerance: float = 0.6,
+    face_box: tuple[float, float, float, float] | None = None,
+    force_reverify: bool = False,
+    window: AttendanceWindow | None = None,
 ) -> AttendanceResult:
-    # 1) Class exists + get location
-    class_info = repository.get_class_by_code(db, code=code)
-    if class_info is None:
-        return AttendanceResult(status="error", error="Class does not exist")
+    """
+    Records the student present in today's session of the class if every check passes.
+    With a window from a verified preflight ticket, the class/enrollment/session lookups are
+    skipped; the time window and distance are still checked against it, and one query
+    loads the templates and whether the student is already present.
+    """
+    if window is None:
+        # 1-3) Class, enrollment, today's session and the student's reference templates in
+        # one query, so a rejected check-in costs a single lookup and no image work
+        precheck, error = _precheck(db, code=code, euid=euid)
+        if error:
+            return AttendanceResult(status="error", error=error)
 
-    # 2) Enrollment check
-    if not repository.student_is_enrolled(db, student_euid=euid, code=code):
-        return AttendanceResult(status="error", error="Not enrolled in class")
+        attended = precheck.attended
+        window = _precheck_window(precheck)
+        template_blobs = precheck.templates
+    else:
+        attended, template_blobs = repository.get_session_check_in(
+            db, session_id=window.session_id, student_euid=euid, model=ENCODING_MODEL
+        )
 
-    # 3) Session exists today
-    today = datetime.now().date().strftime("%Y-%m-%d")
-    session = repository.get_session_for_date(db, code=code, on_date=today)
-    if session is None:
-        return AttendanceResult(status="error", error="No class on date")
+    # Repeat taps: the student is already present, and verifying again would only rewrite
+    # the same row
+    if attended and not force_reverify:
+        return AttendanceResult(status="success", already_recorded=True)
 
-    # 4) Time window check
-    session_dt = datetime.strptime(
-        f"{session.session_date} {session.session_time}",
-        "%Y-%m-%d %H:%M:%S",
-    )
-    now = datetime.now()
-    diff_seconds = abs((now - session_dt).total_seconds())
-    if diff_seconds > time_window_minutes * 60:
-        return AttendanceResult(status="error", error="Outside time range")
-
-    # 5) Distance check
-    class_location = (float(class_info["lat"]), float(class_info["lon"]))
-    dist = distance_feet(student_location, class_location)
-    if dist > max_distance_feet:
-        return AttendanceResult(status="error", error="Too far from class")
-
-    # 6) Face match check
+    # 4-5) Time window and distance checks
+    error = _window_error(window, student_location, max_distance_feet, time_window_minutes)
+    if error:
+        return AttendanceResult(status="error", error=error)
+
+    # 6) Face match check (students enrolled before tbl_face_templates fall back to the files)
     reference_path = user_data_dir / "Student" / euid / "reference_image.jpg"
     face_result = verify_face_match(
         submitted_photo_b64=submitted_photo_b64,
         reference_image_path=reference_path,
         tolerance=face_tolerance,
+        options=get_face_pipeline_options("attendance"),
+        face_box=face_box,
+        templates=templates_from_blobs(template_blobs),
     )
     if face_result.status != "success":
         return AttendanceResult(
@@ -74,5 +221,214 @@ def add_attendance(
         )
 
     # 7) Persist
-    repository.upsert_attendance(db, session_id=session.id, student_euid=euid, attended=1)
+    repository.upsert_attendance(db, session_id=window.session_id, student_euid=euid, attended=1)
     return AttendanceResult(status="success")
+
+
+@dataclass(frozen=True)
+class QueuedCheckIn:
+    """
+    A check-in taken offline and synced later: checked as of captured_at (epoch seconds).
+    """
+
+    code: str
+    location: tuple[float, float]
+    photo_b64: str
+    captured_at: float
+    face_box: tuple[float, float, float, float] | None = None
+
+
+@dataclass(frozen=True)
+class BatchAttendanceResult:
+    items: tuple[AttendanceResult, ...] = ()  # same order as the check-ins
+
+    @property
+    def recorded(self) -> int:
+        return sum(r.status == "success" and not r.already_recorded for r in self.items)
+
+
+def batch_attendance(
+    *,
+    db,
+    euid: str,
+    check_ins: list[QueuedCheckIn],
+    user_data_dir: Path,
+    max_distance_feet: float = DEFAULT_MAX_DISTANCE_FEET,
+    time_window_minutes: int = DEFAULT_TIME_WINDOW_MINUTES,
+    face_tolerance: float = 0.6,
+    max_age_seconds: float = DEFAULT_BATCH_MAX_AGE_SECONDS,
+    force_reverify: bool = False,
+) -> BatchAttendanceResult:
+    """
+    Records a student's queued offline check-ins. Each one goes through the checks of
+    add_attendance, but against the session on its capture date and with the time window
+    measured from its capture time. The face checks of every check-in that gets that far run
+    together in the face pool, and every accepted one is written in one upsert and one
+    commit. Results are per check-in.
+    """
+    now = time.time()
+    results: list[AttendanceResult | None] = [None] * len(check_ins)
+    pending: list[tuple[int, int, FaceMatchRequest]] = []  # (index, session_id, request)
+    options = get_face_pipeline_options("attendance")
+    reference_path = user_data_dir / "Student" / euid / "reference_image.jpg"
+
+    for i, check_in in enumerate(check_ins):
+        if check_in.captured_at > now + CAPTURE_CLOCK_SKEW_SECONDS:
+            results[i] = AttendanceResult(status="error", error="Capture time is in the future")
+            continue
+        if now - check_in.captured_at > max_age_seconds:
+            results[i] = AttendanceResult(status="error", error="Capture is too old to sync")
+            continue
+
+        captured_on = datetime.fromtimestamp(check_in.captured_at).strftime("%Y-%m-%d")
+        precheck, error = _precheck(db, code=check_in.code, euid=euid, on_date=captured_on)
+        if error:
+            results[i] = AttendanceResult(status="error", error=error)
+            continue
+        if precheck.attended and not force_reverify:
+            results[i] = AttendanceResult(status="success", already_recorded=True)
+            continue
+        window = _precheck_window(precheck)
+        error = _window_error(
+            window, check_in.location, max_distance_feet, time_window_minutes, check_in.captured_at
+        )
+        if error:
+            results[i] = AttendanceResult(status="error", error=error)
+            continue
+        pending.append(
+            (
+                i,
+                window.session_id,
+                FaceMatchRequest(
+                    submitted_photo_b64=check_in.photo_b64,
+                    reference_image_path=reference_path,
+                    tolerance=face_tolerance,
+                    options=options,
+                    face_box=check_in.face_box,
+                    templates=templates_from_blobs(precheck.templates),
+                ),
+            )
+        )
+
+    # Face checks fan out over the pool; raises FacePoolBusy/FacePoolTimeout before anything
+    # is written, so the client can retry the whole batch.
+    matches = verify_face_matches([request for _, _, request in pending])
+    rows: dict[int, str] = {}  # session_id -> euid; one row per session
+    for (i, session_id, _), match in zip(pending, matches, strict=True):
+        if match.status != "success":
+            results[i] = AttendanceResult(
+                status="error", error=match.error or "Face verification failed"
+            )
+        elif session_id in rows:
+            # Two queued taps for the same session: the first one records it
+            results[i] = AttendanceResult(status="success", already_recorded=True)
+        else:
+            rows[session_id] = euid
+            results[i] = AttendanceResult(status="success")
+
+    if rows:
+        repository.upsert_attendance_rows(db, rows=list(rows.items()))
+    return BatchAttendanceResult(items=tuple(results))
+
+
+def identify_attendance(
+    *,
+    db,
+    code: str,
+    submitted_photo_b64: str,
+    user_data_dir: Path,
+    time_window_minutes: int = DEFAULT_TIME_WINDOW_MINUTES,
+    face_tolerance: float = 0.6,
+) -> KioskResult:
+    """
+    Kiosk check-in: identifies who is in the photo among the class roster (1:N) and records
+    their attendance. The device is in the room, so there is no distance check.
+    """
+    # 1) Class exists
+    if repository.get_class_by_code(db, code=code) is None:
+        return KioskResult(status="error", error="Class does not exist")
+
+    # 2) Session exists today and we're inside the window
+    today = datetime.now().date().strftime("%Y-%m-%d")
+    session = repository.get_session_for_date(db, code=code, on_date=today)
+    if session is None:
+        return KioskResult(status="error", error="No class on date")
+    if _outside_time_window(session, time_window_minutes):
+        return KioskResult(status="error", error="Outside time range")
+
+    # 3) One encode, one vectorized comparison against the whole roster
+    roster = get_roster_matrix(
+        code=code,
+        euids=repository.get_class_roster(db, code=code),
+        user_data_dir=user_data_dir,
+    )
+    face_result = identify_face(
+        submitted_photo_b64=submitted_photo_b64,
+        gallery=roster.encodings,
+        tolerance=face_tolerance,
+        options=get_face_pipeline_options("attendance"),
+    )
+    if face_result.status != "success":
+        return KioskResult(
+            status="error",
+            error=face_result.error or "Face identification failed",
+            distance=face_result.distance,
+        )
+
+    # 4) Persist
+    euid = roster.euids[face_result.index]
+    repository.upsert_attendance(db, session_id=session.id, student_euid=euid, attended=1)
+    return KioskResult(status="success", euid=euid, distance=face_result.distance)
+
+
+def group_photo_attendance(
+    *,
+    db,
+    code: str,
+    submitted_photo_b64: str,
+    user_data_dir: Path,
+    time_window_minutes: int = DEFAULT_TIME_WINDOW_MINUTES,
+    face_tolerance: float = 0.6,
+) -> GroupPhotoResult:
+    """
+    Marks every recognized student in one classroom photo as present: all faces are
+    encoded in one pass, matched one-to-one against the roster, and written in one commit.
+    """
+    # 1) Class exists
+    if repository.get_class_by_code(db, code=code) is None:
+        return GroupPhotoResult(status="error", error="Class does not exist")
+
+    # 2) Session exists today and we're inside the window
+    today = datetime.now().date().strftime("%Y-%m-%d")
+    session = repository.get_session_for_date(db, code=code, on_date=today)
+    if session is None:
+        return GroupPhotoResult(status="error", error="No class on date")
+    if _outside_time_window(session, time_window_minutes):
+        return GroupPhotoResult(status="error", error="Outside time range")
+
+    # 3) faces x roster distance matrix, one-to-one assignment
+    roster = get_roster_matrix(
+        code=code,
+        euids=repository.get_class_roster(db, code=code),
+        user_data_dir=user_data_dir,
+    )
+    face_result = identify_group_photo(
+        submitted_photo_b64=submitted_photo_b64,
+        gallery=roster.encodings,
+        tolerance=face_tolerance,
+    )
+    if face_result.status != "success":
+        return GroupPhotoResult(
+            status="error", error=face_result.error or "Face identification failed"
+        )
+
+    # 4) Persist (single bulk upsert)
+    present = tuple(roster.euids[m.gallery_index] for m in face_result.matches)
+    if present:
+        repository.upsert_attendance_many(db, session_id=session.id, student_euids=list(present))
+    return GroupPhotoResult(
+        status="success",
+        present=present,
+        faces_detected=face_result.faces_detected,
+        unmatched_faces=face_result.faces_detected - len(present),
+    )
@@ -9,7 +9,22 @@ from app.config import Config
 from app.auth.password_utils import hash_password, verify_password
 from app.auth.jwt_utils import create_access_token, create_refresh_token, decode_token
 from app.db import repository
-from app.services.face_service import save_reference_image, verify_face_match
+from app.services.face_service import (
+    ENCODING_DIM,
+    ENCODING_MODEL,
+    FaceTemplateResult,
+    add_reference_template,
+    get_face_pipeline_options,
+    identify_enrolled_face,
+    load_reference_templates,
+    reference_image_path,
+    save_reference_image,
+    template_blobs,
+    templates_from_blobs,
+    update_face_index,
+    verify_face_match,
+)
+from app.services.roster_service import refresh_student_rosters
 
 from collections import defaultdict
 from time import time
@@ -20,14 +35,14 @@ _FACE_LOGIN_WINDOW_SECONDS = 60
 _FACE_LOGIN_MAX_ATTEMPTS = 5
 
 
-def _is_rate_limited(euid: str) -> bool:
+def _is_rate_limited(euid: str, max_attempts: int | None = None) -> bool:
     now = time()
     window_start = now - _FACE_LOGIN_WINDOW_SECONDS
 
     attempts = _FACE_LOGIN_ATTEMPTS[euid]
     attempts[:] = [t for t in attempts if t >= window_start]
 
-    if len(attempts) >= _FACE_LOGIN_MAX_ATTEMPTS:
+    if len(attempts) >= (_FACE_LOGIN_MAX_ATTEMPTS if max_attempts is None else max_attempts):
         return True
 
     attempts.append(now)
@@ -203,6 +218,20 @@ def _now_iso() -> str:
     return datetime.now(timezone.utc).isoformat()
 
 
+def sync_face_templates(db: sqlite3.Connection, *, user_data_dir, euid: str) -> int:
+    """
+    Copies the student's reference templates (the sidecar next to their reference image)
+    into tbl_face_templates. Does not commit. Returns the number of templates stored;
+    0 clears the rows, so verification falls back to the reference image.
+    """
+    templates = load_reference_templates(reference_image_path(user_data_dir, euid))
+    blobs = template_blobs(templates) if templates is not None else []
+    repository.replace_face_templates(
+        db, euid=euid, encodings=blobs, dim=ENCODING_DIM, model=ENCODING_MODEL
+    )
+    return len(blobs)
+
+
 def enroll_student_with_join_code(
     *,
     db: sqlite3.Connection,
@@ -235,13 +264,16 @@ def enroll_student_with_join_code(
         (euid, password_hash, _now_iso()),
     )
 
-    # 3) save reference image
+    # 3) save reference image (also stores the precomputed reference encoding)
     ref_path = cfg.user_data_dir / "Student" / euid / "reference_image.jpg"
     save_reference_image(photo_b64=photo_b64, dest_path=ref_path)
+    update_face_index(user_data_dir=cfg.user_data_dir, euid=euid)
 
-    # 4) enroll into class roster
+    # 4) enroll into class roster; the templates are committed with the user row
+    sync_face_templates(db, user_data_dir=cfg.user_data_dir, euid=euid)
     repository.enroll_student(db, code=code, student_euid=euid)
     db.commit()
+    refresh_student_rosters(db, euid=euid, user_data_dir=cfg.user_data_dir)
 
     # 5) issue tokens (student role)
     return issue_token_pair(subject=euid, role="student", cfg=cfg, db=db)
@@ -251,46 +283,69 @@ def face_login_student(
     *,
     db: sqlite3.Connection,
     cfg: Config,
-    euid: str,
+    euid: str | None,
     photo_b64: str,
+    client_id: str = "",
+    face_box: tuple[float, float, float, float] | None = None,
+    device_id: str | None = None,
 ) -> dict[str, str] | None:
     """
     Authenticates a student via facial recognition.
-    Applies basic in-memory rate limiting to prevent brute-force attempts.
+    Without an euid, runs in identify mode: the student is looked up among every enrolled
+    face (campus-wide index) with the stricter identify tolerance.
+    Applies basic in-memory rate limiting to prevent brute-force attempts: per euid, or in
+    identify mode per client address (FACE_IDENTIFY_MAX_ATTEMPTS_PER_ADDRESS) and, when the
+    client sends one, per device id.
     Returns token pair on success, None on failure.
     """
 
     # Rate limiting check
-    if _is_rate_limited(euid):
+    if euid is not None:
+        if _is_rate_limited(euid):
+            return None
+    elif _is_rate_limited(f"identify:{client_id}", cfg.face_identify_max_attempts_per_address) or (
+        device_id is not None and _is_rate_limited(f"identify:{client_id}:{device_id}")
+    ):
         return None
 
-    # 1 Ensure student user exists
-    row = db.execute(
-        """
-        SELECT fld_us_role
-        FROM tbl_users
-        WHERE fld_us_euid = ?
-        LIMIT 1
-        """,
-        (euid,),
-    ).fetchone()
-
-    if not row or row["fld_us_role"] != "student":
-        return None
+    # 0 Identify mode: the match itself tells us who it is (checked against their reference)
+    identified = euid is None
+    if identified:
+        result = identify_enrolled_face(
+            submitted_photo_b64=photo_b64,
+            user_data_dir=cfg.user_data_dir,
+            tolerance=cfg.face_identify_tolerance,
+            options=get_face_pipeline_options("face_login"),
+            face_box=face_box,
+        )
+        if result.status != "success":
+            return None
+        euid = result.euid
 
-    # 2 Ensure reference image exists
-    ref_path = cfg.user_data_dir / "Student" / euid / "reference_image.jpg"
-    if not ref_path.exists():
+    # 1 Ensure student user exists (the same query loads their reference templates)
+    blobs = repository.get_student_face_templates(db, euid=euid, model=ENCODING_MODEL)
+    if blobs is None:
         return None
 
-    # 3 Perform face match
-    result = verify_face_match(
-        submitted_photo_b64=photo_b64,
-        reference_image_path=ref_path,
-    )
+    if not identified:
+        # 2 Ensure a reference exists (stored templates, or the reference image)
+        templates = templates_from_blobs(blobs)
+        ref_path = cfg.user_data_dir / "Student" / euid / "reference_image.jpg"
+        if templates is None and not ref_path.exists():
+            return None
+
+        # 3 Perform face match
+        result = verify_face_match(
+            submitted_photo_b64=photo_b64,
+            reference_image_path=ref_path,
+            tolerance=cfg.face_tolerance,
+            options=get_face_pipeline_options("face_login"),
+            face_box=face_box,
+            templates=templates,
+        )
 
-    if result.status != "success":
-        return None
+        if result.status != "success":
+            return None
 
     # 4 Issue token pair
     return issue_token_pair(
@@ -298,4 +353,33 @@ def face_login_student(
         role="student",
         cfg=cfg,
         db=db,
-    )
\ No newline at end of file
+    )
+
+
+def add_student_face_template(
+    *,
+    db: sqlite3.Connection,
+    cfg: Config,
+    euid: str,
+    photo_b64: str,
+    face_box: tuple[float, float, float, float] | None = None,
+) -> FaceTemplateResult:
+    """
+    Adds another reference capture for a student (must match their enrollment template).
+    The stored templates, the campus face index and the student's class rosters are
+    refreshed, since the student's search vector may have moved.
+    """
+    ref_path = cfg.user_data_dir / "Student" / euid / "reference_image.jpg"
+    result = add_reference_template(
+        photo_b64=photo_b64,
+        reference_image_path=ref_path,
+        tolerance=cfg.face_tolerance,
+        options=get_face_pipeline_options("enrollment"),
+        face_box=face_box,
+    )
+    if result.status == "success":
+        sync_face_templates(db, user_data_dir=cfg.user_data_dir, euid=euid)
+        db.commit()
+        update_face_index(user_data_dir=cfg.user_data_dir, euid=euid)
+        refresh_student_rosters(db, euid=euid, user_data_dir=cfg.user_data_dir)
+    return result
@@ -0,0 +1,287 @@
+from __future__ import annotations
+
+import logging
+import secrets
+import sqlite3
+import zipfile
+from collections import deque
+from collections.abc import Callable, Iterable, Iterator
+from concurrent.futures import Future
+from dataclasses import dataclass, replace
+from pathlib import Path, PurePosixPath
+
+from app.auth.password_utils import hash_password
+from app.db import repository
+from app.models.validation import validate_euid
+from app.services.face_pool import FacePoolBusy, get_face_pool
+from app.services.face_service import (
+    ENCODING_DIM,
+    ENCODING_MODEL,
+    StagedReference,
+    discard_staged_reference,
+    get_face_pipeline_options,
+    get_reference_crop_dim,
+    install_staged_reference,
+    prepare_reference_image,
+    reference_image_path,
+    stage_prepared_reference,
+    template_blobs,
+    update_face_index_many,
+)
+from app.services.roster_service import refresh_class_roster
+
+logger = logging.getLogger(__name__)
+
+PHOTO_SUFFIXES = {".jpg", ".jpeg", ".png"}
+MAX_PHOTO_BYTES = 4_000_000  # same cap as a base64 enrollment photo
+
+
+@dataclass(frozen=True)
+class RosterPhoto:
+    """
+    One <euid>.jpg entry of a roster archive or directory. read() loads it on demand, so
+    only the photos in flight are held in memory.
+    """
+
+    name: str
+    size: int
+    read: Callable[[], bytes]
+
+    @property
+    def euid(self) -> str | None:
+        try:
+            return validate_euid(PurePosixPath(self.name).stem)
+        except ValueError:
+            return None
+
+
+@dataclass(frozen=True)
+class BulkEnrollmentEntry:
+    file: str
+    euid: str | None
+    status: str  # "enrolled" | "error"
+    error: str | None = None
+    created: bool = False  # a new student account was created
+
+    def to_dict(self) -> dict:
+        return {
+            "file": self.file,
+            "euid": self.euid,
+            "status": self.status,
+            "error": self.error,
+            "created": self.created,
+        }
+
+
+@dataclass(frozen=True)
+class BulkEnrollmentResult:
+    status: str  # "success" | "error"
+    error: str | None = None
+    entries: tuple[BulkEnrollmentEntry, ...] = ()
+
+    @property
+    def enrolled(self) -> int:
+        return sum(e.status == "enrolled" for e in self.entries)
+
+    @property
+    def failed(self) -> int:
+        return sum(e.status != "enrolled" for e in self.entries)
+
+
+def _is_photo(name: str) -> bool:
+    path = PurePosixPath(name)
+    hidden = any(part.startswith(".") or part == "__MACOSX" for part in path.parts)
+    return not hidden and path.suffix.lower() in PHOTO_SUFFIXES
+
+
+def zip_roster_photos(archive: zipfile.ZipFile) -> Iterator[RosterPhoto]:
+    """
+    Photo entries of a zip archive (nested folders are fine; the file name is the euid).
+    Entries are decompressed one at a time, when read.
+    """
+    for info in archive.infolist():
+        if info.is_dir() or not _is_photo(info.filename):
+            continue
+        yield RosterPhoto(
+            name=PurePosixPath(info.filename).name,
+            size=info.file_size,
+            read=lambda info=info: _read_member(archive, info),
+        )
+
+
+def _read_member(archive: zipfile.ZipFile, info: zipfile.ZipInfo) -> bytes:
+    # The declared size was checked; never trust it for how much to inflate.
+    with archive.open(info) as f:
+        return f.read(MAX_PHOTO_BYTES + 1)
+
+
+def directory_roster_photos(directory: Path) -> Iterator[RosterPhoto]:
+    for path in sorted(directory.iterdir()):
+        if path.is_file() and _is_photo(path.name):
+            yield RosterPhoto(name=path.name, size=path.stat().st_size, read=path.read_bytes)
+
+
+def bulk_enroll_photos(
+    *,
+    db: sqlite3.Connection,
+    code: str,
+    photos: Iterable[RosterPhoto],
+    user_data_dir: Path,
+) -> BulkEnrollmentResult:
+    """
+    Enrolls a class roster from reference photos named <euid>.jpg.
+
+    Photos are normalized and encoded in the face pool, a few in flight at a time, and each
+    good one is staged next to the student's reference image. The student accounts, class
+    enrollments and face templates of every good photo are then committed in one
+    transaction, and only then do the staged files replace the previous references; if the
+    commit fails they are discarded. Photos that can't be used (bad name, duplicate, no
+    face, a professor's euid, ...) are reported per entry, in archive order, and don't block
+    the others. An existing student's reference is only replaced if they are already in
+    this class; otherwise any professor could swap in their own face for them.
+    """
+    if not repository.class_exists(db, code):
+        return BulkEnrollmentResult(status="error", error="Class not found")
+
+    pool = get_face_pool()
+    options = get_face_pipeline_options("enrollment")
+    crop_dim = get_reference_crop_dim()  # spawned workers don't see the configured value
+    window = max(1, pool.workers)
+    # (slot in entries, photo, euid, upload, job)
+    in_flight: deque[tuple[int, RosterPhoto, str, bytes, Future]] = deque()
+    entries: list[BulkEnrollmentEntry | None] = []  # archive order; None while in flight
+    ready: dict[str, StagedReference] = {}
+    seen: set[str] = set()
+    existing: set[str] = set()  # euids already enrolled in the class
+
+    def finish() -> None:
+        slot, photo, euid, data, fut = in_flight.popleft()
+        prepared = pool.result(fut)
+        if prepared.error:
+            entries[slot] = _rejected(photo, euid, prepared.error)
+            return
+        ready[euid] = stage_prepared_reference(
+            prepared=prepared,
+            dest_path=reference_image_path(user_data_dir, euid),
+            original=data,
+        )
+        entries[slot] = BulkEnrollmentEntry(file=photo.name, euid=euid, status="enrolled")
+
+    try:
+        for photo in photos:
+            euid = photo.euid
+            error = _precheck(photo, euid, seen)
+            if error is None:
+                role = repository.get_user_role(db, euid=euid)
+                if role is not None and role != "student":
+                    error = "euid belongs to a non-student account"
+                elif role is not None:
+                    if repository.student_is_enrolled(db, student_euid=euid, code=code):
+                        existing.add(euid)
+                    else:
+                        error = "Student is not enrolled in this class"
+            if error:
+                entries.append(_rejected(photo, euid, error))
+                continue
+            seen.add(euid)
+            try:
+                data = photo.read()
+            except (OSError, RuntimeError, zipfile.BadZipFile):  # corrupt or encrypted entry
+                entries.append(_rejected(photo, euid, "Unable to read photo"))
+                continue
+            if len(data) > MAX_PHOTO_BYTES:
+                entries.append(_rejected(photo, euid, "Photo is too large"))
+                continue
+
+            while True:
+                try:
+                    fut = pool.submit(prepare_reference_image, data, options, None, crop_dim)
+                    break
+                except FacePoolBusy:
+                    if not in_flight:
+                        raise  # the pool is saturated by other requests
+                    finish()
+            entries.append(None)
+            in_flight.append((len(entries) - 1, photo, euid, data, fut))
+            while len(in_flight) >= window:
+                finish()
+        while in_flight:
+            finish()
+
+        _commit_enrollments(
+            db, code=code, encodings={euid: s.prepared.encoding for euid, s in ready.items()}
+        )
+    except BaseException:
+        # Nothing was committed: the previous references stay as they were
+        for staged in ready.values():
+            discard_staged_reference(staged)
+        raise
+
+    for euid, staged in ready.items():
+        try:
+            install_staged_reference(staged)
+        except OSError:
+            # The templates are committed, so verification still works; re-enrolling the
+            # student replaces the reference image.
+            discard_staged_reference(staged)
+            logger.warning("reference image not installed | euid=%s", euid, exc_info=True)
+    created = set(ready) - existing
+    entries = [replace(e, created=e.euid in created) for e in entries]
+
+    if ready:
+        # Re-enrolled students' references changed in their other classes too
+        codes = {code}
+        for euid in existing & set(ready):
+            classes = repository.get_student_classes(db, student_euid=euid)
+            codes.update(row["code"] for row in classes)
+        for roster_code in sorted(codes):
+            refresh_class_roster(db, code=roster_code, user_data_dir=user_data_dir)
+        update_face_index_many(user_data_dir=user_data_dir, euids=list(ready))
+    logger.info(
+        "bulk enrollment | code=%s enrolled=%d failed=%d created=%d",
+        code,
+        len(ready),
+        len(entries) - len(ready),
+        len(created),
+    )
+    return BulkEnrollmentResult(status="success", entries=tuple(entries))
+
+
+def _precheck(photo: RosterPhoto, euid: str | None, seen: set[str]) -> str | None:
+    if euid is None:
+        return "File name is not a valid euid"
+    if euid in seen:
+        return "Duplicate photo for euid"
+    if photo.size > MAX_PHOTO_BYTES:
+        return "Photo is too large"
+    return None
+
+
+def _rejected(photo: RosterPhoto, euid: str | None, error: str) -> BulkEnrollmentEntry:
+    return BulkEnrollmentEntry(file=photo.name, euid=euid, status="error", error=error)
+
+
+def _commit_enrollments(db: sqlite3.Connection, *, code: str, encodings: dict[str, object]) -> None:
+    """
+    One transaction for every account, enrollment and template row.
+    """
+    if not encodings:
+        return
+    # Like /auth/enroll, students get an unusable password; one hash of a discarded secret
+    # covers the batch instead of one bcrypt round per student.
+    password_hash = hash_password(secrets.token_urlsafe(32))
+    try:
+        repository.create_student_users(db, euids=list(encodings), password_hash=password_hash)
+        for euid, encoding in encodings.items():
+            repository.enroll_student(db, code=code, student_euid=euid)
+            repository.replace_face_templates(
+                db,
+                euid=euid,
+                encodings=template_blobs(encoding),
+                dim=ENCODING_DIM,
+                model=ENCODING_MODEL,
+            )
+        db.commit()
+    except Exception:
+        db.rollback()
+        raise
@@ -0,0 +1,102 @@
+from __future__ import annotations
+
+import threading
+from collections import OrderedDict
+from collections.abc import Hashable
+from dataclasses import dataclass
+from typing import Any
+
+import numpy as np
+
+from app.services.encoding_quant import QuantizedEncodings
+
+
+@dataclass
+class _Entry:
+    version: Hashable
+    encoding: np.ndarray | QuantizedEncodings
+    nbytes: int
+
+
+class EncodingCache:
+    """
+    Thread-safe, bounded LRU cache of face encodings.
+
+    Entries are stored with a version token (e.g. the reference file's mtime/size). A lookup
+    with a different version is treated as a miss and drops the stale entry, so a
+    re-enrolled reference is picked up without any explicit coordination between workers.
+    Bounded both by entry count and by total encoding bytes; least recently used goes first.
+    Encodings may be stored quantized (QuantizedEncodings), which stretches the byte budget.
+    """
+
+    def __init__(self, *, max_entries: int, max_bytes: int):
+        self.max_entries = max(0, int(max_entries))
+        self.max_bytes = max(0, int(max_bytes))
+        self._entries: OrderedDict[str, _Entry] = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.invalidations = 0
+
+    def get(self, key: str, version: Hashable) -> np.ndarray | QuantizedEncodings | None:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            if entry.version != version:
+                self._drop(key)
+                self.invalidations += 1
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry.encoding
+
+    def put(self, key: str, version: Hashable, encoding: np.ndarray | QuantizedEncodings) -> None:
+        if not isinstance(encoding, QuantizedEncodings):  # those are read-only already
+            encoding = np.asarray(encoding)
+            encoding.setflags(write=False)  # shared across requests; keep it immutable
+        nbytes = int(encoding.nbytes)
+        if self.max_entries == 0 or nbytes > self.max_bytes:
+            return
+
+        with self._lock:
+            if key in self._entries:
+                self._drop(key)
+            self._entries[key] = _Entry(version=version, encoding=encoding, nbytes=nbytes)
+            self._bytes += nbytes
+            while len(self._entries) > self.max_entries or self._bytes > self.max_bytes:
+                oldest = next(iter(self._entries))
+                self._drop(oldest)
+                self.evictions += 1
+
+    def invalidate(self, key: str) -> None:
+        with self._lock:
+            if key in self._entries:
+                self._drop(key)
+                self.invalidations += 1
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+            self._bytes = 0
+
+    def stats(self) -> dict[str, Any]:
+        with self._lock:
+            return {
+                "entries": len(self._entries),
+                "bytes": self._bytes,
+                "max_entries": self.max_entries,
+                "max_bytes": self.max_bytes,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "invalidations": self.invalidations,
+            }
+
+    def _drop(self, key: str) -> None:
+        entry = self._entries.pop(key)
+        self._bytes -= entry.nbytes
@@ -0,0 +1,154 @@
+from __future__ import annotations
+
+from typing import Any
+
+import numpy as np
+
+# Storage types for face encodings. float64 keeps them as they come out of the encoder.
+ENCODING_DTYPES = ("float64", "float32", "float16", "int8")
+
+# Rows dequantized per step in distance computations; bounds the float32 scratch buffer.
+_CHUNK_ROWS = 4096
+
+
+class QuantizedEncodings:
+    """
+    N x D face encodings held compactly: float32/float16, or int8 with one scale per row
+    (symmetric, row = q * scale). int8 takes 1/8 of float64 for a ~0.01 distance error.
+
+    Behaves like a read-only float matrix where the face code needs one: shape, len, row
+    indexing (dequantized) and the distance helpers. Distances never materialize the
+    dequantized matrix; rows are widened a chunk at a time and the scale is applied to the
+    dot products:
+        |s*q - p|^2 = s^2 |q|^2 - 2 s (q . p) + |p|^2
+    with s^2 |q|^2 precomputed per row.
+    """
+
+    def __init__(self, data: np.ndarray, scale: np.ndarray | None = None):
+        if data.ndim != 2:
+            raise ValueError(f"encodings must be a matrix, got shape {data.shape}")
+        if (scale is None) != (data.dtype != np.int8):
+            raise ValueError("int8 encodings need a per-row scale (and only int8 does)")
+        self.data = data
+        self.scale = None if scale is None else np.asarray(scale, dtype=np.float32).reshape(-1)
+        self.data.setflags(write=False)
+
+        # Chunked, so a memory-mapped matrix is never copied whole into memory.
+        sq_norms = np.empty(len(data), dtype=np.float64)
+        for start in range(0, len(data), _CHUNK_ROWS):
+            wide = data[start : start + _CHUNK_ROWS].astype(np.float64)
+            sq_norms[start : start + len(wide)] = np.einsum("ij,ij->i", wide, wide)
+        if self.scale is not None:
+            sq_norms *= self.scale.astype(np.float64) ** 2
+        self._sq_norms = sq_norms
+
+    @classmethod
+    def from_float(cls, matrix, dtype: str) -> QuantizedEncodings:
+        matrix = np.asarray(matrix, dtype=np.float64)
+        if matrix.ndim == 1:
+            matrix = matrix[None, :]
+        if dtype in ("float32", "float16"):
+            return cls(matrix.astype(dtype))
+        if dtype != "int8":
+            raise ValueError(f"Unsupported quantized dtype: {dtype}")
+
+        peak = np.abs(matrix).max(axis=1) if matrix.size else np.zeros(len(matrix))
+        scale = np.where(peak > 0, peak / 127.0, 1.0)
+        data = np.clip(np.rint(matrix / scale[:, None]), -127, 127).astype(np.int8)
+        return cls(data, scale.astype(np.float32))
+
+    @property
+    def dtype(self) -> str:
+        return self.data.dtype.name
+
+    @property
+    def shape(self) -> tuple[int, int]:
+        return self.data.shape
+
+    @property
+    def size(self) -> int:
+        return self.data.size
+
+    @property
+    def nbytes(self) -> int:
+        scale_bytes = 0 if self.scale is None else self.scale.nbytes
+        return int(self.data.nbytes + scale_bytes + self._sq_norms.nbytes)
+
+    def __len__(self) -> int:
+        return len(self.data)
+
+    def __getitem__(self, rows) -> np.ndarray:
+        out = self.data[rows].astype(np.float64)
+        if self.scale is not None:
+            scale = self.scale[rows].astype(np.float64)
+            out = out * (scale[..., None] if out.ndim == 2 else scale)
+        return out
+
+    def dequantize(self) -> np.ndarray:
+        return self[:]
+
+    def distances(self, probe) -> np.ndarray:
+        """
+        Euclidean distance from probe to every row.
+        """
+        probe = np.asarray(probe, dtype=np.float64).reshape(-1)
+        return self.pairwise(probe[None, :])[0]
+
+    def pairwise(self, probes) -> np.ndarray:
+        """
+        probes x rows Euclidean distance matrix.
+        """
+        probes = np.asarray(probes, dtype=np.float64)
+        probes32 = probes.astype(np.float32)
+        dots = np.empty((len(self.data), len(probes)), dtype=np.float64)
+        for start in range(0, len(self.data), _CHUNK_ROWS):
+            chunk = self.data[start : start + _CHUNK_ROWS].astype(np.float32)
+            dots[start : start + len(chunk)] = chunk @ probes32.T
+        if self.scale is not None:
+            dots *= self.scale[:, None]
+
+        sq = self._sq_norms[:, None] + np.einsum("ij,ij->i", probes, probes)[None, :] - 2.0 * dots
+        return np.sqrt(np.maximum(sq, 0.0)).T
+
+    def to_arrays(self) -> dict[str, np.ndarray]:
+        """
+        Arrays for np.savez; see encodings_from_arrays.
+        """
+        arrays = {"encodings": self.data}
+        if self.scale is not None:
+            arrays["scale"] = self.scale
+        return arrays
+
+
+def quantize_encodings(matrix, dtype: str) -> np.ndarray | QuantizedEncodings:
+    """
+    Stores matrix (N x D) as dtype. float64 returns a plain read-only float64 matrix.
+    """
+    if dtype not in ENCODING_DTYPES:
+        raise ValueError(f"Unknown encoding dtype: {dtype}")
+    if dtype == "float64":
+        matrix = np.array(matrix, dtype=np.float64)
+        matrix.setflags(write=False)
+        return matrix
+    return QuantizedEncodings.from_float(matrix, dtype)
+
+
+def encoding_arrays(encodings: np.ndarray | QuantizedEncodings) -> dict[str, Any]:
+    """
+    The arrays to persist for encodings (a float matrix or QuantizedEncodings).
+    """
+    if isinstance(encodings, QuantizedEncodings):
+        return encodings.to_arrays()
+    return {"encodings": np.asarray(encodings)}
+
+
+def encodings_from_arrays(data: np.ndarray, scale: np.ndarray | None = None) -> np.ndarray:
+    """
+    Inverse of encoding_arrays: returns the stored encodings as a float64 matrix.
+    """
+    data = np.asarray(data)
+    if data.dtype == np.int8:
+        if scale is None:
+            raise ValueError("int8 encodings stored without a scale")
+        return QuantizedEncodings(data, scale).dequantize()
+    return data.astype(np.float64)
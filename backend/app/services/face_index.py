@@ -0,0 +1,362 @@
+from __future__ import annotations
+
+import json
+import logging
+import os
+import threading
+import time
+from collections.abc import Iterator
+from contextlib import contextmanager
+from pathlib import Path
+
+import numpy as np
+
+from app.services.encoding_quant import encoding_arrays, encodings_from_arrays, quantize_encodings
+from app.services.file_lock import file_lock
+
+logger = logging.getLogger(__name__)
+
+FACE_INDEX_FILENAME = "face_index.npz"
+FACE_INDEX_FORMAT_VERSION = 2
+_READABLE_FORMAT_VERSIONS = (1, 2)  # v1: float32 vectors only
+
+DEFAULT_NPROBE = 8
+DEFAULT_MIN_TRAIN_SIZE = 1024
+_KMEANS_ITERATIONS = 12
+
+
+class FaceIndex:
+    """
+    On-disk k-NN index over every student's reference encoding (IVF style).
+
+    Encodings are partitioned into ~sqrt(N) k-means cells. A query ranks the cell centroids
+    and scans only the nprobe closest cells, so it touches roughly nprobe * sqrt(N) vectors
+    instead of N. Below min_train_size the index is a flat (exact) scan.
+
+    - upsert/remove are incremental: a new vector joins its nearest cell. The cells are
+      retrained when the population has doubled or halved since the last training.
+    - State lives in one .npz next to the student folders and is replaced atomically.
+      Vectors are float32 in memory and stored on disk as dtype (float32, float16 or int8).
+      Every operation re-stats the file and reloads if another worker changed it;
+      mutations hold a lock file so concurrent enrollments don't drop each other's writes.
+    """
+
+    def __init__(
+        self,
+        path: Path,
+        *,
+        dim: int,
+        nprobe: int = DEFAULT_NPROBE,
+        min_train_size: int = DEFAULT_MIN_TRAIN_SIZE,
+        dtype: str = "float32",
+    ):
+        if dtype not in ("float32", "float16", "int8"):
+            raise ValueError(f"Unsupported face index dtype: {dtype}")
+        self.path = Path(path)
+        self.dim = int(dim)
+        self.dtype = dtype
+        self.nprobe = max(1, int(nprobe))
+        self.min_train_size = max(1, int(min_train_size))
+        self._lock = threading.RLock()
+        self._file_version: tuple[int, int, int] | None = None
+        self._reset()
+
+    # -------------------------
+    # Queries
+    # -------------------------
+
+    def __len__(self) -> int:
+        with self._lock:
+            self._refresh()
+            return len(self._euids)
+
+    def __contains__(self, euid: str) -> bool:
+        with self._lock:
+            self._refresh()
+            return euid in self._positions
+
+    @property
+    def exists(self) -> bool:
+        return self.path.exists()
+
+    def search(self, probe: np.ndarray, k: int = 1) -> list[tuple[str, float]]:
+        """
+        Returns up to k (euid, distance) pairs, closest first.
+        """
+        probe = np.asarray(probe, dtype=np.float32).reshape(-1)
+        with self._lock:
+            self._refresh()
+            if not self._euids:
+                return []
+            candidates = self._candidates(probe)
+            vectors = self._vectors[candidates]
+            euids = self._euids
+
+        distances = np.linalg.norm(vectors - probe, axis=1)
+        k = min(int(k), len(distances))
+        top = np.argpartition(distances, k - 1)[:k] if k < len(distances) else np.arange(k)
+        top = top[np.argsort(distances[top], kind="stable")]
+        return [(euids[candidates[i]], float(distances[i])) for i in top]
+
+    def _candidates(self, probe: np.ndarray) -> np.ndarray:
+        if self._centroids is None:
+            return np.arange(len(self._euids))
+        if self._cells is None:
+            order = np.argsort(self._assign, kind="stable")
+            bounds = np.searchsorted(self._assign[order], np.arange(len(self._centroids) + 1))
+            self._cells = [order[bounds[c] : bounds[c + 1]] for c in range(len(self._centroids))]
+
+        cell_distances = np.linalg.norm(self._centroids - probe, axis=1)
+        nprobe = min(self.nprobe, len(cell_distances))
+        probed = np.argpartition(cell_distances, nprobe - 1)[:nprobe]
+        return np.concatenate([self._cells[c] for c in probed])
+
+    # -------------------------
+    # Mutations
+    # -------------------------
+
+    def upsert(self, euid: str, encoding: np.ndarray) -> None:
+        self.upsert_many({euid: encoding})
+
+    def upsert_many(self, entries: dict[str, np.ndarray]) -> None:
+        """
+        Adds or replaces several entries with one load and one save of the index file.
+        """
+        vectors = {}
+        for euid, encoding in entries.items():
+            vec = np.asarray(encoding, dtype=np.float32).reshape(-1)
+            if vec.shape != (self.dim,):
+                raise ValueError(f"encoding must have {self.dim} dimensions, got {vec.shape}")
+            vectors[euid] = vec
+        if not vectors:
+            return
+
+        with self._mutating():
+            added: list[np.ndarray] = []
+            added_cells: list[int] = []
+            for euid, vec in vectors.items():
+                pos = self._positions.get(euid)
+                cell = self._nearest_cell(vec)
+                if pos is None:
+                    self._euids.append(euid)
+                    self._positions[euid] = len(self._euids) - 1
+                    added.append(vec)
+                    added_cells.append(cell)
+                else:
+                    self._vectors[pos] = vec
+                    self._assign[pos] = cell
+            if added:
+                self._vectors = np.vstack([self._vectors, np.stack(added)])
+                self._assign = np.append(self._assign, np.asarray(added_cells, dtype=np.int32))
+
+    def remove(self, euid: str) -> bool:
+        with self._mutating():
+            pos = self._positions.get(euid)
+            if pos is None:
+                return False
+            del self._euids[pos]
+            self._vectors = np.delete(self._vectors, pos, axis=0)
+            self._assign = np.delete(self._assign, pos)
+            self._positions = {e: i for i, e in enumerate(self._euids)}
+            return True
+
+    def rebuild(self, entries: dict[str, np.ndarray]) -> None:
+        """
+        Replaces the whole index (e.g. from the reference sidecars) and retrains the cells.
+        """
+        with self._mutating(load=False):
+            self._reset()
+            if entries:
+                self._euids = list(entries)
+                self._positions = {e: i for i, e in enumerate(self._euids)}
+                self._vectors = np.stack(
+                    [
+                        np.asarray(entries[e], dtype=np.float32).reshape(self.dim)
+                        for e in self._euids
+                    ]
+                )
+                self._assign = np.zeros(len(self._euids), dtype=np.int32)
+
+    @contextmanager
+    def _mutating(self, *, load: bool = True) -> Iterator[None]:
+        with self._lock, file_lock(self.path.with_name(self.path.name + ".lock")):
+            if load:
+                self._refresh()
+            yield
+            self._maybe_train()
+            self._cells = None
+            self._save()
+
+    def _nearest_cell(self, vec: np.ndarray) -> int:
+        if self._centroids is None:
+            return 0
+        return int(np.argmin(np.linalg.norm(self._centroids - vec, axis=1)))
+
+    def _maybe_train(self) -> None:
+        n = len(self._euids)
+        if n < self.min_train_size:
+            self._centroids = None
+            self._assign = np.zeros(n, dtype=np.int32)
+            self._trained_size = 0
+            return
+        if self._centroids is not None and self._trained_size / 2 <= n <= self._trained_size * 2:
+            return
+
+        started = time.perf_counter()
+        self._centroids, self._assign = _kmeans(self._vectors, int(np.sqrt(n)))
+        self._trained_size = n
+        logger.info(
+            "face index trained | size=%d cells=%d took_ms=%.1f",
+            n,
+            len(self._centroids),
+            (time.perf_counter() - started) * 1000.0,
+        )
+
+    # -------------------------
+    # Persistence
+    # -------------------------
+
+    def _reset(self) -> None:
+        self._euids: list[str] = []
+        self._positions: dict[str, int] = {}
+        self._vectors = np.empty((0, self.dim), dtype=np.float32)
+        self._assign = np.empty(0, dtype=np.int32)
+        self._centroids: np.ndarray | None = None
+        self._cells: list[np.ndarray] | None = None
+        self._trained_size = 0
+
+    def _refresh(self) -> None:
+        try:
+            st = self.path.stat()
+        except OSError:
+            if self._file_version is not None:
+                self._file_version = None
+                self._reset()
+            return
+
+        version = (st.st_mtime_ns, st.st_size, st.st_ino)
+        if version == self._file_version:
+            return
+        try:
+            self._load()
+        except Exception:
+            logger.warning("face index unreadable, ignoring | path=%s", self.path, exc_info=True)
+            self._reset()
+        self._file_version = version
+
+    def _load(self) -> None:
+        with np.load(self.path, allow_pickle=False) as data:
+            meta = json.loads(str(data["meta"]))
+            if meta.get("version") not in _READABLE_FORMAT_VERSIONS or meta.get("dim") != self.dim:
+                raise ValueError(f"face index format mismatch: {meta}")
+            euids = [str(e) for e in data["euids"]]
+            scale = data["vectors_scale"] if "vectors_scale" in data.files else None
+            vectors = encodings_from_arrays(data["vectors"], scale).astype(np.float32)
+            assign = np.array(data["assign"], dtype=np.int32)
+            centroids = np.array(data["centroids"], dtype=np.float32)
+
+        self._reset()
+        self._euids = euids
+        self._positions = {e: i for i, e in enumerate(euids)}
+        self._vectors = vectors.reshape(len(euids), self.dim)
+        self._assign = assign
+        self._centroids = centroids if len(centroids) else None
+        self._trained_size = int(meta.get("trained_size", 0))
+
+    def _save(self) -> None:
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        centroids = self._centroids
+        if centroids is None:
+            centroids = np.empty((0, self.dim), dtype=np.float32)
+        meta = {
+            "version": FACE_INDEX_FORMAT_VERSION,
+            "dim": self.dim,
+            "dtype": self.dtype,
+            "trained_size": self._trained_size,
+        }
+        stored = self._vectors
+        if self.dtype != "float32" and len(stored):
+            stored = quantize_encodings(stored, self.dtype)
+        arrays = encoding_arrays(stored)
+        vectors = {"vectors": arrays["encodings"]}
+        if "scale" in arrays:
+            vectors["vectors_scale"] = arrays["scale"]
+
+        tmp = self.path.with_name(f".{self.path.name}.{os.getpid()}.tmp")
+        with tmp.open("wb") as f:
+            np.savez(
+                f,
+                euids=np.array(self._euids, dtype=str),
+                **vectors,
+                assign=self._assign,
+                centroids=centroids,
+                meta=np.array(json.dumps(meta)),
+            )
+        os.replace(tmp, self.path)
+        st = self.path.stat()
+        self._file_version = (st.st_mtime_ns, st.st_size, st.st_ino)
+
+
+def _kmeans(vectors: np.ndarray, k: int, *, seed: int = 0) -> tuple[np.ndarray, np.ndarray]:
+    """
+    Plain Lloyd iterations. Empty cells are reseeded from the points farthest from their
+    centroid. Returns (centroids, assignment).
+    """
+    rng = np.random.default_rng(seed)
+    k = max(1, min(k, len(vectors)))
+    centroids = vectors[rng.choice(len(vectors), size=k, replace=False)].copy()
+    sq_norms = np.einsum("ij,ij->i", vectors, vectors)
+
+    assign = np.zeros(len(vectors), dtype=np.int32)
+    for _ in range(_KMEANS_ITERATIONS):
+        # |x - c|^2 without the |x|^2 term, which doesn't change the argmin
+        scores = np.einsum("ij,ij->i", centroids, centroids)[None, :] - 2.0 * (
+            vectors @ centroids.T
+        )
+        assign = np.argmin(scores, axis=1).astype(np.int32)
+
+        counts = np.bincount(assign, minlength=k)
+        sums = np.zeros_like(centroids)
+        np.add.at(sums, assign, vectors)
+        nonempty = counts > 0
+        centroids[nonempty] = sums[nonempty] / counts[nonempty, None]
+
+        empty = np.flatnonzero(~nonempty)
+        if len(empty):
+            residual = sq_norms + scores[np.arange(len(vectors)), assign]
+            far = np.argsort(residual)[::-1][: len(empty)]
+            centroids[empty] = vectors[far]
+            assign[far] = empty
+    return centroids, assign
+
+
+_indexes: dict[Path, FaceIndex] = {}
+_indexes_lock = threading.Lock()
+_nprobe = DEFAULT_NPROBE
+_min_train_size = DEFAULT_MIN_TRAIN_SIZE
+_dtype = "float32"
+
+
+def configure_face_index(*, nprobe: int, min_train_size: int, dtype: str = "float32") -> None:
+    """
+    Sets the search parameters and on-disk vector type.
+    Called once from create_app with values from Config.
+    """
+    global _nprobe, _min_train_size, _dtype
+    with _indexes_lock:
+        _nprobe = nprobe
+        _min_train_size = min_train_size
+        _dtype = dtype
+        _indexes.clear()
+
+
+def get_face_index(user_data_dir: Path, *, dim: int) -> FaceIndex:
+    path = Path(user_data_dir) / FACE_INDEX_FILENAME
+    with _indexes_lock:
+        index = _indexes.get(path)
+        if index is None:
+            index = FaceIndex(
+                path, dim=dim, nprobe=_nprobe, min_train_size=_min_train_size, dtype=_dtype
+            )
+            _indexes[path] = index
+        return index
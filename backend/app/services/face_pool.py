@@ -0,0 +1,251 @@
+from __future__ import annotations
+
+import functools
+import logging
+import multiprocessing
+import threading
+from collections.abc import Callable
+from concurrent.futures import Executor, Future, ProcessPoolExecutor, wait
+from concurrent.futures import TimeoutError as FutureTimeoutError
+from concurrent.futures.process import BrokenProcessPool
+from typing import Any
+
+logger = logging.getLogger(__name__)
+
+
+class FacePoolError(Exception):
+    """
+    Base class for face pool capacity errors. Routes map these to HTTP responses
+    carrying a Retry-After hint.
+    """
+
+    status_code = 503
+
+    def __init__(self, message: str, *, retry_after: int):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+
+class FacePoolBusy(FacePoolError):
+    """Raised when every worker is busy and the submission queue is full."""
+
+    status_code = 429
+
+
+class FacePoolTimeout(FacePoolError):
+    """Raised when a job misses its deadline."""
+
+    status_code = 503
+
+
+class FacePoolBroken(FacePoolError):
+    """
+    Raised when a worker died and took the pool's executor down with it. The broken
+    executor is dropped, so the next submission starts a fresh one.
+    """
+
+    status_code = 503
+
+
+def _init_worker() -> None:
+    # Pay the dlib import/model load once per worker instead of on the first job.
+    try:
+        import face_recognition  # noqa: F401
+    except Exception:
+        logger.warning("face worker could not preload face_recognition", exc_info=True)
+
+
+def _noop() -> None:
+    return None
+
+
+class FacePool:
+    """
+    Runs CPU-heavy face jobs off the HTTP threads.
+
+    - workers=0 runs jobs inline on the calling thread (dev/tests).
+    - At most workers + max_queue jobs are admitted; beyond that submit() raises
+      FacePoolBusy immediately instead of tying up another request thread.
+    - run() waits up to timeout_seconds for a result, then raises FacePoolTimeout.
+      The slot is released when the job actually finishes, so a stuck job keeps
+      counting against capacity.
+    - If a worker dies, its jobs raise FacePoolBroken and the next submit() starts a new
+      executor instead of failing against the broken one forever.
+    """
+
+    def __init__(
+        self,
+        *,
+        workers: int,
+        max_queue: int,
+        timeout_seconds: float,
+        retry_after_seconds: int = 2,
+        executor_factory: Callable[[int], Executor] | None = None,
+        initializer: Callable[..., None] | None = None,
+        initargs: tuple = (),
+    ):
+        self.workers = max(0, int(workers))
+        self.max_queue = max(0, int(max_queue))
+        self.timeout_seconds = float(timeout_seconds)
+        self.retry_after_seconds = int(retry_after_seconds)
+        self._executor_factory = executor_factory or functools.partial(
+            _process_executor, initializer=initializer or _init_worker, initargs=initargs
+        )
+        self._executor: Executor | None = None
+        self._executor_lock = threading.Lock()
+        self._slots = threading.BoundedSemaphore(self.workers + self.max_queue or 1)
+        self._stats_lock = threading.Lock()
+        self._stats = {"submitted": 0, "completed": 0, "rejected": 0, "timeouts": 0, "broken": 0}
+
+    @property
+    def inline(self) -> bool:
+        return self.workers == 0
+
+    def submit(self, fn: Callable[..., Any], *args: Any) -> Future:
+        if self.inline:
+            fut: Future = Future()
+            try:
+                fut.set_result(fn(*args))
+            except BaseException as e:
+                fut.set_exception(e)
+            return fut
+
+        if not self._slots.acquire(blocking=False):
+            self._bump("rejected")
+            raise FacePoolBusy("Face verification busy", retry_after=self.retry_after_seconds)
+
+        try:
+            fut = self._submit(fn, *args)
+        except BaseException:
+            self._slots.release()
+            raise
+        self._bump("submitted")
+        return fut
+
+    def result(self, fut: Future) -> Any:
+        try:
+            return fut.result(timeout=None if self.inline else self.timeout_seconds)
+        except BrokenProcessPool as e:
+            raise self._broken() from e
+        except FutureTimeoutError as e:
+            fut.cancel()  # only helps if still queued; a running job finishes in the background
+            self._bump("timeouts")
+            raise FacePoolTimeout(
+                "Face verification timed out", retry_after=self.retry_after_seconds
+            ) from e
+
+    def run(self, fn: Callable[..., Any], *args: Any) -> Any:
+        return self.result(self.submit(fn, *args))
+
+    def prestart(self, *, timeout_seconds: float) -> bool:
+        """
+        Spawns every worker now (running its initializer) instead of on the first requests.
+        Submitting one no-op per worker back to back spawns them all, since none is idle yet.
+        Returns False if the workers weren't all up within timeout_seconds.
+        """
+        if self.inline:
+            return True
+        executor = self._get_executor()
+        futures = [executor.submit(_noop) for _ in range(self.workers)]
+        done, not_done = wait(futures, timeout=timeout_seconds)
+        return not not_done and all(f.exception() is None for f in done)
+
+    def stats(self) -> dict[str, Any]:
+        with self._stats_lock:
+            return {
+                "workers": self.workers,
+                "max_queue": self.max_queue,
+                "timeout_seconds": self.timeout_seconds,
+                **self._stats,
+            }
+
+    def shutdown(self, *, wait: bool = True) -> None:
+        with self._executor_lock:
+            if self._executor is not None:
+                self._executor.shutdown(wait=wait, cancel_futures=True)
+                self._executor = None
+
+    def _get_executor(self) -> Executor:
+        with self._executor_lock:
+            if self._executor is None:
+                self._executor = self._executor_factory(self.workers)
+            return self._executor
+
+    def _submit(self, fn: Callable[..., Any], *args: Any) -> Future:
+        executor = self._get_executor()
+        try:
+            fut = executor.submit(fn, *args)
+        except BrokenProcessPool:
+            # The job that broke it may not have run its done callback yet
+            self._discard_executor(executor)
+            executor = self._get_executor()
+            fut = executor.submit(fn, *args)
+        fut.add_done_callback(functools.partial(self._on_done, executor))
+        return fut
+
+    def _discard_executor(self, executor: Executor) -> None:
+        with self._executor_lock:
+            if self._executor is not executor:
+                return  # already replaced
+            self._executor = None
+        logger.warning("face pool broken (a worker died); starting a new one on next job")
+        executor.shutdown(wait=False, cancel_futures=True)
+
+    def _broken(self) -> FacePoolBroken:
+        self._bump("broken")
+        return FacePoolBroken("Face verification unavailable", retry_after=self.retry_after_seconds)
+
+    def _on_done(self, executor: Executor, fut: Future) -> None:
+        self._slots.release()
+        self._bump("completed")
+        if not fut.cancelled() and isinstance(fut.exception(), BrokenProcessPool):
+            self._discard_executor(executor)
+
+    def _bump(self, name: str) -> None:
+        with self._stats_lock:
+            self._stats[name] += 1
+
+
+def _process_executor(
+    workers: int, *, initializer: Callable[..., None], initargs: tuple = ()
+) -> Executor:
+    # spawn: forking a multi-threaded waitress process (and dlib state) is not safe.
+    return ProcessPoolExecutor(
+        max_workers=workers,
+        mp_context=multiprocessing.get_context("spawn"),
+        initializer=initializer,
+        initargs=initargs,
+    )
+
+
+_pool = FacePool(workers=0, max_queue=0, timeout_seconds=30.0)
+
+
+def configure_face_pool(
+    *,
+    workers: int,
+    max_queue: int,
+    timeout_seconds: float,
+    retry_after_seconds: int,
+    initializer: Callable[..., None] | None = None,
+    initargs: tuple = (),
+) -> FacePool:
+    """
+    Replaces the process-wide face pool. Called once from create_app with values from Config.
+    """
+    global _pool
+    old = _pool
+    _pool = FacePool(
+        workers=workers,
+        max_queue=max_queue,
+        timeout_seconds=timeout_seconds,
+        retry_after_seconds=retry_after_seconds,
+        initializer=initializer,
+        initargs=initargs,
+    )
+    old.shutdown(wait=False)
+    return _pool
+
+
+def get_face_pool() -> FacePool:
+    return _pool
@@ -1,13 +1,145 @@
 from __future__ import annotations
 
 import base64
+import hashlib
 import io
-from dataclasses import dataclass
+import json
+import logging
+import math
+import os
+import threading
+import time
+from collections.abc import Callable
+from dataclasses import dataclass, field, replace
+from datetime import UTC, datetime
 from pathlib import Path
-from io import BytesIO
+from typing import Any, Protocol, runtime_checkable
 
+import numpy as np
 from PIL import Image, ImageOps
 
+from app.services.encoding_cache import EncodingCache
+from app.services.encoding_quant import (
+    ENCODING_DTYPES,
+    QuantizedEncodings,
+    encoding_arrays,
+    encodings_from_arrays,
+    quantize_encodings,
+)
+from app.services.face_index import FaceIndex, get_face_index
+from app.services.face_pool import FacePoolBusy, FacePoolError, get_face_pool
+from app.services.result_cache import ResultCache
+
+logger = logging.getLogger(__name__)
+
+# Sidecar holding the student's reference templates (precomputed encodings), stored next to
+# reference_image.jpg. Row 0 is the enrollment photo; later rows were added by the student.
+# Bump ENCODING_FORMAT_VERSION whenever the on-disk layout changes; bump ENCODING_MODEL if the
+# encoder changes. Either mismatch marks existing sidecars stale.
+REFERENCE_ENCODING_FILENAME = "reference_encoding.npz"
+ENCODING_FORMAT_VERSION = 3
+# v1: a single "encoding" vector; v2: "encodings" matrix; v3: stored as meta["dtype"]
+_READABLE_FORMAT_VERSIONS = (1, 2, 3)
+ENCODING_MODEL = "dlib_face_recognition_resnet_model_v1"
+ENCODING_DIM = 128
+
+DEFAULT_MAX_TEMPLATES = 5
+_max_templates = DEFAULT_MAX_TEMPLATES
+_template_centroid = True
+
+# How encodings are stored in sidecars, the reference cache and roster matrices
+# (see encoding_quant). Callers always get float64 back, except from roster matrices.
+_encoding_dtype = "float64"
+
+DEFAULT_CACHE_MAX_ENTRIES = 4096
+DEFAULT_CACHE_MAX_BYTES = 16 * 1024 * 1024
+
+# Process-wide cache of reference encodings (one entry per student reference image).
+_reference_cache = EncodingCache(
+    max_entries=DEFAULT_CACHE_MAX_ENTRIES, max_bytes=DEFAULT_CACHE_MAX_BYTES
+)
+
+
+def configure_reference_cache(*, max_entries: int, max_bytes: int) -> None:
+    """
+    Replaces the reference encoding cache with one using the given budget.
+    Called once from create_app with values from Config.
+    """
+    global _reference_cache
+    _reference_cache = EncodingCache(max_entries=max_entries, max_bytes=max_bytes)
+
+
+def reference_cache_stats() -> dict:
+    return _reference_cache.stats()
+
+
+def configure_encoding_storage(dtype: str) -> None:
+    """
+    Sets the storage type for encodings: float64 | float32 | float16 | int8.
+    Called once from create_app with values from Config.
+    """
+    global _encoding_dtype
+    if dtype not in ENCODING_DTYPES:
+        raise ValueError(f"Unknown encoding dtype: {dtype!r} (expected one of {ENCODING_DTYPES})")
+    _encoding_dtype = dtype
+
+
+def get_encoding_dtype() -> str:
+    return _encoding_dtype
+
+
+def configure_reference_templates(*, max_templates: int, centroid: bool) -> None:
+    """
+    Sets the per-student template cap and whether the templates' centroid takes part in
+    matching. Called once from create_app with values from Config.
+    """
+    global _max_templates, _template_centroid
+    _max_templates = max(1, int(max_templates))
+    _template_centroid = bool(centroid)
+
+
+# Enrollment stores a square face crop (bounded to this size) as the reference; 0 keeps the
+# whole (bounded) frame. The original upload can also be archived outside user_data_dir.
+DEFAULT_REFERENCE_CROP_DIM = 400
+_reference_crop_dim = DEFAULT_REFERENCE_CROP_DIM
+_reference_archive_dir: Path | None = None
+
+
+def configure_reference_storage(*, crop_dim: int, archive_dir: Path | None) -> None:
+    """
+    Sets the reference crop size and the full-frame archive location (None: no archive).
+    Called once from create_app with values from Config.
+    """
+    global _reference_crop_dim, _reference_archive_dir
+    _reference_crop_dim = max(0, int(crop_dim))
+    _reference_archive_dir = archive_dir
+
+
+def get_reference_crop_dim() -> int:
+    return _reference_crop_dim
+
+
+DEFAULT_MATCH_CACHE_MAX_ENTRIES = 1024
+DEFAULT_MATCH_CACHE_TTL_SECONDS = 120.0
+
+# Short-lived cache of 1:1 verification outcomes, so a client retrying with the identical
+# photo doesn't run decode/detect/encode again.
+_match_cache = ResultCache(
+    max_entries=DEFAULT_MATCH_CACHE_MAX_ENTRIES, ttl_seconds=DEFAULT_MATCH_CACHE_TTL_SECONDS
+)
+
+
+def configure_match_cache(*, max_entries: int, ttl_seconds: float) -> None:
+    """
+    Replaces the verification result cache. Called once from create_app with values from Config.
+    """
+    global _match_cache
+    _match_cache = ResultCache(max_entries=max_entries, ttl_seconds=ttl_seconds)
+
+
+def match_cache_stats() -> dict:
+    return _match_cache.stats()
+
 
 def _fr():
     """
@@ -19,13 +151,371 @@ def _fr():
     return face_recognition
 
 
+# (top, right, bottom, left) in pixels, the face_recognition convention.
+FaceBox = tuple[int, int, int, int]
+
+
+@runtime_checkable
+class FaceBackend(Protocol):
+    """
+    Face engine behind the pipeline. Images are HxWx3 uint8 RGB arrays.
+    encode() with boxes=None detects with the backend's default detector first.
+    """
+
+    name: str
+
+    def load_image(self, file) -> np.ndarray: ...
+
+    def detect(
+        self, image: np.ndarray, *, upsample: int = 1, model: str = "hog"
+    ) -> list[FaceBox]: ...
+
+    def encode(
+        self,
+        image: np.ndarray,
+        boxes: list[FaceBox] | None = None,
+        *,
+        num_jitters: int = 1,
+        model: str = "small",
+    ) -> list[np.ndarray]: ...
+
+    def compare(self, known: list, candidate, *, tolerance: float) -> list[bool]: ...
+
+    def warm_up(self) -> None: ...
+
+
+class DlibBackend:
+    """
+    face_recognition (dlib HOG/CNN detectors + ResNet encoder).
+    The module is resolved through _fr() on every call, so the import stays lazy.
+    """
+
+    name = "dlib"
+
+    def load_image(self, file) -> np.ndarray:
+        return _fr().load_image_file(file)
+
+    def detect(self, image, *, upsample: int = 1, model: str = "hog") -> list[FaceBox]:
+        return _fr().face_locations(image, number_of_times_to_upsample=upsample, model=model)
+
+    def encode(self, image, boxes=None, *, num_jitters: int = 1, model: str = "small"):
+        return _fr().face_encodings(
+            image, known_face_locations=boxes, num_jitters=num_jitters, model=model
+        )
+
+    def compare(self, known, candidate, *, tolerance: float) -> list[bool]:
+        return _fr().compare_faces(known, candidate, tolerance=tolerance)
+
+    def warm_up(self) -> None:
+        # Importing face_recognition loads the dlib models; one pass through detection,
+        # both landmark models and the encoder pays the remaining first-call costs.
+        image = np.zeros((160, 160, 3), dtype=np.uint8)
+        box = [(40, 120, 120, 40)]
+        self.detect(image)
+        self.encode(image, box, model="small")
+        self.encode(image, box, model="large")
+
+
+class FakeFaceBackend:
+    """
+    Deterministic stand-in for load testing without dlib.
+    Every image has one face (the centred square). Its encoding is derived from the pixels,
+    so the same photo always matches itself and different photos practically never do.
+    """
+
+    name = "fake"
+
+    def load_image(self, file) -> np.ndarray:
+        return _pil_to_array(Image.open(file).convert("RGB"))
+
+    def detect(self, image, *, upsample: int = 1, model: str = "hog") -> list[FaceBox]:
+        height, width = image.shape[:2]
+        side = min(height, width) // 2
+        if side < 1:
+            return []
+        top, left = (height - side) // 2, (width - side) // 2
+        return [(top, left + side, top + side, left)]
+
+    def encode(self, image, boxes=None, *, num_jitters: int = 1, model: str = "small"):
+        if boxes is None:
+            boxes = self.detect(image)
+        encodings = []
+        for top, right, bottom, left in boxes:
+            face = image[top:bottom, left:right]
+            if face.size == 0:
+                continue
+            # 16x8 grayscale thumbnail -> 128 values, centred and unit length
+            thumb = Image.fromarray(np.ascontiguousarray(face)).convert("L").resize((16, 8))
+            vec = np.asarray(thumb, dtype=np.float64).reshape(ENCODING_DIM)
+            vec -= vec.mean()
+            norm = np.linalg.norm(vec)
+            encodings.append(vec / norm if norm else vec)
+        return encodings
+
+    def compare(self, known, candidate, *, tolerance: float) -> list[bool]:
+        if len(known) == 0:
+            return []
+        distances = np.linalg.norm(np.asarray(known) - np.asarray(candidate), axis=1)
+        return list(distances <= tolerance)
+
+    def warm_up(self) -> None:
+        self.encode(np.zeros((160, 160, 3), dtype=np.uint8))
+
+
+FACE_BACKENDS: dict[str, Callable[[], FaceBackend]] = {
+    "dlib": DlibBackend,
+    "fake": FakeFaceBackend,
+}
+
+_backend: FaceBackend = DlibBackend()
+
+
+def configure_face_backend(name: str) -> FaceBackend:
+    """
+    Selects the face backend by name (see FACE_BACKENDS). Called from create_app and from
+    each face pool worker. Raises ValueError if unknown.
+    """
+    global _backend
+    try:
+        factory = FACE_BACKENDS[name.strip().lower()]
+    except KeyError:
+        raise ValueError(
+            f"Unknown face backend {name!r} (expected one of: {', '.join(FACE_BACKENDS)})"
+        ) from None
+    _backend = factory()
+    return _backend
+
+
+def get_face_backend() -> FaceBackend:
+    return _backend
+
+
+def warm_up_face_backend() -> float:
+    """
+    Loads the models and runs one dummy inference. Returns the time it took (ms).
+    """
+    start = time.perf_counter()
+    _backend.warm_up()
+    took_ms = _elapsed_ms(start)
+    logger.info("face backend warmed up | backend=%s took_ms=%.1f", _backend.name, took_ms)
+    return took_ms
+
+
+def init_face_worker(backend_name: str, warm_up: bool) -> None:
+    """
+    Face pool worker initializer: worker processes don't share this module's globals,
+    so the backend is configured (and optionally warmed up) again in each one.
+    """
+    configure_face_backend(backend_name)
+    if warm_up:
+        try:
+            warm_up_face_backend()
+        except Exception:
+            logger.warning("face worker warm-up failed", exc_info=True)
+
+
 @dataclass(frozen=True)
 class FaceMatchResult:
     status: str  # "success" | "error"
     error: str | None = None
+    timings: dict[str, float] = field(default_factory=dict)  # stage -> milliseconds
 
 
-import base64
+@dataclass(frozen=True)
+class FaceMatchRequest:
+    """
+    The arguments of one verify_face_match call, for verify_face_matches.
+    """
+
+    submitted_photo_b64: str
+    reference_image_path: Path
+    tolerance: float = 0.6
+    options: FacePipelineOptions | None = None
+    face_box: tuple[float, float, float, float] | None = None
+    templates: np.ndarray | None = None
+
+
+@dataclass(frozen=True)
+class _PendingMatch:
+    # A verification ready for its face pool job (see _prepare_match).
+    cache_key: tuple
+    ref_version: Any
+    templates: np.ndarray
+    submitted_bytes: bytes
+    options: FacePipelineOptions
+    face_box: tuple[float, float, float, float] | None
+    tolerance: float
+
+
+@dataclass(frozen=True)
+class FaceTemplateResult:
+    status: str  # "success" | "error"
+    error: str | None = None
+    templates: int = 0  # templates stored for the student afterwards
+    timings: dict[str, float] = field(default_factory=dict)
+
+
+@dataclass(frozen=True)
+class FaceIdentifyResult:
+    status: str  # "success" | "error"
+    error: str | None = None
+    index: int | None = None  # row of the best match in the gallery
+    distance: float | None = None
+    timings: dict[str, float] = field(default_factory=dict)
+
+
+@dataclass(frozen=True)
+class FaceSearchResult:
+    status: str  # "success" | "error"
+    error: str | None = None
+    euid: str | None = None
+    distance: float | None = None
+    timings: dict[str, float] = field(default_factory=dict)
+
+
+@dataclass(frozen=True)
+class GroupMatch:
+    face_index: int  # face in the photo, in detection order
+    gallery_index: int  # matched row in the gallery
+    distance: float
+
+
+@dataclass(frozen=True)
+class GroupIdentifyResult:
+    status: str  # "success" | "error"
+    error: str | None = None
+    matches: tuple[GroupMatch, ...] = ()
+    faces_detected: int = 0
+    timings: dict[str, float] = field(default_factory=dict)
+
+
+@dataclass(frozen=True)
+class FacePipelineOptions:
+    """
+    Knobs for processing a submitted photo. Passed explicitly into pool jobs,
+    since worker processes don't share this module's globals.
+    """
+
+    # Longest edge of the copy used for face detection (0 = detect at encode resolution).
+    detect_max_dim: int = 640
+    # Longest edge of the image the encoding is computed on (0 = native resolution).
+    encode_max_dim: int = 1280
+    # JPEGs larger than this (longest edge) are decoded at 1/2, 1/4 or 1/8 scale (0 = off).
+    decode_target_dim: int = 1280
+    # Engine knobs (face_recognition defaults; see FACE_PRESETS).
+    detection_model: str = "hog"  # "hog" | "cnn"
+    upsample: int = 1  # number_of_times_to_upsample for detection
+    num_jitters: int = 1  # re-sampled encodings averaged per face
+    landmark_model: str = "small"  # "small" (5-point) | "large" (68-point)
+
+    @property
+    def detect_kwargs(self) -> dict[str, Any]:
+        return {"upsample": self.upsample, "model": self.detection_model}
+
+    @property
+    def encode_kwargs(self) -> dict[str, Any]:
+        return {"num_jitters": self.num_jitters, "model": self.landmark_model}
+
+    @property
+    def default_detector(self) -> bool:
+        return self.detection_model == "hog" and self.upsample == 1
+
+
+# Named engine presets, cheapest first. Measure with: python -m scripts.bench_face_presets
+FACE_PRESETS: dict[str, dict[str, Any]] = {
+    "fast": {"detection_model": "hog", "upsample": 0, "num_jitters": 1, "landmark_model": "small"},
+    "balanced": {
+        "detection_model": "hog",
+        "upsample": 1,
+        "num_jitters": 1,
+        "landmark_model": "small",
+    },
+    "accurate": {
+        "detection_model": "cnn",
+        "upsample": 1,
+        "num_jitters": 5,
+        "landmark_model": "large",
+    },
+}
+
+# Endpoints that can pick their own preset.
+FACE_ENDPOINTS = ("attendance", "face_login", "enrollment")
+
+
+def apply_face_preset(options: FacePipelineOptions, preset: str) -> FacePipelineOptions:
+    """
+    Returns options with the named preset's engine knobs. Raises ValueError if unknown.
+    """
+    try:
+        knobs = FACE_PRESETS[preset.strip().lower()]
+    except KeyError:
+        raise ValueError(
+            f"Unknown face preset {preset!r} (expected one of: {', '.join(FACE_PRESETS)})"
+        ) from None
+    return replace(options, **knobs)
+
+
+@dataclass(frozen=True)
+class PhotoEncoding:
+    encoding: Any | None
+    error: str | None = None
+    timings: dict[str, float] = field(default_factory=dict)
+
+
+@dataclass(frozen=True)
+class PreparedReference:
+    image: bytes  # normalized JPEG to store (the raw upload if Pillow can't read it)
+    encoding: Any | None
+    error: str | None = None
+
+
+@dataclass(frozen=True)
+class PhotoFaces:
+    encodings: np.ndarray  # faces x 128
+    boxes: tuple = ()  # (top, right, bottom, left) per face
+    error: str | None = None
+    timings: dict[str, float] = field(default_factory=dict)
+
+
+_pipeline_options = FacePipelineOptions()
+# Classroom photos: many small faces, so detection needs far more pixels than a selfie.
+_group_pipeline_options = FacePipelineOptions(
+    detect_max_dim=2048, encode_max_dim=2048, decode_target_dim=2048
+)
+
+
+_endpoint_options: dict[str, FacePipelineOptions] = {}
+
+
+def configure_face_pipeline(
+    options: FacePipelineOptions,
+    *,
+    group: FacePipelineOptions | None = None,
+    endpoints: dict[str, FacePipelineOptions] | None = None,
+) -> None:
+    """
+    Sets the default pipeline options, and optionally the group-photo and per-endpoint ones
+    (keys from FACE_ENDPOINTS). Called once from create_app with values from Config.
+    """
+    global _pipeline_options, _group_pipeline_options, _endpoint_options
+    _pipeline_options = options
+    if group is not None:
+        _group_pipeline_options = group
+    if endpoints is not None:
+        unknown = set(endpoints) - set(FACE_ENDPOINTS)
+        if unknown:
+            raise ValueError(f"Unknown face endpoints: {sorted(unknown)}")
+        _endpoint_options = dict(endpoints)
+
+
+def get_face_pipeline_options(endpoint: str | None = None) -> FacePipelineOptions:
+    """
+    Options for an endpoint (see FACE_ENDPOINTS), falling back to the defaults.
+    """
+    if endpoint is None:
+        return _pipeline_options
+    return _endpoint_options.get(endpoint, _pipeline_options)
+
 
 def _decode_base64_to_bytes(photo_b64: str) -> bytes:
     # Strip data URI prefix if present: "data:image/jpeg;base64,...."
@@ -45,25 +535,109 @@ def _decode_base64_to_bytes(photo_b64: str) -> bytes:
         raise ValueError("photo must be valid base64") from e
 
 
-def _load_image_from_bytes(image_bytes: bytes, fr):
+def _load_image_from_bytes(image_bytes: bytes, backend):
     """
     Loads an image from bytes and returns a numpy array suitable for face_recognition.
     Normalizes EXIF orientation before conversion.
     """
+    return _to_array(_open_normalized_image(image_bytes), backend)
+
+
+def _open_normalized_image(image_bytes: bytes, target_dim: int = 0):
+    """
+    Decodes an image and normalizes EXIF orientation and mode (RGB).
+    JPEGs larger than target_dim are decoded at reduced scale (see _draft_for_target).
+    The pixels are decoded exactly once; no copies are made when nothing needs to change.
+    """
     img = Image.open(io.BytesIO(image_bytes))
-    
+
+    if target_dim > 0 and getattr(img, "format", None) == "JPEG":
+        _draft_for_target(img, target_dim)
+
     # Best-effort EXIF normalization:
     # - Real PIL Images support EXIF methods.
     # - Tests may patch Image.open to return a lightweight fake that does not.
     try:
-        img = ImageOps.exif_transpose(img)
+        ImageOps.exif_transpose(img, in_place=True)
     except Exception:
         pass
 
-    img = img.convert("RGB")
+    if getattr(img, "mode", None) != "RGB":
+        img = img.convert("RGB")
+    return img
+
+
+def _draft_for_target(img: Image.Image, target_dim: int) -> None:
+    """
+    Configures libjpeg DCT scaling so the decode produces the smallest 1/2, 1/4 or 1/8 scale
+    whose longest edge is still >= target_dim. The full-resolution buffer is never allocated.
+    Must run before anything calls img.load().
+    """
+    width, height = img.size
+    longest = max(width, height)
+    if longest <= target_dim:
+        return
+    scale = target_dim / longest
+    img.draft("RGB", (math.ceil(width * scale), math.ceil(height * scale)))
+
 
+def _to_array(img, backend):
+    """
+    Converts a normalized (RGB) image into the HxWx3 uint8 array the face backend expects.
+    """
+    if isinstance(img, Image.Image):
+        return _pil_to_array(img)
+    # Lightweight stand-ins (tests patch Image.open) only support save(); round-trip via JPEG.
     jpeg_bytes = _pil_to_jpeg_bytes(img)
-    return fr.load_image_file(io.BytesIO(jpeg_bytes))
+    return backend.load_image(io.BytesIO(jpeg_bytes))
+
+
+def _pil_to_array(img: Image.Image) -> np.ndarray:
+    """
+    Direct PIL -> numpy conversion (no JPEG encode/decode round-trip).
+    PIL exports a read-only buffer and dlib writes through mutable_data(), so this keeps
+    exactly one copy into a writeable, C-contiguous array.
+    """
+    if img.mode != "RGB":
+        img = img.convert("RGB")
+    return np.require(np.asarray(img), dtype=np.uint8, requirements=["C", "W"])
+
+
+def _bounded(img: Image.Image, max_dim: int) -> Image.Image:
+    """
+    Returns img scaled down so its longest edge is at most max_dim (aspect preserved).
+    """
+    size = _bounded_size(img.size, max_dim)
+    if size == img.size:
+        return img
+    return img.resize(size, Image.Resampling.BILINEAR, reducing_gap=2.0)
+
+
+def _bounded_size(size: tuple[int, int], max_dim: int) -> tuple[int, int]:
+    width, height = size
+    longest = max(width, height)
+    if max_dim <= 0 or longest <= max_dim:
+        return size
+    scale = max_dim / longest
+    return (max(1, round(width * scale)), max(1, round(height * scale)))
+
+
+def _scale_box(box, scale: float, size: tuple[int, int]) -> tuple[int, int, int, int]:
+    """
+    Maps a (top, right, bottom, left) box by scale and clamps it to size (width, height).
+    """
+    top, right, bottom, left = box
+    width, height = size
+    return (
+        max(0, int(top * scale)),
+        min(width, int(round(right * scale))),
+        min(height, int(round(bottom * scale))),
+        max(0, int(left * scale)),
+    )
+
+
+def _elapsed_ms(start: float) -> float:
+    return round((time.perf_counter() - start) * 1000.0, 2)
 
 
 def _pil_to_jpeg_bytes(img: Image.Image) -> bytes:
@@ -75,50 +649,850 @@ def _pil_to_jpeg_bytes(img: Image.Image) -> bytes:
     return buf.getvalue()
 
 
-def save_reference_image(*, photo_b64: str, dest_path: Path) -> None:
+def reference_image_path(user_data_dir: Path, euid: str) -> Path:
+    return user_data_dir / "Student" / euid / "reference_image.jpg"
+
+
+def reference_encoding_path(reference_image_path: Path) -> Path:
+    return reference_image_path.with_name(REFERENCE_ENCODING_FILENAME)
+
+
+def _reference_fingerprint(reference_image_path: Path) -> dict[str, int]:
+    st = reference_image_path.stat()
+    return {"reference_mtime_ns": st.st_mtime_ns, "reference_size": st.st_size}
+
+
+def write_reference_templates(*, reference_image_path: Path, encodings) -> Path:
+    """
+    Atomically writes the sidecar for reference_image_path.
+    The sidecar records the reference image's mtime/size so a replaced image marks it stale.
+    Raises ValueError unless encodings is one or more 128-d vectors.
+    """
+    try:
+        matrix = np.asarray(encodings, dtype=np.float64)
+    except (TypeError, ValueError) as e:
+        raise ValueError("encoding must be a numeric vector") from e
+    if matrix.ndim == 1:
+        matrix = matrix[None, :]
+    if matrix.ndim != 2 or matrix.shape[1] != ENCODING_DIM:
+        raise ValueError(f"encoding must have {ENCODING_DIM} dimensions, got {matrix.shape}")
+    if len(matrix) == 0:
+        raise ValueError("at least one encoding is required")
+
+    meta = {
+        "version": ENCODING_FORMAT_VERSION,
+        "model": ENCODING_MODEL,
+        "dtype": _encoding_dtype,
+        "created_at": datetime.now(UTC).isoformat(),
+        **_reference_fingerprint(reference_image_path),
+    }
+    arrays = encoding_arrays(quantize_encodings(matrix, _encoding_dtype))
+
+    dest = reference_encoding_path(reference_image_path)
+    tmp = dest.with_name(f".{dest.name}.{os.getpid()}.tmp")
+    with tmp.open("wb") as f:
+        np.savez(f, **arrays, meta=np.array(json.dumps(meta)))
+    os.replace(tmp, dest)
+    return dest
+
+
+def write_reference_encoding(*, reference_image_path: Path, encoding) -> Path:
+    """
+    Writes a sidecar holding a single template (a fresh enrollment).
+    Raises ValueError if encoding is not a 128-d vector.
+    """
+    try:
+        vec = np.asarray(encoding, dtype=np.float64).reshape(-1)
+    except (TypeError, ValueError) as e:
+        raise ValueError("encoding must be a numeric vector") from e
+    if vec.shape != (ENCODING_DIM,):
+        raise ValueError(f"encoding must have {ENCODING_DIM} dimensions, got {vec.shape}")
+    return write_reference_templates(reference_image_path=reference_image_path, encodings=vec)
+
+
+def load_reference_templates(reference_image_path: Path) -> np.ndarray | None:
+    """
+    Returns the stored templates (N x 128), or None if the sidecar is missing, unreadable,
+    written by another format/model version, or older than the reference image.
+    """
+    path = reference_encoding_path(reference_image_path)
+    try:
+        with np.load(path, allow_pickle=False) as data:
+            meta = json.loads(str(data["meta"]))
+            key = "encodings" if "encodings" in data.files else "encoding"
+            scale = data["scale"] if "scale" in data.files else None
+            templates = encodings_from_arrays(data[key], scale)
+        fingerprint = _reference_fingerprint(reference_image_path)
+    except Exception:
+        return None
+
+    if meta.get("version") not in _READABLE_FORMAT_VERSIONS or meta.get("model") != ENCODING_MODEL:
+        return None
+    if any(meta.get(k) != v for k, v in fingerprint.items()):
+        return None
+    if templates.ndim == 1:
+        templates = templates[None, :]
+    if templates.ndim != 2 or templates.shape[1] != ENCODING_DIM or len(templates) == 0:
+        return None
+    return templates
+
+
+def load_reference_encoding(reference_image_path: Path) -> np.ndarray | None:
+    """
+    Returns the student's representative encoding (see representative_encoding), or None.
+    """
+    templates = load_reference_templates(reference_image_path)
+    return None if templates is None else representative_encoding(templates)
+
+
+def template_blobs(templates) -> list[bytes]:
+    """
+    One float32 little-endian BLOB per template row, as stored in tbl_face_templates.
+    """
+    matrix = np.asarray(templates, dtype="<f4").reshape(-1, ENCODING_DIM)
+    return [row.tobytes() for row in matrix]
+
+
+def templates_from_blobs(blobs: list[bytes]) -> np.ndarray | None:
+    """
+    Inverse of template_blobs: the templates as an N x 128 float64 matrix, or None if
+    there are none or a BLOB has the wrong size.
+    """
+    if not blobs or any(len(blob) != 4 * ENCODING_DIM for blob in blobs):
+        return None
+    matrix = np.frombuffer(b"".join(blobs), dtype="<f4").reshape(-1, ENCODING_DIM)
+    return matrix.astype(np.float64)
+
+
+def representative_encoding(templates: np.ndarray) -> np.ndarray:
+    """
+    The single vector that stands for a student in 1:N search (roster matrix, campus index):
+    the templates' centroid when enabled, otherwise the enrollment template.
+    """
+    if _template_centroid and len(templates) > 1:
+        return templates.mean(axis=0)
+    return templates[0]
+
+
+def _match_gallery(templates: np.ndarray) -> np.ndarray:
+    # With the centroid enabled it joins the templates as one more row to compare against.
+    if _template_centroid and len(templates) > 1:
+        return np.vstack([templates, templates.mean(axis=0)])
+    return templates
+
+
+def reference_version(reference_image_path: Path) -> tuple[int, ...]:
+    """
+    Changes whenever the reference image or its template sidecar is rewritten (re-enrollment,
+    an added template). Cache entries carry it, so every worker picks up the change.
+    Raises OSError if the reference image is missing.
+    """
+    st = reference_image_path.stat()
+    try:
+        sidecar_mtime_ns = reference_encoding_path(reference_image_path).stat().st_mtime_ns
+    except OSError:
+        sidecar_mtime_ns = 0
+    return (st.st_mtime_ns, st.st_size, st.st_ino, sidecar_mtime_ns)
+
+
+def _cached_reference_templates(reference_image_path: Path, version) -> np.ndarray | None:
+    """
+    Cache first, then the on-disk sidecar. Populates the cache on a sidecar hit.
+    """
+    key = str(reference_image_path)
+    cached = _reference_cache.get(key, version)
+    if cached is not None:
+        return _float_templates(cached)
+
+    templates = load_reference_templates(reference_image_path)
+    if templates is not None:
+        _reference_cache.put(key, version, quantize_encodings(templates, _encoding_dtype))
+    return templates
+
+
+def _float_templates(stored: np.ndarray | QuantizedEncodings) -> np.ndarray:
+    # A student has a handful of templates, so dequantizing per lookup is cheap.
+    return stored.dequantize() if isinstance(stored, QuantizedEncodings) else stored
+
+
+def encode_reference_image(
+    reference_image_path: Path, options: FacePipelineOptions | None = None, *, backend=None
+) -> PhotoEncoding:
     """
-    Persist the student's reference image to disk.
-    Normalize orientation so face_recognition can detect faces reliably.
+    Detects and encodes the face in a stored reference image (enrollment preset by default).
+    Writes nothing. A plain module-level function, so backfills can run it in a process pool.
+    """
+    backend = backend or get_face_backend()
+    timings: dict[str, float] = {}
+    start = time.perf_counter()
+    try:
+        reference_arr = backend.load_image(str(reference_image_path))
+    except Exception:
+        return PhotoEncoding(encoding=None, error="Unable to load reference image")
+    timings["decode_ms"] = _elapsed_ms(start)
+
+    start = time.perf_counter()
+    encoding = _get_first_encoding(
+        reference_arr, backend, options or get_face_pipeline_options("enrollment")
+    )
+    timings["encode_ms"] = _elapsed_ms(start)
+    if encoding is None:
+        return PhotoEncoding(
+            encoding=None, error="No face detected in reference image", timings=timings
+        )
+    return PhotoEncoding(encoding=encoding, timings=timings)
+
+
+def resolve_reference_templates(
+    reference_image_path: Path, *, version=None
+) -> tuple[np.ndarray | None, str | None]:
+    """
+    Returns (templates N x 128, None) or (None, error) for a reference image.
+    Lookup order: in-process cache, sidecar, then the JPEG itself (encoded in the face pool,
+    and refreshing the sidecar, so the expensive path runs once per reference).
+    Raises FacePoolBusy/FacePoolTimeout when that encode can't run.
+    """
+    if version is None:
+        try:
+            version = reference_version(reference_image_path)
+        except OSError:
+            return None, "Reference image not found"
+
+    templates = _cached_reference_templates(reference_image_path, version)
+    if templates is not None:
+        return templates, None
+
+    encoded = get_face_pool().run(
+        encode_reference_image, reference_image_path, get_face_pipeline_options("enrollment")
+    )
+    if encoded.error:
+        return None, encoded.error
+    encoding = encoded.encoding
+    # Cached under the version the next lookup will see (the sidecar was just rewritten).
+    if _store_reference_encoding(reference_image_path, encoding):
+        templates = np.asarray(encoding, dtype=np.float64)[None, :]
+        try:
+            _reference_cache.put(
+                str(reference_image_path),
+                reference_version(reference_image_path),
+                quantize_encodings(templates, _encoding_dtype),
+            )
+        except OSError:
+            pass
+        return templates, None
+    return np.asarray([encoding]), None
+
+
+def resolve_reference_encoding(
+    reference_image_path: Path, *, version=None
+) -> tuple[np.ndarray | None, str | None]:
+    """
+    Returns (representative encoding, None) or (None, error); see resolve_reference_templates.
+    """
+    templates, error = resolve_reference_templates(reference_image_path, version=version)
+    if error:
+        return None, error
+    return representative_encoding(templates), None
+
+
+def _store_reference_encoding(reference_image_path: Path, encoding) -> bool:
+    """
+    Best-effort sidecar write. A failure only costs the fast path, never the request.
+    """
+    try:
+        write_reference_encoding(reference_image_path=reference_image_path, encoding=encoding)
+    except (OSError, ValueError):
+        logger.warning("reference encoding not stored | path=%s", reference_image_path)
+        return False
+    return True
+
+
+# Context kept on each side of the face in a stored reference crop, as a fraction of the face
+# box: enough for the fallback path to re-detect the face and for landmark alignment.
+REFERENCE_CROP_MARGIN = 0.5
+REFERENCE_CROP_QUALITY = 90
+
+
+def prepare_reference_image(
+    image_bytes: bytes,
+    options: FacePipelineOptions | None = None,
+    target_dim: int | None = None,
+    crop_dim: int | None = None,
+) -> PreparedReference:
+    """
+    Normalizes a reference capture into the JPEG to store and encodes it; writes nothing.
+    Orientation is fixed so face_recognition can detect faces reliably, and oversized
+    captures are decoded at reduced scale and bounded to target_dim (defaults to the
+    decode target of options, the enrollment preset unless given). Face pool job.
+
+    With crop_dim > 0 (defaults to the configured crop size) the stored image is a square
+    crop around the detected face, at most crop_dim pixels a side; the encoding comes from
+    the full frame. dlib aligns the face on its landmarks when encoding, so the crop is
+    only centred and bounded, not rotated. Without a face the whole frame is kept.
+    """
+    options = options or get_face_pipeline_options("enrollment")
+    if target_dim is None:
+        target_dim = options.decode_target_dim
+    if crop_dim is None:
+        crop_dim = _reference_crop_dim
+
+    if crop_dim > 0:
+        prepared = _prepare_reference_crop(image_bytes, options, target_dim, crop_dim)
+        if prepared is not None:
+            return prepared
+
+    # Normalize with Pillow to avoid sideways reference images (common on mobile captures)
+    try:
+        img = _open_normalized_image(image_bytes, target_dim)
+        if isinstance(img, Image.Image):
+            img = _bounded(img, target_dim)
+        buf = io.BytesIO()
+        img.save(buf, format="JPEG", quality=95)
+        image = buf.getvalue()
+    except Exception:
+        # If Pillow fails, fall back to raw bytes (better than failing enrollment)
+        image = image_bytes
+
+    try:
+        backend = get_face_backend()
+        encoding = _get_first_encoding(backend.load_image(io.BytesIO(image)), backend, options)
+    except Exception:
+        logger.warning("reference encoding failed", exc_info=True)
+        return PreparedReference(image=image, encoding=None, error="Unable to load reference image")
+    if encoding is None:
+        return PreparedReference(
+            image=image, encoding=None, error="No face detected in reference image"
+        )
+    return PreparedReference(image=image, encoding=encoding)
+
+
+def _prepare_reference_crop(
+    image_bytes: bytes, options: FacePipelineOptions, target_dim: int, crop_dim: int
+) -> PreparedReference | None:
+    """
+    The face-crop path of prepare_reference_image. Returns None for images Pillow can't
+    decode, leaving them to the full-frame path.
+    """
+    try:
+        img = _open_normalized_image(image_bytes, target_dim)
+    except Exception:
+        return None
+    if not isinstance(img, Image.Image):
+        return None
+    img = _bounded(img, target_dim)
+
+    try:
+        encodings, boxes = _detect_and_encode(img, get_face_backend(), options, {}, first_only=True)
+    except Exception:
+        logger.warning("reference encoding failed", exc_info=True)
+        return PreparedReference(
+            image=_jpeg(img, 95), encoding=None, error="Unable to load reference image"
+        )
+    if not encodings:
+        return PreparedReference(
+            image=_jpeg(img, 95), encoding=None, error="No face detected in reference image"
+        )
+
+    # Boxes are in encode-image coordinates; map back to the frame.
+    scale = img.width / _bounded_size(img.size, options.encode_max_dim)[0]
+    crop = _bounded(_face_crop(img, boxes[0], scale), crop_dim)
+    return PreparedReference(image=_jpeg(crop, REFERENCE_CROP_QUALITY), encoding=encodings[0])
+
+
+def _jpeg(img: Image.Image, quality: int) -> bytes:
+    buf = io.BytesIO()
+    img.save(buf, format="JPEG", quality=quality)
+    return buf.getvalue()
+
+
+def _face_crop(img: Image.Image, box, scale: float) -> Image.Image:
+    """
+    Square crop centred on box (top, right, bottom, left, multiplied by scale), with
+    REFERENCE_CROP_MARGIN on each side, shifted to stay inside the frame.
+    """
+    top, right, bottom, left = (v * scale for v in box)
+    side = max(bottom - top, right - left) * (1 + 2 * REFERENCE_CROP_MARGIN)
+    side = round(min(side, img.width, img.height))
+    x0 = min(max(0, round((left + right - side) / 2)), img.width - side)
+    y0 = min(max(0, round((top + bottom - side) / 2)), img.height - side)
+    return img.crop((x0, y0, x0 + side, y0 + side))
+
+
+@dataclass(frozen=True)
+class StagedReference:
+    """
+    A prepared reference whose files are written under temporary names next to their
+    destinations; see stage_prepared_reference.
+    """
+
+    prepared: PreparedReference
+    dest_path: Path
+    files: tuple[tuple[Path, Path], ...]  # (staged, final)
+
+
+def stage_prepared_reference(
+    *, prepared: PreparedReference, dest_path: Path, original: bytes | None = None
+) -> StagedReference:
+    """
+    Writes the files of store_prepared_reference without replacing anything yet, so a
+    caller can put them in place once its DB transaction has committed
+    (install_staged_reference) or drop them if it didn't (discard_staged_reference).
+    The archived original is best-effort, as in archive_reference_original.
+    """
+    dest_path.parent.mkdir(parents=True, exist_ok=True)
+    staged = dest_path.with_name(f".{dest_path.name}.{os.getpid()}.{id(prepared)}.staged")
+    staged.write_bytes(prepared.image)
+    files = [(staged, dest_path)]
+
+    archive = None if original is None else reference_archive_path(dest_path.parent.name, original)
+    if archive is not None:
+        staged_archive = archive.with_name(f".{archive.name}.{os.getpid()}.{id(prepared)}.staged")
+        try:
+            archive.parent.mkdir(parents=True, exist_ok=True)
+            staged_archive.write_bytes(original)
+            files.append((staged_archive, archive))
+        except OSError:
+            logger.warning(
+                "reference original not archived | euid=%s", dest_path.parent.name, exc_info=True
+            )
+    return StagedReference(prepared=prepared, dest_path=dest_path, files=tuple(files))
+
+
+def discard_staged_reference(staged: StagedReference) -> None:
+    for staged_path, _final in staged.files:
+        staged_path.unlink(missing_ok=True)
+    try:
+        staged.dest_path.parent.rmdir()  # only if staging created it
+    except OSError:
+        pass
+
+
+def install_staged_reference(staged: StagedReference) -> bool:
+    """
+    Moves staged files into place and writes the encoding sidecar, replacing any previous
+    enrollment. Returns True if the sidecar was written.
+    """
+    for staged_path, final in staged.files:
+        os.replace(staged_path, final)
+    return _finish_reference(staged.prepared, staged.dest_path)
+
+
+def store_prepared_reference(
+    *, prepared: PreparedReference, dest_path: Path, original: bytes | None = None
+) -> bool:
+    """
+    Writes a prepared reference image and its encoding sidecar, replacing any previous
+    enrollment. With an archive directory configured, original (the upload) is kept there
+    as the full-frame copy. Returns True if the sidecar was written.
     """
     dest_path.parent.mkdir(parents=True, exist_ok=True)
+    dest_path.write_bytes(prepared.image)
+    if original is not None:
+        archive_reference_original(euid=dest_path.parent.name, image_bytes=original)
+    return _finish_reference(prepared, dest_path)
+
 
+def _finish_reference(prepared: PreparedReference, dest_path: Path) -> bool:
+    # Drop any sidecar/cached encoding from a previous enrollment.
+    reference_encoding_path(dest_path).unlink(missing_ok=True)
+    _reference_cache.invalidate(str(dest_path))
+
+    if prepared.encoding is None:
+        # Enrollment still succeeds; verification falls back to the JPEG.
+        logger.info("no reference encoding | path=%s error=%s", dest_path, prepared.error)
+        return False
+    return _store_reference_encoding(dest_path, prepared.encoding)
+
+
+def save_reference_image(*, photo_b64: str, dest_path: Path, target_dim: int | None = None) -> bool:
+    """
+    Persist the student's reference image to disk (see prepare_reference_image), encoded
+    with the enrollment preset.
+
+    Also computes the reference encoding once and stores it as a sidecar, so verification
+    doesn't re-detect the reference on every check. Returns True if the sidecar was written.
+    """
     # Strip data-uri prefix if present (defensive)
     if photo_b64.startswith("data:"):
         photo_b64 = photo_b64.split(",", 1)[1]
 
     raw = _decode_base64_to_bytes(photo_b64)
+    prepared = prepare_reference_image(raw, get_face_pipeline_options("enrollment"), target_dim)
+    return store_prepared_reference(prepared=prepared, dest_path=dest_path, original=raw)
 
-    # Normalize with Pillow to avoid sideways reference images (common on mobile captures)
+
+def reference_archive_path(euid: str, image_bytes: bytes) -> Path | None:
+    """
+    Where the full-frame original of a student's reference goes, or None without an archive.
+    """
+    if _reference_archive_dir is None:
+        return None
+    suffix = ".png" if image_bytes.startswith(b"\x89PNG") else ".jpg"
+    return _reference_archive_dir / euid / f"reference_original{suffix}"
+
+
+def archive_reference_original(*, euid: str, image_bytes: bytes) -> Path | None:
+    """
+    Best-effort copy of the full-frame original into the cold archive (if configured).
+    """
+    path = reference_archive_path(euid, image_bytes)
+    if path is None:
+        return None
     try:
-        img = Image.open(BytesIO(raw))
-        img = ImageOps.exif_transpose(img)  # applies EXIF orientation if present
-        img = img.convert("RGB")
-        img.save(dest_path, format="JPEG", quality=95)
-    except Exception:
-        # If Pillow fails, fall back to raw bytes (better than failing enrollment)
-        dest_path.write_bytes(raw)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        tmp = path.with_name(f".{path.name}.{os.getpid()}.tmp")
+        tmp.write_bytes(image_bytes)
+        os.replace(tmp, path)
+    except OSError:
+        logger.warning("reference original not archived | euid=%s", euid, exc_info=True)
+        return None
+    return path
 
 
-def _get_first_encoding(image_arr, fr):
+def add_reference_template(
+    *,
+    photo_b64: str,
+    reference_image_path: Path,
+    tolerance: float = 0.6,
+    options: FacePipelineOptions | None = None,
+    face_box: tuple[float, float, float, float] | None = None,
+) -> FaceTemplateResult:
+    """
+    Adds another capture (e.g. different lighting) to the student's reference templates.
+    The photo must match the enrollment template (row 0), so a student can only add their own
+    face. Matching any template would let a chain of captures, each close to the previous
+    one, walk the gallery over to someone else's face.
+    Beyond the cap the oldest added template is dropped; the enrollment template is kept.
+    """
+    if _max_templates < 2:
+        return FaceTemplateResult(status="error", error="Additional templates are disabled")
+    try:
+        version = reference_version(reference_image_path)
+    except OSError:
+        return FaceTemplateResult(status="error", error="Reference image not found")
+
+    if photo_b64.startswith("data:"):
+        photo_b64 = photo_b64.split(",", 1)[1]
+    try:
+        submitted_bytes = _decode_base64_to_bytes(photo_b64)
+    except ValueError as e:
+        return FaceTemplateResult(status="error", error=str(e))
+
+    templates, error = resolve_reference_templates(reference_image_path, version=version)
+    if error:
+        return FaceTemplateResult(status="error", error=error)
+
+    submitted = get_face_pool().run(
+        encode_photo,
+        submitted_bytes,
+        options or get_face_pipeline_options("enrollment"),
+        face_box,
+    )
+    if submitted.error:
+        return FaceTemplateResult(status="error", error=submitted.error, timings=submitted.timings)
+
+    probe = np.asarray(submitted.encoding, dtype=np.float64)
+    if float(face_distances(templates[:1], probe)[0]) > tolerance:
+        return FaceTemplateResult(
+            status="error", error="Face does not match reference", timings=submitted.timings
+        )
+
+    updated = np.vstack([templates, probe[None, :]])
+    if len(updated) > _max_templates:
+        updated = np.vstack([updated[:1], updated[len(updated) - _max_templates + 1 :]])
+    try:
+        write_reference_templates(reference_image_path=reference_image_path, encodings=updated)
+    except OSError:
+        logger.warning("reference template not stored | path=%s", reference_image_path)
+        return FaceTemplateResult(status="error", error="Unable to store template")
+    _reference_cache.invalidate(str(reference_image_path))
+    return FaceTemplateResult(status="success", templates=len(updated), timings=submitted.timings)
+
+
+def _get_first_encoding(image_arr, backend, options: FacePipelineOptions | None = None):
     """
     Returns the first face encoding or None.
+    With the default detector, encode() runs detection itself; other presets detect
+    explicitly so their model/upsample settings apply.
     """
-    encodings = fr.face_encodings(image_arr)
+    if options is None:
+        encodings = backend.encode(image_arr)
+    else:
+        boxes = None
+        if not options.default_detector:
+            boxes = backend.detect(image_arr, **options.detect_kwargs)[:1]
+            if not boxes:
+                return None
+        encodings = backend.encode(image_arr, boxes, **options.encode_kwargs)
     if not encodings:
         return None
     return encodings[0]
 
 
+def _encode_first_face(img: Image.Image, backend, options: FacePipelineOptions, timings: dict):
+    encodings, _boxes = _detect_and_encode(img, backend, options, timings, first_only=True)
+    return encodings[0] if encodings else None
+
+
+def _detect_and_encode(
+    img: Image.Image, backend, options: FacePipelineOptions, timings: dict, *, first_only: bool
+) -> tuple[list, list]:
+    """
+    Two-stage pipeline: detect on a small copy, then encode at a moderate resolution using
+    the detection boxes mapped back to that resolution. All faces are encoded in one
+    encode() call. Returns (encodings, boxes in encode-image coordinates).
+    HOG cost grows with pixel count, so detection dominates on full-size phone captures.
+    """
+    start = time.perf_counter()
+    encode_img = _bounded(img, options.encode_max_dim)
+    detect_img = _bounded(encode_img, options.detect_max_dim)
+    encode_arr = _to_array(encode_img, backend)
+    detect_arr = encode_arr if detect_img is encode_img else _to_array(detect_img, backend)
+    timings["resize_ms"] = _elapsed_ms(start)
+
+    start = time.perf_counter()
+    boxes = backend.detect(detect_arr, **options.detect_kwargs)
+    timings["detect_ms"] = _elapsed_ms(start)
+    if not boxes:
+        return [], []
+    if first_only:
+        boxes = boxes[:1]
+
+    scale = encode_img.width / detect_img.width
+    scaled = [_scale_box(box, scale, encode_img.size) for box in boxes]
+
+    start = time.perf_counter()
+    encodings = backend.encode(encode_arr, scaled, **options.encode_kwargs)
+    timings["encode_ms"] = _elapsed_ms(start)
+    return list(encodings), scaled
+
+
+# Context kept around a client-supplied face box; landmarks need some margin.
+FACE_BOX_PADDING = 0.25
+# The padded crop is verified at this size: the face fills most of it, so HOG is cheap.
+FACE_BOX_VERIFY_DIM = 200
+
+
+def _encode_boxed_face(
+    img: Image.Image,
+    backend,
+    options: FacePipelineOptions,
+    timings: dict,
+    face_box: tuple[float, float, float, float],
+):
+    """
+    Encodes the face inside a client-supplied box ([top, right, bottom, left] fractions of
+    the upright image) without scanning the full frame.
+    The box is verified by detecting on a small padded crop; the encoding is computed on
+    the same crop at the resolution the full-frame path would use.
+    Returns None if the crop holds no face.
+    """
+    start = time.perf_counter()
+    width, height = img.size
+    top, right, bottom, left = face_box
+    pad_y = (bottom - top) * FACE_BOX_PADDING
+    pad_x = (right - left) * FACE_BOX_PADDING
+    crop = img.crop(
+        (
+            max(0, int((left - pad_x) * width)),
+            max(0, int((top - pad_y) * height)),
+            min(width, math.ceil((right + pad_x) * width)),
+            min(height, math.ceil((bottom + pad_y) * height)),
+        )
+    )
+    longest = max(width, height)
+    if 0 < options.encode_max_dim < longest:
+        scale = options.encode_max_dim / longest
+        crop = crop.resize(
+            (max(1, round(crop.width * scale)), max(1, round(crop.height * scale))),
+            Image.Resampling.BILINEAR,
+        )
+    detect_crop = _bounded(crop, FACE_BOX_VERIFY_DIM)
+    encode_arr = _to_array(crop, backend)
+    detect_arr = encode_arr if detect_crop is crop else _to_array(detect_crop, backend)
+    timings["resize_ms"] = _elapsed_ms(start)
+
+    start = time.perf_counter()
+    boxes = backend.detect(detect_arr, **options.detect_kwargs)
+    timings["detect_ms"] = _elapsed_ms(start)
+    if not boxes:
+        return None
+
+    largest = max(boxes, key=lambda b: (b[2] - b[0]) * (b[1] - b[3]))
+    box = _scale_box(largest, crop.width / detect_crop.width, crop.size)
+
+    start = time.perf_counter()
+    encodings = backend.encode(encode_arr, [box], **options.encode_kwargs)
+    timings["encode_ms"] = _elapsed_ms(start)
+    return encodings[0] if encodings else None
+
+
+def encode_photo(
+    image_bytes: bytes,
+    options: FacePipelineOptions | None = None,
+    face_box: tuple[float, float, float, float] | None = None,
+) -> PhotoEncoding:
+    """
+    Decodes, detects and encodes the first face in a photo.
+    With a face_box from the client only that region is checked (see _encode_boxed_face);
+    if it holds no face, the full-frame pipeline runs as usual.
+    Runs as a face pool job, so it must stay module-level (picklable) and take its options
+    as an argument.
+    """
+    options = options or FacePipelineOptions()
+    timings: dict[str, float] = {}
+    backend = get_face_backend()
+
+    start = time.perf_counter()
+    try:
+        img = _open_normalized_image(image_bytes, options.decode_target_dim)
+    except Exception:
+        return PhotoEncoding(encoding=None, error="Unable to load submitted image")
+    timings["decode_ms"] = _elapsed_ms(start)
+
+    if isinstance(img, Image.Image):
+        encoding = None
+        if face_box is not None:
+            encoding = _encode_boxed_face(img, backend, options, timings, face_box)
+            if encoding is None:
+                logger.debug("no face inside client face_box, scanning full frame")
+        if encoding is None:
+            encoding = _encode_first_face(img, backend, options, timings)
+    else:
+        # Non-PIL stand-ins (tests patch Image.open) skip the two-stage pipeline.
+        try:
+            encoding = _get_first_encoding(_to_array(img, backend), backend, options)
+        except Exception:
+            return PhotoEncoding(encoding=None, error="Unable to load submitted image")
+
+    if encoding is None:
+        return PhotoEncoding(
+            encoding=None, error="No face detected in submitted image", timings=timings
+        )
+    return PhotoEncoding(encoding=encoding, timings=timings)
+
+
+def encode_photo_faces(
+    image_bytes: bytes, options: FacePipelineOptions | None = None
+) -> PhotoFaces:
+    """
+    Decodes a (group) photo, detects every face and batch-encodes them in one pass.
+    Face pool job, like encode_photo.
+    """
+    options = options or FacePipelineOptions()
+    timings: dict[str, float] = {}
+    backend = get_face_backend()
+    empty = np.empty((0, ENCODING_DIM))
+
+    start = time.perf_counter()
+    try:
+        img = _open_normalized_image(image_bytes, options.decode_target_dim)
+    except Exception:
+        return PhotoFaces(encodings=empty, error="Unable to load submitted image")
+    timings["decode_ms"] = _elapsed_ms(start)
+
+    encodings, boxes = _detect_and_encode(img, backend, options, timings, first_only=False)
+    if not encodings:
+        return PhotoFaces(encodings=empty, error="No faces detected", timings=timings)
+    return PhotoFaces(
+        encodings=np.asarray(encodings, dtype=np.float64), boxes=tuple(boxes), timings=timings
+    )
+
+
 def verify_face_match(
     *,
     submitted_photo_b64: str,
     reference_image_path: Path,
     tolerance: float = 0.6,
+    options: FacePipelineOptions | None = None,
+    face_box: tuple[float, float, float, float] | None = None,
+    templates: np.ndarray | None = None,
 ) -> FaceMatchResult:
+    """
+    Verifies the submitted photo against the student's reference templates.
+    Preloaded templates (e.g. read from tbl_face_templates) are used as-is, without
+    touching the reference files; otherwise they are resolved from reference_image_path.
+    """
+    pending = _prepare_match(
+        FaceMatchRequest(
+            submitted_photo_b64=submitted_photo_b64,
+            reference_image_path=reference_image_path,
+            tolerance=tolerance,
+            options=options,
+            face_box=face_box,
+            templates=templates,
+        )
+    )
+    if isinstance(pending, FaceMatchResult):
+        return pending
+    # Decode/detect/encode runs in the face pool; raises FacePoolBusy/FacePoolTimeout.
+    submitted = get_face_pool().run(
+        encode_photo, pending.submitted_bytes, pending.options, pending.face_box
+    )
+    return _finish_match(pending, submitted)
+
+
+def verify_face_matches(requests: list[FaceMatchRequest]) -> list[FaceMatchResult]:
+    """
+    verify_face_match for several photos, with their face pool jobs in flight together
+    (up to one per worker; when the queue is full, the oldest job is collected first).
+    Results are in request order. Raises FacePoolBusy if the pool is saturated by other
+    requests, or FacePoolTimeout.
+    """
+    results: list[FaceMatchResult | None] = [None] * len(requests)
+    pool = get_face_pool()
+    window = max(1, pool.workers)
+    in_flight: list[tuple[int, _PendingMatch, Any]] = []
+
+    def finish_oldest() -> None:
+        i, pending, fut = in_flight.pop(0)
+        results[i] = _finish_match(pending, pool.result(fut))
+
+    for i, request in enumerate(requests):
+        pending = _prepare_match(request)
+        if isinstance(pending, FaceMatchResult):
+            results[i] = pending
+            continue
+        while True:
+            try:
+                fut = pool.submit(
+                    encode_photo, pending.submitted_bytes, pending.options, pending.face_box
+                )
+                break
+            except FacePoolBusy:
+                if not in_flight:
+                    raise
+                finish_oldest()
+        in_flight.append((i, pending, fut))
+        while len(in_flight) >= window:
+            finish_oldest()
+    while in_flight:
+        finish_oldest()
+    return results
+
+
+def _prepare_match(request: FaceMatchRequest) -> _PendingMatch | FaceMatchResult:
+    """
+    Everything of a verification before its face pool job: the reference templates and
+    the decoded photo. Returns the result instead when there is nothing to encode
+    (cache hit, bad photo, missing reference).
+    """
+    reference_image_path = request.reference_image_path
+    templates = request.templates
+    tolerance = request.tolerance
+    face_box = request.face_box
+
     # IMPORTANT: check this first so tests don't import face_recognition
-    if not reference_image_path.exists():
-        return FaceMatchResult(status="error", error="Reference image not found")
+    if templates is not None:
+        templates = np.asarray(templates, dtype=np.float64)
+        ref_version = ("templates", hashlib.sha256(templates.tobytes()).hexdigest())
+    else:
+        try:
+            ref_version = reference_version(reference_image_path)
+        except OSError:
+            return FaceMatchResult(status="error", error="Reference image not found")
 
+    submitted_photo_b64 = request.submitted_photo_b64
     if submitted_photo_b64.startswith("data:"):
         submitted_photo_b64 = submitted_photo_b64.split(",", 1)[1]
 
@@ -127,29 +1501,344 @@ def verify_face_match(
     except ValueError as e:
         return FaceMatchResult(status="error", error=str(e))
 
-    fr = _fr()  # lazy import here (after early exits)
+    options = request.options or _pipeline_options
+    # Same reference, same photo bytes, same settings -> same outcome. The reference version
+    # is the entry version, so re-enrolling or adding a template invalidates it.
+    cache_key = (
+        str(reference_image_path),
+        hashlib.sha256(submitted_bytes).hexdigest(),
+        float(tolerance),
+        options,
+        tuple(face_box) if face_box else None,
+    )
+    cached = _match_cache.get(cache_key, ref_version)
+    if cached is not None:
+        logger.debug("face match cache hit | reference=%s", reference_image_path)
+        return cached
+
+    if templates is None:
+        templates, error = resolve_reference_templates(reference_image_path, version=ref_version)
+        if error:
+            return FaceMatchResult(status="error", error=error)
+
+    return _PendingMatch(
+        cache_key=cache_key,
+        ref_version=ref_version,
+        templates=templates,
+        submitted_bytes=submitted_bytes,
+        options=options,
+        face_box=face_box,
+        tolerance=float(tolerance),
+    )
+
+
+def _finish_match(pending: _PendingMatch, submitted: PhotoEncoding) -> FaceMatchResult:
+    logger.debug("face pipeline timings | %s", submitted.timings)
+    if submitted.error:
+        result = FaceMatchResult(status="error", error=submitted.error, timings=submitted.timings)
+    else:
+        # The probe is compared against every template (and the centroid) in one call.
+        gallery = _match_gallery(pending.templates)
+        matches = get_face_backend().compare(
+            gallery, submitted.encoding, tolerance=pending.tolerance
+        )
+        if any(matches):
+            result = FaceMatchResult(status="success", timings=submitted.timings)
+        else:
+            result = FaceMatchResult(
+                status="error", error="Face does not match reference", timings=submitted.timings
+            )
+
+    _match_cache.put(pending.cache_key, pending.ref_version, result)
+    return result
+
+
+def face_distances(gallery: np.ndarray | QuantizedEncodings, probe) -> np.ndarray:
+    """
+    Euclidean distance from probe to every row of gallery, in one vectorized call.
+    A quantized gallery is dequantized inside the distance computation.
+    """
+    if isinstance(gallery, QuantizedEncodings):
+        return gallery.distances(probe)
+    return np.linalg.norm(gallery - np.asarray(probe, dtype=gallery.dtype), axis=1)
+
+
+def identify_face(
+    *,
+    submitted_photo_b64: str,
+    gallery: np.ndarray | QuantizedEncodings,
+    tolerance: float = 0.6,
+    options: FacePipelineOptions | None = None,
+) -> FaceIdentifyResult:
+    """
+    1:N identification: encodes the submitted photo once and compares it against every
+    row of gallery (N x 128). Returns the closest row if it is within tolerance.
+    """
+    if gallery.size == 0:
+        return FaceIdentifyResult(status="error", error="No enrolled faces to compare against")
 
     try:
-        reference_arr = fr.load_image_file(str(reference_image_path))
-    except Exception:
-        return FaceMatchResult(status="error", error="Unable to load reference image")
+        submitted_bytes = _decode_base64_to_bytes(submitted_photo_b64)
+    except ValueError as e:
+        return FaceIdentifyResult(status="error", error=str(e))
+
+    submitted = get_face_pool().run(encode_photo, submitted_bytes, options or _pipeline_options)
+    if submitted.error:
+        return FaceIdentifyResult(status="error", error=submitted.error, timings=submitted.timings)
+
+    distances = face_distances(gallery, submitted.encoding)
+    best = int(np.argmin(distances))
+    distance = float(distances[best])
+    if distance > tolerance:
+        return FaceIdentifyResult(
+            status="error",
+            error="No matching student",
+            distance=distance,
+            timings=submitted.timings,
+        )
+    return FaceIdentifyResult(
+        status="success", index=best, distance=distance, timings=submitted.timings
+    )
+
+
+def pairwise_face_distances(
+    probes: np.ndarray, gallery: np.ndarray | QuantizedEncodings
+) -> np.ndarray:
+    """
+    faces x gallery Euclidean distance matrix, via |a|^2 + |b|^2 - 2ab (one matmul).
+    """
+    if isinstance(gallery, QuantizedEncodings):
+        return gallery.pairwise(probes)
+    probes = np.asarray(probes, dtype=np.float64)
+    gallery = np.asarray(gallery, dtype=np.float64)
+    sq = (
+        np.einsum("ij,ij->i", probes, probes)[:, None]
+        + np.einsum("ij,ij->i", gallery, gallery)[None, :]
+        - 2.0 * (probes @ gallery.T)
+    )
+    return np.sqrt(np.maximum(sq, 0.0))
+
+
+def assign_faces(distances: np.ndarray, tolerance: float) -> list[GroupMatch]:
+    """
+    One-to-one assignment of faces (rows) to gallery entries (columns).
+    Greedy on ascending distance: the closest remaining pair within tolerance is taken
+    first, and neither side can be matched again.
+    """
+    faces, students = np.nonzero(distances <= tolerance)
+    order = np.argsort(distances[faces, students], kind="stable")
+
+    used_faces: set[int] = set()
+    used_students: set[int] = set()
+    matches: list[GroupMatch] = []
+    for k in order:
+        face, student = int(faces[k]), int(students[k])
+        if face in used_faces or student in used_students:
+            continue
+        used_faces.add(face)
+        used_students.add(student)
+        matches.append(GroupMatch(face, student, float(distances[face, student])))
+    return matches
+
+
+def identify_group_photo(
+    *,
+    submitted_photo_b64: str,
+    gallery: np.ndarray | QuantizedEncodings,
+    tolerance: float = 0.6,
+    options: FacePipelineOptions | None = None,
+) -> GroupIdentifyResult:
+    """
+    Detects every face in one photo and matches all of them against gallery at once
+    (faces x gallery distance matrix, one-to-one assignment).
+    """
+    if gallery.size == 0:
+        return GroupIdentifyResult(status="error", error="No enrolled faces to compare against")
 
     try:
-        submitted_arr = _load_image_from_bytes(submitted_bytes, fr)
+        submitted_bytes = _decode_base64_to_bytes(submitted_photo_b64)
+    except ValueError as e:
+        return GroupIdentifyResult(status="error", error=str(e))
+
+    faces = get_face_pool().run(
+        encode_photo_faces, submitted_bytes, options or _group_pipeline_options
+    )
+    if faces.error:
+        return GroupIdentifyResult(status="error", error=faces.error, timings=faces.timings)
+
+    matches = assign_faces(pairwise_face_distances(faces.encodings, gallery), tolerance)
+    return GroupIdentifyResult(
+        status="success",
+        matches=tuple(matches),
+        faces_detected=len(faces.encodings),
+        timings=faces.timings,
+    )
+
+
+# -------------------------
+# Campus-wide identification
+# -------------------------
+
+IDENTIFY_CANDIDATES = 3
+FACE_INDEX_RETRY_AFTER_SECONDS = 30
+
+
+class FaceIndexUnavailable(FacePoolError):
+    """
+    The campus index doesn't exist yet and is being built in the background. Routes map it
+    like the pool errors: 503 with Retry-After.
+    """
+
+    status_code = 503
+
+
+_index_builds: dict[Path, threading.Thread] = {}
+_index_builds_lock = threading.Lock()
+
+
+def enrolled_face_index(user_data_dir: Path) -> FaceIndex:
+    """
+    Returns the campus-wide index. If it hasn't been built yet, starts building it in the
+    background and raises FaceIndexUnavailable, so no request thread pays for the build.
+    """
+    index = get_face_index(user_data_dir, dim=ENCODING_DIM)
+    if not index.exists:
+        start_face_index_build(user_data_dir)
+        raise FaceIndexUnavailable(
+            "Face index is being built", retry_after=FACE_INDEX_RETRY_AFTER_SECONDS
+        )
+    return index
+
+
+def start_face_index_build(user_data_dir: Path) -> threading.Thread:
+    """
+    Builds the index from the reference sidecars in a daemon thread, one build per
+    directory at a time. Returns the running build's thread.
+    """
+    with _index_builds_lock:
+        build = _index_builds.get(user_data_dir)
+        if build is None or not build.is_alive():
+            build = threading.Thread(
+                target=_build_face_index,
+                args=(user_data_dir,),
+                name="face-index-build",
+                daemon=True,
+            )
+            _index_builds[user_data_dir] = build
+            build.start()
+    return build
+
+
+def _build_face_index(user_data_dir: Path) -> None:
+    try:
+        rebuild_face_index(user_data_dir, encode_missing=False)
     except Exception:
-        return FaceMatchResult(status="error", error="Unable to load submitted image")
+        logger.exception("face index build failed | dir=%s", user_data_dir)
+
+
+def rebuild_face_index(user_data_dir: Path, *, encode_missing: bool = True) -> int:
+    """
+    Rebuilds the index from every student's reference (sidecar, cache or JPEG).
+    With encode_missing=False only stored sidecars are read: references without one are
+    left out (the backfill script encodes them and rebuilds the index), so the build never
+    runs face detection outside the face pool.
+    Returns the number of indexed students.
+    """
+    entries: dict[str, np.ndarray] = {}
+    skipped = 0
+    for ref_path in sorted((user_data_dir / "Student").glob("*/reference_image.jpg")):
+        if encode_missing:
+            encoding, _error = resolve_reference_encoding(ref_path)
+        else:
+            encoding = load_reference_encoding(ref_path)
+        if encoding is not None:
+            entries[ref_path.parent.name] = encoding
+        else:
+            skipped += 1
+
+    get_face_index(user_data_dir, dim=ENCODING_DIM).rebuild(entries)
+    logger.info("face index rebuilt | students=%d skipped=%d", len(entries), skipped)
+    return len(entries)
+
+
+def update_face_index(*, user_data_dir: Path, euid: str) -> None:
+    update_face_index_many(user_data_dir=user_data_dir, euids=[euid])
+
+
+def update_face_index_many(*, user_data_dir: Path, euids: list[str]) -> None:
+    """
+    Incremental index maintenance after (re-)enrollment. Uses the stored sidecars; a
+    student whose reference has no usable encoding is removed. The index file is rewritten
+    once for all of euids. Best-effort: a failure leaves the entries stale, and
+    identify_enrolled_face re-checks candidates against their reference.
+    """
+    index = get_face_index(user_data_dir, dim=ENCODING_DIM)
+    if not index.exists:
+        return  # built from the sidecars on first use
+
+    entries: dict[str, np.ndarray] = {}
+    missing: list[str] = []
+    for euid in euids:
+        encoding = load_reference_encoding(reference_image_path(user_data_dir, euid))
+        if encoding is None:
+            missing.append(euid)
+        else:
+            entries[euid] = encoding
+    try:
+        if entries:
+            index.upsert_many(entries)
+        for euid in missing:
+            index.remove(euid)
+    except (OSError, TimeoutError):
+        logger.warning("face index not updated | euids=%s", ",".join(euids), exc_info=True)
+
+
+def identify_enrolled_face(
+    *,
+    submitted_photo_b64: str,
+    user_data_dir: Path,
+    tolerance: float = 0.6,
+    options: FacePipelineOptions | None = None,
+    face_box: tuple[float, float, float, float] | None = None,
+) -> FaceSearchResult:
+    """
+    1:N identification against every enrolled student via the k-NN index.
+    The nearest few candidates are re-checked against their current reference encoding
+    (a cache hit in the common case), so a stale index entry can't grant a match.
+    """
+    try:
+        submitted_bytes = _decode_base64_to_bytes(submitted_photo_b64)
+    except ValueError as e:
+        return FaceSearchResult(status="error", error=str(e))
+
+    index = enrolled_face_index(user_data_dir)
+    if len(index) == 0:
+        return FaceSearchResult(status="error", error="No enrolled faces to compare against")
 
-    ref_encoding = _get_first_encoding(reference_arr, fr)
-    if ref_encoding is None:
-        return FaceMatchResult(status="error", error="No face detected in reference image")
+    submitted = get_face_pool().run(
+        encode_photo, submitted_bytes, options or _pipeline_options, face_box
+    )
+    if submitted.error:
+        return FaceSearchResult(status="error", error=submitted.error, timings=submitted.timings)
 
-    sub_encoding = _get_first_encoding(submitted_arr, fr)
-    if sub_encoding is None:
-        return FaceMatchResult(status="error", error="No face detected in submitted image")
+    start = time.perf_counter()
+    candidates = index.search(submitted.encoding, k=IDENTIFY_CANDIDATES)
+    timings = {**submitted.timings, "search_ms": _elapsed_ms(start)}
 
-    matches = fr.compare_faces([ref_encoding], sub_encoding, tolerance=tolerance)
-    is_match = bool(matches and matches[0])
+    best: tuple[str, float] | None = None
+    for euid, _indexed_distance in candidates:
+        templates, error = resolve_reference_templates(reference_image_path(user_data_dir, euid))
+        if error:
+            continue
+        distance = float(face_distances(_match_gallery(templates), submitted.encoding).min())
+        if best is None or distance < best[1]:
+            best = (euid, distance)
 
-    if is_match:
-        return FaceMatchResult(status="success")
-    return FaceMatchResult(status="error", error="Face does not match reference")
+    if best is None or best[1] > tolerance:
+        return FaceSearchResult(
+            status="error",
+            error="No matching student",
+            distance=best[1] if best else None,
+            timings=timings,
+        )
+    return FaceSearchResult(status="success", euid=best[0], distance=best[1], timings=timings)
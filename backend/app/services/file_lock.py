@@ -0,0 +1,54 @@
+from __future__ import annotations
+
+import os
+import time
+import uuid
+from collections.abc import Iterator
+from contextlib import contextmanager
+from pathlib import Path
+
+LOCK_TIMEOUT_SECONDS = 10.0
+
+
+@contextmanager
+def file_lock(path: Path, timeout: float = LOCK_TIMEOUT_SECONDS) -> Iterator[None]:
+    """
+    Cross-process mutex via O_EXCL lock file (portable; no fcntl on Windows).
+    A lock older than the timeout is assumed to be left over from a crashed worker, so keep
+    slow work (e.g. encoding images) outside of it. The file holds a token of its holder,
+    which only removes it if it is still theirs.
+    """
+    path.parent.mkdir(parents=True, exist_ok=True)
+    deadline = time.monotonic() + timeout
+    while True:
+        try:
+            fd = os.open(path, os.O_CREAT | os.O_EXCL | os.O_WRONLY)
+            break
+        except FileExistsError:
+            try:
+                if time.time() - path.stat().st_mtime > timeout:
+                    path.unlink(missing_ok=True)
+                    continue
+            except OSError:
+                continue
+            if time.monotonic() > deadline:
+                raise TimeoutError(f"lock file is held: {path}") from None
+            time.sleep(0.01)
+    token = f"{os.getpid()}:{uuid.uuid4().hex}".encode()
+    try:
+        try:
+            os.write(fd, token)
+        finally:
+            os.close(fd)
+        yield
+    finally:
+        _release(path, token)
+
+
+def _release(path: Path, token: bytes) -> None:
+    # A holder that overran the timeout may have lost the lock to another worker by now.
+    try:
+        if path.read_bytes() == token:
+            path.unlink()
+    except OSError:
+        pass
@@ -0,0 +1,255 @@
+from __future__ import annotations
+
+import hashlib
+import json
+import logging
+import sqlite3
+import threading
+import time
+from collections.abc import Callable
+from dataclasses import dataclass
+
+from app.db import repository
+from app.services.result_cache import ResultCache
+
+logger = logging.getLogger(__name__)
+
+IDEMPOTENCY_KEY_HEADER = "Idempotency-Key"
+MAX_KEY_LENGTH = 255
+
+DEFAULT_TTL_SECONDS = 3600
+DEFAULT_CACHE_MAX_ENTRIES = 1024
+DEFAULT_WAIT_SECONDS = 30.0
+# Responses that must not be written to the table (e.g. issued tokens) are replayed from
+# memory for at most this long.
+MEMORY_ONLY_TTL_SECONDS = 60
+# Expired rows are swept from the table every this many stored responses.
+PURGE_EVERY = 100
+
+
+class IdempotencyError(Exception):
+    """
+    Base class for requests that can be neither run nor replayed. Routes map these to
+    HTTP responses.
+    """
+
+    status_code = 409
+
+
+class IdempotencyKeyReused(IdempotencyError):
+    """The key was already used for a different request (other body or sender)."""
+
+    status_code = 422
+
+
+class IdempotencyInProgress(IdempotencyError):
+    """The first request with this key is still running after wait_seconds."""
+
+    status_code = 409
+
+
+@dataclass(frozen=True)
+class StoredResponse:
+    euid: str
+    fingerprint: str
+    status_code: int
+    body: dict
+    expires_at: int  # epoch seconds
+
+
+def validate_idempotency_key(key: str) -> str:
+    """
+    Raises ValueError unless key is 1-255 visible ASCII characters.
+    """
+    if not key or len(key) > MAX_KEY_LENGTH or not all(33 <= ord(c) <= 126 for c in key):
+        raise ValueError(f"{IDEMPOTENCY_KEY_HEADER} must be 1-{MAX_KEY_LENGTH} visible characters")
+    return key
+
+
+def request_fingerprint(body: bytes) -> str:
+    return hashlib.sha256(body).hexdigest()
+
+
+def _replayable(status_code: int) -> bool:
+    # Busy/timeout and server errors are transient: a retry should run again.
+    return status_code < 500 and status_code != 429
+
+
+class IdempotencyStore:
+    """
+    Remembers the response to each (scope, Idempotency-Key) for ttl_seconds, so a client
+    retrying a request gets the first response back instead of running it again.
+
+    Snapshots live in tbl_idempotency_keys (they survive restarts) with a bounded in-memory
+    LRU in front. A key is bound to its sender and request body: reusing it for a different
+    request is an error. A duplicate that arrives while the first request is still running
+    waits for it (up to wait_seconds) rather than running in parallel. Only responses that
+    a retry can't change are stored; 429 and 5xx are not, so those requests run again.
+    """
+
+    def __init__(
+        self,
+        *,
+        ttl_seconds: int,
+        max_entries: int,
+        wait_seconds: float,
+        clock: Callable[[], float] = time.time,
+    ):
+        self.ttl_seconds = max(0, int(ttl_seconds))
+        self.wait_seconds = max(0.0, float(wait_seconds))
+        self._clock = clock
+        self._front = ResultCache(max_entries=max_entries, ttl_seconds=self.ttl_seconds)
+        self._in_flight: dict[tuple[str, str], threading.Event] = {}
+        self._lock = threading.Lock()
+        self._stored = 0
+        self.replays = 0
+        self.waits = 0
+
+    @property
+    def enabled(self) -> bool:
+        return self.ttl_seconds > 0
+
+    def execute(
+        self,
+        db: sqlite3.Connection,
+        *,
+        scope: str,
+        key: str,
+        euid: str,
+        fingerprint: str,
+        handler: Callable[[], tuple[dict, int]],
+        replayable: Callable[[int], bool] = _replayable,
+        persist: bool = True,
+    ) -> tuple[dict, int, bool]:
+        """
+        Runs handler (returning a JSON body and status) at most once per key, or replays the
+        stored response. Returns (body, status, replayed).
+        replayable decides which statuses are kept. persist=False keeps them in memory only,
+        for MEMORY_ONLY_TTL_SECONDS, for bodies that must not be written to disk.
+        Raises IdempotencyKeyReused or IdempotencyInProgress.
+        """
+        if not self.enabled:
+            body, status = handler()
+            return body, status, False
+
+        slot = (scope, key)
+        while True:
+            stored = self._lookup(db, scope=scope, key=key)
+            if stored is not None:
+                if stored.euid != euid or stored.fingerprint != fingerprint:
+                    raise IdempotencyKeyReused(
+                        f"{IDEMPOTENCY_KEY_HEADER} was already used for a different request"
+                    )
+                self.replays += 1
+                return stored.body, stored.status_code, True
+
+            with self._lock:
+                first = self._in_flight.get(slot)
+                if first is None:
+                    self._in_flight[slot] = threading.Event()
+                    break
+            # Another thread is running this key: wait, then look again. If it stored
+            # nothing (transient failure), this request runs it.
+            self.waits += 1
+            if not first.wait(self.wait_seconds):
+                raise IdempotencyInProgress(
+                    f"A request with this {IDEMPOTENCY_KEY_HEADER} is still in progress"
+                )
+
+        try:
+            body, status = handler()
+            if replayable(status):
+                ttl = self.ttl_seconds
+                if not persist:
+                    ttl = min(ttl, MEMORY_ONLY_TTL_SECONDS)
+                response = StoredResponse(
+                    euid=euid,
+                    fingerprint=fingerprint,
+                    status_code=status,
+                    body=body,
+                    expires_at=int(self._clock()) + ttl,
+                )
+                if persist:
+                    self._store(db, scope=scope, key=key, response=response)
+                else:
+                    self._front.put((scope, key), 0, response)
+            return body, status, False
+        finally:
+            with self._lock:
+                self._in_flight.pop(slot).set()
+
+    def _lookup(self, db: sqlite3.Connection, *, scope: str, key: str) -> StoredResponse | None:
+        now = int(self._clock())
+        stored = self._front.get((scope, key), 0)
+        if stored is not None and stored.expires_at > now:
+            return stored
+        row = repository.get_idempotency_record(db, scope=scope, key=key, now=now)
+        if row is None:
+            return None
+        stored = StoredResponse(
+            euid=row["euid"],
+            fingerprint=row["fingerprint"],
+            status_code=int(row["status"]),
+            body=json.loads(row["body"]),
+            expires_at=int(row["expires_at"]),
+        )
+        self._front.put((scope, key), 0, stored)
+        return stored
+
+    def _store(
+        self, db: sqlite3.Connection, *, scope: str, key: str, response: StoredResponse
+    ) -> None:
+        try:
+            repository.put_idempotency_record(
+                db,
+                scope=scope,
+                key=key,
+                euid=response.euid,
+                fingerprint=response.fingerprint,
+                status=response.status_code,
+                body=json.dumps(response.body),
+                expires_at=response.expires_at,
+            )
+            self._stored += 1
+            if self._stored % PURGE_EVERY == 0:
+                repository.delete_expired_idempotency_records(db, now=int(self._clock()))
+            db.commit()
+        except sqlite3.Error:
+            # The request itself succeeded; a retry just runs it again.
+            db.rollback()
+            logger.warning("idempotency snapshot not stored | scope=%s", scope, exc_info=True)
+            return
+        self._front.put((scope, key), 0, response)
+
+    def stats(self) -> dict:
+        with self._lock:
+            in_flight = len(self._in_flight)
+        return {
+            "ttl_seconds": self.ttl_seconds,
+            "in_flight": in_flight,
+            "replays": self.replays,
+            "waits": self.waits,
+            "front": self._front.stats(),
+        }
+
+
+_store = IdempotencyStore(
+    ttl_seconds=DEFAULT_TTL_SECONDS,
+    max_entries=DEFAULT_CACHE_MAX_ENTRIES,
+    wait_seconds=DEFAULT_WAIT_SECONDS,
+)
+
+
+def configure_idempotency(*, ttl_seconds: int, max_entries: int, wait_seconds: float) -> None:
+    """
+    Replaces the process-wide idempotency store. Called once from create_app with values
+    from Config.
+    """
+    global _store
+    _store = IdempotencyStore(
+        ttl_seconds=ttl_seconds, max_entries=max_entries, wait_seconds=wait_seconds
+    )
+
+
+def get_idempotency_store() -> IdempotencyStore:
+    return _store
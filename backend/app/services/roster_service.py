@@ -0,0 +1,324 @@
+from __future__ import annotations
+
+import json
+import logging
+import os
+import threading
+import uuid
+from bisect import bisect_left
+from dataclasses import dataclass
+from datetime import UTC, datetime
+from pathlib import Path
+
+import numpy as np
+
+from app.db import repository
+from app.services.encoding_quant import QuantizedEncodings, encoding_arrays, quantize_encodings
+from app.services.face_service import (
+    ENCODING_DIM,
+    get_encoding_dtype,
+    reference_image_path,
+    reference_version,
+    resolve_reference_encoding,
+)
+from app.services.file_lock import file_lock
+
+logger = logging.getLogger(__name__)
+
+# Per-class artifact: <user_data_dir>/Roster/<code>/index.json points at an immutable
+# encodings-<generation>.npy (plus scale-<generation>.npy for int8). A rebuild writes a new
+# generation and then atomically replaces index.json, so readers never see a torn pair.
+# The generation it replaced is kept until the next rebuild, for readers that had already
+# read the old index.json.
+ROSTER_DIRNAME = "Roster"
+ROSTER_INDEX_FILENAME = "index.json"
+ROSTER_FORMAT_VERSION = 1
+
+
+@dataclass(frozen=True)
+class RosterMatrix:
+    """
+    Reference encodings for a class roster, stacked for vectorized 1:N comparison.
+    Row i of encodings belongs to euids[i]; euids are sorted, so row() is a binary search.
+
+    encodings is a read-only memory map of the class's matrix file, so every worker process
+    shares the same page-cache pages. Stored in the configured encoding dtype: a
+    float32/float16/int8 roster is a QuantizedEncodings (face_distances handles both).
+    """
+
+    euids: tuple[str, ...]
+    encodings: np.ndarray | QuantizedEncodings  # len(euids) x 128
+    missing: tuple[str, ...] = ()  # enrolled students without a usable reference
+
+    def row(self, euid: str) -> int | None:
+        i = bisect_left(self.euids, euid)
+        return i if i < len(self.euids) and self.euids[i] == euid else None
+
+
+# roster_dir -> (index.json stamp, roster euids, matrix)
+_matrices: dict[Path, tuple[tuple[int, ...], tuple[str, ...], RosterMatrix]] = {}
+_matrices_lock = threading.Lock()
+
+
+def roster_dir(user_data_dir: Path, code: str) -> Path:
+    return user_data_dir / ROSTER_DIRNAME / code
+
+
+def get_roster_matrix(
+    *, code: str, euids: list[str], user_data_dir: Path, refresh: bool = False
+) -> RosterMatrix:
+    """
+    Returns the encoding matrix for a class roster.
+
+    A lookup costs one stat of the class's index.json: while it is unchanged and covers the
+    same students, the process reuses its mapped matrix; if another worker rebuilt it, the
+    new generation is mapped. Reference changes are not looked for here. Whatever rewrites
+    a student's reference (enrollment, added templates, bulk enrollment) calls
+    refresh_student_rosters/refresh_class_roster, which pass refresh=True.
+
+    refresh=True (or a roster the file doesn't cover) compares each student's reference
+    version with the one the file was built from, and rebuilds incrementally if any differ:
+    unchanged students keep their rows and only new or re-enrolled ones go through the
+    reference encoding cache.
+    """
+    roster = tuple(sorted(set(euids)))
+    directory = roster_dir(user_data_dir, code)
+
+    if not refresh:
+        stamp = _index_stamp(directory)
+        with _matrices_lock:
+            cached = _matrices.get(directory)
+        if cached is not None and stamp is not None and cached[:2] == (stamp, roster):
+            return cached[2]
+        index = _read_index(directory)
+        if _covers(index, roster):
+            try:
+                return _remember(directory, stamp, roster, _open_matrix(directory, index))
+            except FileNotFoundError:
+                pass  # rebuilt twice since index.json was read: look again under the lock
+
+    signature = _signature(roster, user_data_dir)
+    stamp = _index_stamp(directory)
+    index = _read_index(directory)
+    matrix = None
+    if _is_current(index, signature):
+        try:
+            matrix = _open_matrix(directory, index)
+        except FileNotFoundError:
+            pass
+    if matrix is None:
+        # Also maps a current file under the lock, where generations aren't removed
+        matrix = _rebuild(directory, signature, user_data_dir)
+        stamp = _index_stamp(directory)
+    return _remember(directory, stamp, roster, matrix)
+
+
+def refresh_student_rosters(db, *, euid: str, user_data_dir: Path) -> None:
+    """
+    Brings the matrix file of every class the student is enrolled in up to date, after an
+    enrollment or a re-enrollment. Best-effort: a failure only defers the rebuild to the
+    next roster lookup.
+    """
+    for row in repository.get_student_classes(db, student_euid=euid):
+        refresh_class_roster(db, code=row["code"], user_data_dir=user_data_dir)
+
+
+def refresh_class_roster(db, *, code: str, user_data_dir: Path) -> None:
+    """
+    Brings one class's matrix file up to date after its roster changed. Best-effort.
+    """
+    try:
+        get_roster_matrix(
+            code=code,
+            euids=repository.get_class_roster(db, code=code),
+            user_data_dir=user_data_dir,
+            refresh=True,
+        )
+    except (OSError, TimeoutError, ValueError):
+        logger.warning("roster matrix not refreshed | code=%s", code, exc_info=True)
+
+
+def invalidate_roster_matrix(code: str) -> None:
+    with _matrices_lock:
+        for directory in [d for d in _matrices if d.name == code]:
+            del _matrices[directory]
+
+
+def _remember(
+    directory: Path, stamp: tuple[int, ...] | None, roster: tuple[str, ...], matrix: RosterMatrix
+) -> RosterMatrix:
+    if stamp is not None:
+        with _matrices_lock:
+            _matrices[directory] = (stamp, roster, matrix)
+    return matrix
+
+
+def _index_stamp(directory: Path) -> tuple[int, ...] | None:
+    # index.json is replaced (never rewritten in place), so a new generation changes the inode.
+    try:
+        st = (directory / ROSTER_INDEX_FILENAME).stat()
+    except OSError:
+        return None
+    return (st.st_mtime_ns, st.st_size, st.st_ino)
+
+
+def _covers(index: dict | None, roster: tuple[str, ...]) -> bool:
+    return (
+        index is not None
+        and index.get("dtype") == get_encoding_dtype()
+        and tuple(sorted(index.get("students", {}))) == roster
+    )
+
+
+def _signature(euids: tuple[str, ...], user_data_dir: Path) -> dict[str, list[int] | None]:
+    signature: dict[str, list[int] | None] = {}
+    for euid in euids:
+        try:
+            signature[euid] = list(reference_version(reference_image_path(user_data_dir, euid)))
+        except OSError:
+            signature[euid] = None
+    return signature
+
+
+def _is_current(index: dict | None, signature: dict) -> bool:
+    return (
+        index is not None
+        and index.get("dtype") == get_encoding_dtype()
+        and index.get("students") == signature
+    )
+
+
+def _read_index(directory: Path) -> dict | None:
+    try:
+        index = json.loads((directory / ROSTER_INDEX_FILENAME).read_text(encoding="utf-8"))
+    except (OSError, ValueError):
+        return None
+    if index.get("version") != ROSTER_FORMAT_VERSION:
+        return None
+    return index
+
+
+def _open_matrix(directory: Path, index: dict) -> RosterMatrix:
+    euids = tuple(index["euids"])
+    if not index.get("matrix"):
+        encodings = np.empty((0, ENCODING_DIM))
+        encodings.setflags(write=False)
+    else:
+        data = np.load(directory / index["matrix"], mmap_mode="r")
+        if data.dtype == np.float64:
+            encodings = data
+        else:
+            scale = np.load(directory / index["scale"]) if index.get("scale") else None
+            encodings = QuantizedEncodings(data, scale)
+    return RosterMatrix(euids=euids, encodings=encodings, missing=tuple(index["missing"]))
+
+
+def _rebuild(directory: Path, signature: dict, user_data_dir: Path) -> RosterMatrix:
+    directory.mkdir(parents=True, exist_ok=True)
+    # Encode what changed before taking the lock: a reference without a sidecar is a JPEG
+    # encode, and a roster of those would outlast the lock's stale timeout.
+    previous = _read_index(directory)
+    if _is_current(previous, signature):
+        return _open_matrix(directory, previous)
+    resolved = {
+        euid: _resolve_encoding(user_data_dir, euid, version)
+        for euid, version in signature.items()
+        if version is not None and not _reusable(previous, euid, version)
+    }
+
+    with file_lock(directory / ".lock"):
+        previous = _read_index(directory)
+        if _is_current(previous, signature):  # another worker got here first
+            return _open_matrix(directory, previous)
+
+        old = _open_matrix(directory, previous) if previous else None
+        old_versions = previous["students"] if previous else {}
+
+        present: list[str] = []
+        rows: list[np.ndarray] = []
+        missing: list[str] = []
+        reused = 0
+        for euid, version in signature.items():
+            if version is None:
+                missing.append(euid)
+                continue
+            old_row = old.row(euid) if old is not None else None
+            if old_row is not None and old_versions.get(euid) == version:
+                rows.append(np.asarray(old.encodings[old_row], dtype=np.float64))
+                reused += 1
+            else:
+                # Only not resolved yet if another worker's generation landed in between
+                if euid in resolved:
+                    encoding = resolved[euid]
+                else:
+                    encoding = _resolve_encoding(user_data_dir, euid, version)
+                if encoding is None:
+                    missing.append(euid)
+                    continue
+                rows.append(encoding)
+            present.append(euid)
+
+        index = _write_generation(
+            directory,
+            rows,
+            {"euids": present, "missing": missing, "students": signature},
+        )
+        _remove_stale_generations(directory, keep=(index, previous))
+
+    logger.info(
+        "roster matrix rebuilt | dir=%s students=%d reused=%d missing=%d",
+        directory,
+        len(present),
+        reused,
+        len(missing),
+    )
+    return _open_matrix(directory, index)
+
+
+def _reusable(index: dict | None, euid: str, version: list[int]) -> bool:
+    return index is not None and index["students"].get(euid) == version and euid in index["euids"]
+
+
+def _resolve_encoding(user_data_dir: Path, euid: str, version: list[int]) -> np.ndarray | None:
+    encoding, error = resolve_reference_encoding(
+        reference_image_path(user_data_dir, euid), version=tuple(version)
+    )
+    return None if error else np.asarray(encoding, dtype=np.float64)
+
+
+def _write_generation(directory: Path, rows: list[np.ndarray], fields: dict) -> dict:
+    dtype = get_encoding_dtype()
+    index = {
+        "version": ROSTER_FORMAT_VERSION,
+        "dtype": dtype,
+        "matrix": None,
+        "scale": None,
+        "built_at": datetime.now(UTC).isoformat(),
+        **fields,
+    }
+    if rows:
+        generation = uuid.uuid4().hex[:12]
+        arrays = encoding_arrays(quantize_encodings(np.vstack(rows), dtype))
+        index["matrix"] = f"encodings-{generation}.npy"
+        np.save(directory / index["matrix"], np.ascontiguousarray(arrays["encodings"]))
+        if "scale" in arrays:
+            index["scale"] = f"scale-{generation}.npy"
+            np.save(directory / index["scale"], arrays["scale"])
+
+    tmp = directory / f".{ROSTER_INDEX_FILENAME}.{os.getpid()}.tmp"
+    tmp.write_text(json.dumps(index), encoding="utf-8")
+    os.replace(tmp, directory / ROSTER_INDEX_FILENAME)
+    return index
+
+
+def _remove_stale_generations(directory: Path, *, keep: tuple[dict | None, ...]) -> None:
+    # Only generations older than the previous one go: a reader may have read the replaced
+    # index.json but not yet mapped its matrix. Workers still mapping an old generation keep
+    # their pages (POSIX); on Windows the unlink fails while mapped and is retried later.
+    names = {index[field] for index in keep if index for field in ("matrix", "scale")}
+    for path in [*directory.glob("encodings-*.npy"), *directory.glob("scale-*.npy")]:
+        if path.name not in names:
+            try:
+                path.unlink()
+            except OSError:
+                pass
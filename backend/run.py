@@ -1,7 +1,6 @@
 from app.factory import create_app
 from waitress import serve
 
-app = create_app()
-
+# Only build the app when run as the entry point: spawned face workers re-import this module.
 if __name__ == "__main__":
-    serve(app, host="0.0.0.0", port=8000)
+    serve(create_app(), host="0.0.0.0", port=8000)
@@ -0,0 +1,273 @@
+"""
+Backfill precomputed face encodings for existing reference images.
+
+Walks <user_data_dir>/Student/*/reference_image.jpg and encodes every reference that has no
+current template sidecar, in a process pool. Each result is written where verification reads
+it: the sidecar next to the image and, for registered students, tbl_face_templates. References
+whose sidecar is already current only get their database rows filled in.
+
+Progress is checkpointed (one JSON line per student, flushed after each database commit), so
+an interrupted run resumes where it stopped. A reference replaced since it was checkpointed
+is processed again; failures ("no face detected", ...) are only retried with --retry-failed.
+The campus face index is rebuilt at the end.
+
+Usage:
+  python -m scripts.backfill_face_encodings --workers 8
+  python -m scripts.backfill_face_encodings --user-data-dir ./user_data --retry-failed
+"""
+
+from __future__ import annotations
+
+import argparse
+import functools
+import json
+import multiprocessing
+import os
+import sqlite3
+import time
+from collections import defaultdict
+from collections.abc import Iterator
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import dataclass, field
+from pathlib import Path
+
+from app.db import repository
+from app.db.connection import get_db
+from app.factory import create_app
+from app.services.auth_service import sync_face_templates
+from app.services.face_service import (
+    ENCODING_MODEL,
+    PhotoEncoding,
+    encode_reference_image,
+    get_face_pipeline_options,
+    init_face_worker,
+    load_reference_templates,
+    rebuild_face_index,
+    write_reference_encoding,
+)
+
+CHECKPOINT_FILENAME = ".backfill_face_encodings.jsonl"
+
+
+@dataclass
+class BackfillReport:
+    total: int = 0
+    skipped: int = 0  # done in an earlier run (checkpoint)
+    present: int = 0  # sidecar already current
+    encoded: int = 0
+    failed: int = 0
+    db_rows: int = 0  # students whose tbl_face_templates rows were written
+    encode_seconds: float = 0.0
+    elapsed_seconds: float = 0.0
+    failures: dict[str, list[str]] = field(default_factory=lambda: defaultdict(list))
+
+    @property
+    def throughput(self) -> float:
+        """References encoded (or failed) per second of encoding wall time."""
+        attempted = self.encoded + self.failed
+        return attempted / self.encode_seconds if self.encode_seconds else 0.0
+
+
+def _reference_stamp(ref_path: Path) -> list[int]:
+    st = ref_path.stat()
+    return [st.st_mtime_ns, st.st_size]
+
+
+def _read_checkpoint(path: Path) -> dict[str, dict]:
+    entries: dict[str, dict] = {}
+    try:
+        lines = path.read_text(encoding="utf-8").splitlines()
+    except OSError:
+        return entries
+    for line in lines:
+        try:
+            entry = json.loads(line)
+        except ValueError:
+            continue  # torn last line from an interrupted run
+        entries[entry["euid"]] = entry
+    return entries
+
+
+def _is_done(entry: dict | None, stamp: list[int], *, retry_failed: bool) -> bool:
+    if entry is None or entry.get("reference") != stamp:
+        return False
+    return entry.get("status") != "failed" or not retry_failed
+
+
+def _encode_all(
+    paths: list[Path], *, workers: int, backend_name: str
+) -> Iterator[tuple[Path, PhotoEncoding]]:
+    encode = functools.partial(
+        encode_reference_image, options=get_face_pipeline_options("enrollment")
+    )
+    if workers == 0:
+        yield from zip(paths, map(encode, paths), strict=True)
+        return
+    # spawn, like the face pool: workers configure their own backend.
+    with ProcessPoolExecutor(
+        max_workers=workers,
+        mp_context=multiprocessing.get_context("spawn"),
+        initializer=init_face_worker,
+        initargs=(backend_name, False),
+    ) as executor:
+        chunksize = max(1, min(16, len(paths) // (workers * 4)))
+        yield from zip(paths, executor.map(encode, paths, chunksize=chunksize), strict=True)
+
+
+class _Progress:
+    def __init__(self, total: int, every_seconds: float):
+        self.total = total
+        self.every_seconds = every_seconds
+        self.start = time.perf_counter()
+        self._last = self.start
+
+    def update(self, done: int, failed: int, *, final: bool = False) -> None:
+        now = time.perf_counter()
+        if not final and now - self._last < self.every_seconds:
+            return
+        self._last = now
+        elapsed = now - self.start
+        rate = done / elapsed if elapsed else 0.0
+        eta = (self.total - done) / rate if rate else float("nan")
+        print(
+            f"  {done}/{self.total} encoded  {rate:.1f}/s  failures {failed}  eta {eta:.0f}s",
+            flush=True,
+        )
+
+
+def run_backfill(
+    db: sqlite3.Connection,
+    *,
+    user_data_dir: Path,
+    workers: int,
+    backend_name: str,
+    checkpoint_path: Path | None = None,
+    retry_failed: bool = False,
+    commit_every: int = 100,
+    progress_seconds: float = 5.0,
+    rebuild_index: bool = True,
+) -> BackfillReport:
+    start = time.perf_counter()
+    report = BackfillReport()
+    checkpoint_path = checkpoint_path or user_data_dir / CHECKPOINT_FILENAME
+    checkpoint = _read_checkpoint(checkpoint_path)
+    students = repository.get_student_euids(db)
+    stored = repository.get_euids_with_face_templates(db, model=ENCODING_MODEL)
+
+    pending_lines: list[dict] = []
+
+    def record(euid: str, stamp: list[int], status: str, error: str | None = None) -> None:
+        pending_lines.append({"euid": euid, "reference": stamp, "status": status, "error": error})
+        if len(pending_lines) >= commit_every:
+            flush()
+
+    def flush() -> None:
+        # Commit first: a checkpointed student always has its database rows.
+        db.commit()
+        if pending_lines:
+            with checkpoint_path.open("a", encoding="utf-8") as f:
+                f.writelines(json.dumps(line) + "\n" for line in pending_lines)
+            pending_lines.clear()
+
+    def store_rows(euid: str) -> None:
+        if euid in students:
+            report.db_rows += bool(sync_face_templates(db, user_data_dir=user_data_dir, euid=euid))
+
+    to_encode: list[Path] = []
+    stamps: dict[Path, list[int]] = {}
+    for ref_path in sorted((user_data_dir / "Student").glob("*/reference_image.jpg")):
+        euid = ref_path.parent.name
+        try:
+            stamps[ref_path] = stamp = _reference_stamp(ref_path)
+        except OSError:
+            continue
+        report.total += 1
+        if _is_done(checkpoint.get(euid), stamp, retry_failed=retry_failed):
+            report.skipped += 1
+        elif load_reference_templates(ref_path) is not None:
+            report.present += 1
+            if euid not in stored:
+                store_rows(euid)
+            record(euid, stamp, "present")
+        else:
+            to_encode.append(ref_path)
+    flush()
+
+    print(
+        f"{report.total} references: {report.skipped} already done, {report.present} with "
+        f"current encodings, {len(to_encode)} to encode ({workers or 'inline'} workers)",
+        flush=True,
+    )
+    progress = _Progress(len(to_encode), progress_seconds)
+    encode_start = time.perf_counter()
+    for ref_path, result in _encode_all(to_encode, workers=workers, backend_name=backend_name):
+        euid = ref_path.parent.name
+        error = result.error
+        if error is None:
+            try:
+                write_reference_encoding(reference_image_path=ref_path, encoding=result.encoding)
+            except (OSError, ValueError) as e:
+                error = f"Unable to store encoding: {e}"
+        if error is None:
+            report.encoded += 1
+            store_rows(euid)
+            record(euid, stamps[ref_path], "encoded")
+        else:
+            report.failed += 1
+            report.failures[error].append(euid)
+            record(euid, stamps[ref_path], "failed", error)
+        progress.update(report.encoded + report.failed, report.failed)
+    flush()
+    report.encode_seconds = time.perf_counter() - encode_start
+    if to_encode:
+        progress.update(report.encoded + report.failed, report.failed, final=True)
+
+    if rebuild_index and (report.encoded or report.present):
+        rebuild_face_index(user_data_dir)
+    report.elapsed_seconds = time.perf_counter() - start
+    return report
+
+
+def _print_report(report: BackfillReport, *, max_listed: int = 10) -> None:
+    print(f"done in {report.elapsed_seconds:.1f}s")
+    print(
+        f"  encoded {report.encoded}, failed {report.failed}, "
+        f"already current {report.present}, skipped {report.skipped}"
+    )
+    print(f"  throughput {report.throughput:.1f} references/s")
+    print(f"  tbl_face_templates rows written for {report.db_rows} students")
+    for error, euids in sorted(report.failures.items(), key=lambda kv: -len(kv[1])):
+        listed = ", ".join(euids[:max_listed]) + (" ..." if len(euids) > max_listed else "")
+        print(f"  {error}: {len(euids)} ({listed})")
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1, help="0 = inline")
+    parser.add_argument("--user-data-dir", type=Path, help="defaults to USER_DATA_DIR")
+    parser.add_argument(
+        "--checkpoint", type=Path, help=f"defaults to <user_data_dir>/{CHECKPOINT_FILENAME}"
+    )
+    parser.add_argument("--retry-failed", action="store_true", help="retry checkpointed failures")
+    parser.add_argument("--commit-every", type=int, default=100)
+    parser.add_argument("--no-index", action="store_true", help="skip the face index rebuild")
+    args = parser.parse_args()
+
+    app = create_app()
+    cfg = app.config["APP_CONFIG"]
+    with app.app_context():
+        report = run_backfill(
+            get_db(),
+            user_data_dir=args.user_data_dir or cfg.user_data_dir,
+            workers=max(0, args.workers),
+            backend_name=cfg.face_backend,
+            checkpoint_path=args.checkpoint,
+            retry_failed=args.retry_failed,
+            commit_every=max(1, args.commit_every),
+            rebuild_index=not args.no_index,
+        )
+    _print_report(report)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,126 @@
+"""
+Benchmark the downscale-before-detect pipeline on sample images.
+
+For every image in a directory, a baseline encoding is computed without any downscaling.
+The pipeline is then re-run for each candidate FACE_MAX_DIM and the script reports, per dim:
+  - p50/p95 of decode, detect and encode latency
+  - face found rate
+  - mean distance to the baseline encoding, and match rate at --tolerance
+
+Usage:
+  python -m scripts.bench_face_downscale ./samples --max-dims 0,320,480,640,800
+"""
+
+from __future__ import annotations
+
+import argparse
+from pathlib import Path
+
+import numpy as np
+
+from app.services.face_service import FacePipelineOptions, encode_photo
+
+IMAGE_SUFFIXES = {".jpg", ".jpeg", ".png"}
+
+
+def _percentile(values: list[float], q: float) -> float:
+    return float(np.percentile(values, q)) if values else float("nan")
+
+
+def _load_samples(image_dir: Path) -> list[tuple[str, bytes]]:
+    paths = sorted(p for p in image_dir.rglob("*") if p.suffix.lower() in IMAGE_SUFFIXES)
+    return [(p.name, p.read_bytes()) for p in paths]
+
+
+def run(
+    samples: list[tuple[str, bytes]],
+    *,
+    max_dims: list[int],
+    encode_max_dim: int,
+    tolerance: float,
+    repeat: int,
+) -> list[dict]:
+    baseline_opts = FacePipelineOptions(detect_max_dim=0, encode_max_dim=0)
+    baseline = {name: encode_photo(data, baseline_opts).encoding for name, data in samples}
+
+    rows = []
+    for max_dim in max_dims:
+        opts = FacePipelineOptions(detect_max_dim=max_dim, encode_max_dim=encode_max_dim)
+        timings: dict[str, list[float]] = {"decode_ms": [], "detect_ms": [], "encode_ms": []}
+        found = matched = compared = 0
+        distances: list[float] = []
+
+        for name, data in samples:
+            result = None
+            for _ in range(repeat):
+                result = encode_photo(data, opts)
+                for key in timings:
+                    if key in result.timings:
+                        timings[key].append(result.timings[key])
+
+            if result is None or result.encoding is None:
+                continue
+            found += 1
+
+            ref = baseline.get(name)
+            if ref is None:
+                continue
+            dist = float(np.linalg.norm(np.asarray(ref) - np.asarray(result.encoding)))
+            distances.append(dist)
+            compared += 1
+            matched += int(dist <= tolerance)
+
+        rows.append(
+            {
+                "max_dim": max_dim,
+                **{f"{k}_p50": _percentile(v, 50) for k, v in timings.items()},
+                **{f"{k}_p95": _percentile(v, 95) for k, v in timings.items()},
+                "found_rate": found / len(samples) if samples else 0.0,
+                "mean_distance": float(np.mean(distances)) if distances else float("nan"),
+                "match_rate": matched / compared if compared else float("nan"),
+            }
+        )
+    return rows
+
+
+def _print_table(rows: list[dict]) -> None:
+    header = (
+        f"{'max_dim':>8} {'decode p50':>11} {'detect p50':>11} {'detect p95':>11} "
+        f"{'encode p50':>11} {'encode p95':>11} {'found':>7} {'dist':>7} {'match':>7}"
+    )
+    print(header)
+    print("-" * len(header))
+    for r in rows:
+        print(
+            f"{r['max_dim'] or 'native':>8} {r['decode_ms_p50']:>11.1f} {r['detect_ms_p50']:>11.1f} "
+            f"{r['detect_ms_p95']:>11.1f} {r['encode_ms_p50']:>11.1f} {r['encode_ms_p95']:>11.1f} "
+            f"{r['found_rate']:>7.1%} {r['mean_distance']:>7.3f} {r['match_rate']:>7.1%}"
+        )
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("image_dir", type=Path, help="directory of sample face photos")
+    parser.add_argument("--max-dims", default="0,320,480,640,800,1024")
+    parser.add_argument("--encode-max-dim", type=int, default=1280)
+    parser.add_argument("--tolerance", type=float, default=0.6)
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    samples = _load_samples(args.image_dir)
+    if not samples:
+        raise SystemExit(f"No images found in {args.image_dir}")
+
+    rows = run(
+        samples,
+        max_dims=[int(d) for d in args.max_dims.split(",")],
+        encode_max_dim=args.encode_max_dim,
+        tolerance=args.tolerance,
+        repeat=args.repeat,
+    )
+    print(f"{len(samples)} images, encode_max_dim={args.encode_max_dim}, repeat={args.repeat}")
+    _print_table(rows)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,150 @@
+"""
+Benchmark the campus-wide face index against a brute-force scan.
+
+Builds a FaceIndex over N encodings (synthetic by default, or every reference sidecar under
+--user-data-dir), then queries it with perturbed copies of indexed encodings (a new capture
+of the same student). For each nprobe it reports:
+  - p50/p95 query latency, next to brute force over the same gallery
+  - recall@1: how often the index returns the brute-force nearest neighbour
+  - mean fraction of the gallery scanned
+
+Usage:
+  python -m scripts.bench_face_index --size 50000 --nprobe 1,4,8,16
+  python -m scripts.bench_face_index --user-data-dir ./user_data
+"""
+
+from __future__ import annotations
+
+import argparse
+import tempfile
+import time
+from pathlib import Path
+
+import numpy as np
+
+from app.services.face_index import FaceIndex
+from app.services.face_service import ENCODING_DIM, load_reference_encoding
+
+
+def _synthetic_gallery(size: int, rng: np.random.Generator) -> dict[str, np.ndarray]:
+    # dlib encodings sit in a loose cloud; different people are ~0.8-1.0 apart.
+    clusters = rng.normal(0.0, 0.09, size=(max(1, size // 200), ENCODING_DIM))
+    owners = rng.integers(0, len(clusters), size=size)
+    vectors = clusters[owners] + rng.normal(0.0, 0.06, size=(size, ENCODING_DIM))
+    return {f"s{i:07d}": v for i, v in enumerate(vectors)}
+
+
+def _sidecar_gallery(user_data_dir: Path) -> dict[str, np.ndarray]:
+    entries = {}
+    for ref_path in sorted((user_data_dir / "Student").glob("*/reference_image.jpg")):
+        encoding = load_reference_encoding(ref_path)
+        if encoding is not None:
+            entries[ref_path.parent.name] = encoding
+    return entries
+
+
+def _percentile(values: list[float], q: float) -> float:
+    return float(np.percentile(values, q)) if values else float("nan")
+
+
+def run(
+    gallery: dict[str, np.ndarray],
+    *,
+    nprobes: list[int],
+    queries: int,
+    noise: float,
+    min_train_size: int,
+    seed: int,
+) -> tuple[list[dict], float, float]:
+    rng = np.random.default_rng(seed)
+    euids = list(gallery)
+    matrix = np.stack([gallery[e] for e in euids]).astype(np.float32)
+    picks = rng.integers(0, len(euids), size=queries)
+    probes = matrix[picks] + rng.normal(0.0, noise, size=(queries, ENCODING_DIM)).astype(np.float32)
+
+    brute_ms: list[float] = []
+    truth: list[str] = []
+    for probe in probes:
+        start = time.perf_counter()
+        best = int(np.argmin(np.linalg.norm(matrix - probe, axis=1)))
+        brute_ms.append((time.perf_counter() - start) * 1000.0)
+        truth.append(euids[best])
+
+    rows = []
+    with tempfile.TemporaryDirectory() as tmp:
+        for nprobe in nprobes:
+            index = FaceIndex(
+                Path(tmp) / f"index_{nprobe}.npz",
+                dim=ENCODING_DIM,
+                nprobe=nprobe,
+                min_train_size=min_train_size,
+            )
+            start = time.perf_counter()
+            index.rebuild(gallery)
+            build_s = time.perf_counter() - start
+
+            latencies: list[float] = []
+            hits = 0
+            scanned: list[float] = []
+            for probe, expected in zip(probes, truth, strict=True):
+                start = time.perf_counter()
+                result = index.search(probe, k=1)
+                latencies.append((time.perf_counter() - start) * 1000.0)
+                hits += int(bool(result) and result[0][0] == expected)
+                scanned.append(len(index._candidates(probe)) / len(euids))
+
+            rows.append(
+                {
+                    "nprobe": nprobe,
+                    "build_s": build_s,
+                    "p50_ms": _percentile(latencies, 50),
+                    "p95_ms": _percentile(latencies, 95),
+                    "recall": hits / queries,
+                    "scanned": float(np.mean(scanned)),
+                }
+            )
+    return rows, _percentile(brute_ms, 50), _percentile(brute_ms, 95)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--user-data-dir", type=Path, help="index real reference sidecars")
+    parser.add_argument("--size", type=int, default=20000, help="synthetic gallery size")
+    parser.add_argument("--nprobe", default="1,2,4,8,16")
+    parser.add_argument("--queries", type=int, default=500)
+    parser.add_argument("--noise", type=float, default=0.02, help="per-dimension probe noise")
+    parser.add_argument("--min-train-size", type=int, default=1024)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    if args.user_data_dir:
+        gallery = _sidecar_gallery(args.user_data_dir)
+    else:
+        gallery = _synthetic_gallery(args.size, np.random.default_rng(args.seed))
+    if not gallery:
+        raise SystemExit("No encodings to index")
+
+    rows, brute_p50, brute_p95 = run(
+        gallery,
+        nprobes=[int(n) for n in args.nprobe.split(",")],
+        queries=args.queries,
+        noise=args.noise,
+        min_train_size=args.min_train_size,
+        seed=args.seed,
+    )
+    print(f"{len(gallery)} encodings, {args.queries} queries")
+    print(f"brute force: p50 {brute_p50:.3f} ms, p95 {brute_p95:.3f} ms")
+    header = (
+        f"{'nprobe':>7} {'build s':>8} {'p50 ms':>8} {'p95 ms':>8} {'recall@1':>9} {'scanned':>8}"
+    )
+    print(header)
+    print("-" * len(header))
+    for r in rows:
+        print(
+            f"{r['nprobe']:>7} {r['build_s']:>8.2f} {r['p50_ms']:>8.3f} {r['p95_ms']:>8.3f} "
+            f"{r['recall']:>9.1%} {r['scanned']:>8.1%}"
+        )
+
+
+if __name__ == "__main__":
+    main()
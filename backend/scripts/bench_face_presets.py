@@ -0,0 +1,146 @@
+"""
+Benchmark the face engine presets (fast / balanced / accurate) on labelled sample photos.
+
+Expects one folder per person: <image_dir>/<person>/*.jpg. The first photo of each person is
+the reference; every other photo is a probe. For each preset the script reports:
+  - p50/p95 latency of the full submitted-photo pipeline (decode, detect, encode)
+  - face found rate
+  - match rate: probes within --tolerance of their own reference
+  - false match rate: probes within --tolerance of someone else's reference
+and recommends the cheapest preset whose match rate is within --max-drop of the best.
+
+Usage:
+  python -m scripts.bench_face_presets ./samples --presets fast,balanced,accurate
+"""
+
+from __future__ import annotations
+
+import argparse
+from pathlib import Path
+
+import numpy as np
+
+from app.services.face_service import (
+    FACE_PRESETS,
+    FacePipelineOptions,
+    apply_face_preset,
+    encode_photo,
+)
+
+IMAGE_SUFFIXES = {".jpg", ".jpeg", ".png"}
+
+
+def _percentile(values: list[float], q: float) -> float:
+    return float(np.percentile(values, q)) if values else float("nan")
+
+
+def _load_people(image_dir: Path) -> dict[str, list[bytes]]:
+    people = {}
+    for person in sorted(p for p in image_dir.iterdir() if p.is_dir()):
+        photos = sorted(p for p in person.iterdir() if p.suffix.lower() in IMAGE_SUFFIXES)
+        if len(photos) >= 2:
+            people[person.name] = [p.read_bytes() for p in photos]
+    return people
+
+
+def run(
+    people: dict[str, list[bytes]],
+    *,
+    presets: list[str],
+    base: FacePipelineOptions,
+    tolerance: float,
+) -> list[dict]:
+    rows = []
+    for preset in presets:
+        opts = apply_face_preset(base, preset)
+        latencies: list[float] = []
+        found = total = 0
+
+        references: dict[str, np.ndarray] = {}
+        probes: list[tuple[str, np.ndarray]] = []
+        for name, photos in people.items():
+            for i, data in enumerate(photos):
+                result = encode_photo(data, opts)
+                latencies.append(sum(result.timings.values()))
+                total += 1
+                if result.encoding is None:
+                    continue
+                found += 1
+                if i == 0:
+                    references[name] = np.asarray(result.encoding)
+                else:
+                    probes.append((name, np.asarray(result.encoding)))
+
+        genuine = genuine_hits = impostor = impostor_hits = 0
+        for name, probe in probes:
+            for ref_name, ref in references.items():
+                hit = float(np.linalg.norm(ref - probe)) <= tolerance
+                if ref_name == name:
+                    genuine += 1
+                    genuine_hits += hit
+                else:
+                    impostor += 1
+                    impostor_hits += hit
+
+        rows.append(
+            {
+                "preset": preset,
+                "p50_ms": _percentile(latencies, 50),
+                "p95_ms": _percentile(latencies, 95),
+                "found_rate": found / total if total else 0.0,
+                "match_rate": genuine_hits / genuine if genuine else float("nan"),
+                "false_match_rate": impostor_hits / impostor if impostor else float("nan"),
+            }
+        )
+    return rows
+
+
+def _recommend(rows: list[dict], max_drop: float) -> str | None:
+    rated = [r for r in rows if not np.isnan(r["match_rate"])]
+    if not rated:
+        return None
+    best = max(r["match_rate"] for r in rated)
+    eligible = [r for r in rated if r["match_rate"] >= best - max_drop]
+    return min(eligible, key=lambda r: r["p50_ms"])["preset"]
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("image_dir", type=Path, help="one sub-folder of photos per person")
+    parser.add_argument("--presets", default=",".join(FACE_PRESETS))
+    parser.add_argument("--max-dim", type=int, default=640)
+    parser.add_argument("--encode-max-dim", type=int, default=1280)
+    parser.add_argument("--tolerance", type=float, default=0.6)
+    parser.add_argument("--max-drop", type=float, default=0.01, help="allowed match-rate loss")
+    args = parser.parse_args()
+
+    people = _load_people(args.image_dir)
+    if not people:
+        raise SystemExit(f"No person folders with at least two photos in {args.image_dir}")
+
+    base = FacePipelineOptions(detect_max_dim=args.max_dim, encode_max_dim=args.encode_max_dim)
+    rows = run(
+        people,
+        presets=[p.strip() for p in args.presets.split(",")],
+        base=base,
+        tolerance=args.tolerance,
+    )
+
+    photos = sum(len(v) for v in people.values())
+    print(f"{len(people)} people, {photos} photos, tolerance={args.tolerance}")
+    header = f"{'preset':>10} {'p50 ms':>8} {'p95 ms':>8} {'found':>7} {'match':>7} {'false':>7}"
+    print(header)
+    print("-" * len(header))
+    for r in rows:
+        print(
+            f"{r['preset']:>10} {r['p50_ms']:>8.1f} {r['p95_ms']:>8.1f} {r['found_rate']:>7.1%} "
+            f"{r['match_rate']:>7.1%} {r['false_match_rate']:>7.1%}"
+        )
+
+    choice = _recommend(rows, args.max_drop)
+    if choice:
+        print(f"\nCheapest preset within {args.max_drop:.1%} of the best match rate: {choice}")
+
+
+if __name__ == "__main__":
+    main()
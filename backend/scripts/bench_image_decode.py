@@ -0,0 +1,96 @@
+"""
+Micro-benchmarks for the upload decode path.
+
+1) PIL -> numpy conversion of a normalized upload: the old path (re-encode as JPEG q95,
+   then decode again the way face_recognition.load_image_file does) vs the direct
+   np.asarray-based conversion. Reports mean time and peak traced allocation.
+   tracemalloc sees numpy and Python-level buffers; Pillow's internal C allocations are
+   not traced, so the old path's peak is an underestimate.
+
+2) JPEG decode: full-resolution decode vs draft (DCT-scaled) decode for --target-dim.
+   Reports mean time and the size of the decoded pixel buffer.
+
+Usage:
+  python -m scripts.bench_image_decode --sizes 640x480,1280x960,4032x3024 --repeat 20
+"""
+
+from __future__ import annotations
+
+import argparse
+import io
+import time
+import tracemalloc
+
+import numpy as np
+from PIL import Image
+
+from app.services.face_service import (
+    _open_normalized_image,
+    _pil_to_array,
+    _pil_to_jpeg_bytes,
+)
+
+
+def _jpeg_round_trip(img: Image.Image) -> np.ndarray:
+    jpeg_bytes = _pil_to_jpeg_bytes(img)
+    return np.array(Image.open(io.BytesIO(jpeg_bytes)).convert("RGB"))
+
+
+def _measure(fn, img: Image.Image, repeat: int) -> tuple[float, int]:
+    fn(img)  # warm-up
+    start = time.perf_counter()
+    for _ in range(repeat):
+        fn(img)
+    mean_ms = (time.perf_counter() - start) * 1000.0 / repeat
+
+    tracemalloc.start()
+    fn(img)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return mean_ms, peak
+
+
+def _sample(width: int, height: int) -> Image.Image:
+    # Noise keeps the JPEG encoder honest (flat images compress unrealistically well).
+    rng = np.random.default_rng(0)
+    return Image.fromarray(rng.integers(0, 256, (height, width, 3), dtype=np.uint8), "RGB")
+
+
+def _decode(jpeg_bytes: bytes, target_dim: int, repeat: int) -> tuple[float, tuple[int, int]]:
+    img = _open_normalized_image(jpeg_bytes, target_dim)
+    start = time.perf_counter()
+    for _ in range(repeat):
+        img = _open_normalized_image(jpeg_bytes, target_dim)
+    return (time.perf_counter() - start) * 1000.0 / repeat, img.size
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--sizes", default="640x480,1280x960,4032x3024")
+    parser.add_argument("--target-dim", type=int, default=1280)
+    parser.add_argument("--repeat", type=int, default=20)
+    args = parser.parse_args()
+    sizes = [tuple(int(v) for v in s.lower().split("x")) for s in args.sizes.split(",")]
+
+    print("PIL -> numpy conversion")
+    print(f"{'size':>10} {'path':>12} {'mean ms':>9} {'peak MiB':>9}")
+    for width, height in sizes:
+        img = _sample(width, height)
+        for label, fn in (("jpeg q95", _jpeg_round_trip), ("direct", _pil_to_array)):
+            mean_ms, peak = _measure(fn, img, args.repeat)
+            print(f"{f'{width}x{height}':>10} {label:>12} {mean_ms:>9.2f} {peak / 2**20:>9.2f}")
+
+    print(f"\nJPEG decode (target_dim={args.target_dim})")
+    print(f"{'size':>10} {'path':>12} {'mean ms':>9} {'decoded':>11} {'buf MiB':>9}")
+    for width, height in sizes:
+        jpeg_bytes = _pil_to_jpeg_bytes(_sample(width, height))
+        for label, target in (("full", 0), ("draft", args.target_dim)):
+            mean_ms, (w, h) = _decode(jpeg_bytes, target, args.repeat)
+            print(
+                f"{f'{width}x{height}':>10} {label:>12} {mean_ms:>9.2f} "
+                f"{f'{w}x{h}':>11} {w * h * 3 / 2**20:>9.2f}"
+            )
+
+
+if __name__ == "__main__":
+    main()
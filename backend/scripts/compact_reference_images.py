@@ -0,0 +1,203 @@
+"""
+Compact existing reference images into face crops.
+
+Enrollment now stores a square crop around the face (FACE_REFERENCE_CROP_DIM) instead of the
+whole capture. This converts <user_data_dir>/Student/*/reference_image.jpg written before
+that: each full frame is cropped in a process pool, the original is copied to the archive
+(FACE_REFERENCE_ARCHIVE_DIR or --archive-dir) if one is set, and the crop replaces it. If
+the archive copy fails, the original is left in place and reported.
+
+The stored encodings don't change. They were computed on the full frame and are carried over
+to the new sidecar as they are, so tbl_face_templates, roster matrices and the face index stay
+valid. References that are already small enough are skipped; ones where no face is found are
+left alone and reported.
+
+Usage:
+  python -m scripts.compact_reference_images --dry-run
+  python -m scripts.compact_reference_images --workers 8 --archive-dir /mnt/cold/references
+"""
+
+from __future__ import annotations
+
+import argparse
+import functools
+import multiprocessing
+import os
+from collections import defaultdict
+from collections.abc import Iterator
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import dataclass, field
+from pathlib import Path
+
+from PIL import Image
+
+from app.factory import create_app
+from app.services.face_service import (
+    PreparedReference,
+    archive_reference_original,
+    configure_reference_storage,
+    get_face_pipeline_options,
+    get_reference_crop_dim,
+    init_face_worker,
+    load_reference_templates,
+    prepare_reference_image,
+    reference_archive_path,
+    write_reference_encoding,
+    write_reference_templates,
+)
+
+
+@dataclass
+class CompactionReport:
+    total: int = 0
+    skipped: int = 0  # already at most crop_dim
+    compacted: int = 0
+    failed: int = 0
+    bytes_before: int = 0  # of the references compacted
+    bytes_after: int = 0
+    failures: dict[str, list[str]] = field(default_factory=lambda: defaultdict(list))
+
+
+def _needs_compaction(ref_path: Path, crop_dim: int) -> bool:
+    try:
+        with Image.open(ref_path) as img:
+            return max(img.size) > crop_dim
+    except Exception:
+        return False  # unreadable: leave it for the backfill to report
+
+
+def _prepare(ref_path: Path, *, crop_dim: int) -> PreparedReference:
+    return prepare_reference_image(
+        ref_path.read_bytes(), get_face_pipeline_options("enrollment"), None, crop_dim
+    )
+
+
+def _prepare_all(
+    paths: list[Path], *, crop_dim: int, workers: int, backend_name: str
+) -> Iterator[tuple[Path, PreparedReference]]:
+    prepare = functools.partial(_prepare, crop_dim=crop_dim)
+    if workers == 0:
+        yield from zip(paths, map(prepare, paths), strict=True)
+        return
+    with ProcessPoolExecutor(
+        max_workers=workers,
+        mp_context=multiprocessing.get_context("spawn"),
+        initializer=init_face_worker,
+        initargs=(backend_name, False),
+    ) as executor:
+        chunksize = max(1, min(16, len(paths) // (workers * 4)))
+        yield from zip(paths, executor.map(prepare, paths, chunksize=chunksize), strict=True)
+
+
+def _replace_reference(ref_path: Path, prepared: PreparedReference) -> None:
+    # Read the templates before the image changes: the sidecar is tied to the old file.
+    templates = load_reference_templates(ref_path)
+    original = ref_path.read_bytes()
+    euid = ref_path.parent.name
+    # Without its archive copy the full-frame original would be lost: keep it in place
+    if reference_archive_path(euid, original) is not None:
+        if archive_reference_original(euid=euid, image_bytes=original) is None:
+            raise OSError("original could not be archived")
+
+    tmp = ref_path.with_name(f".{ref_path.name}.{os.getpid()}.tmp")
+    try:
+        tmp.write_bytes(prepared.image)
+        os.replace(tmp, ref_path)
+    except OSError:
+        tmp.unlink(missing_ok=True)
+        raise
+    if templates is not None:
+        write_reference_templates(reference_image_path=ref_path, encodings=templates)
+    else:
+        write_reference_encoding(reference_image_path=ref_path, encoding=prepared.encoding)
+
+
+def run_compaction(
+    *,
+    user_data_dir: Path,
+    crop_dim: int,
+    workers: int,
+    backend_name: str,
+    dry_run: bool = False,
+) -> CompactionReport:
+    report = CompactionReport()
+    to_compact: list[Path] = []
+    for ref_path in sorted((user_data_dir / "Student").glob("*/reference_image.jpg")):
+        report.total += 1
+        if _needs_compaction(ref_path, crop_dim):
+            to_compact.append(ref_path)
+        else:
+            report.skipped += 1
+    print(
+        f"{report.total} references: {len(to_compact)} to compact, {report.skipped} already "
+        f"at most {crop_dim}px ({workers or 'inline'} workers)",
+        flush=True,
+    )
+
+    prepared_all = _prepare_all(
+        to_compact, crop_dim=crop_dim, workers=workers, backend_name=backend_name
+    )
+    for ref_path, prepared in prepared_all:
+        euid = ref_path.parent.name
+        error = prepared.error
+        size_before = ref_path.stat().st_size
+        if error is None and not dry_run:
+            try:
+                _replace_reference(ref_path, prepared)
+            except (OSError, ValueError) as e:
+                error = f"Unable to store reference: {e}"
+        if error is not None:
+            report.failed += 1
+            report.failures[error].append(euid)
+            continue
+        report.compacted += 1
+        report.bytes_before += size_before
+        report.bytes_after += len(prepared.image)
+    return report
+
+
+def _print_report(report: CompactionReport, *, dry_run: bool, max_listed: int = 10) -> None:
+    verb = "would compact" if dry_run else "compacted"
+    print(f"  {verb} {report.compacted}, failed {report.failed}, skipped {report.skipped}")
+    if report.compacted:
+        saved = 1 - report.bytes_after / report.bytes_before
+        print(
+            f"  {report.bytes_before / 1e6:.1f} MB -> {report.bytes_after / 1e6:.1f} MB "
+            f"({saved:.0%} smaller)"
+        )
+    for error, euids in sorted(report.failures.items(), key=lambda kv: -len(kv[1])):
+        listed = ", ".join(euids[:max_listed]) + (" ..." if len(euids) > max_listed else "")
+        print(f"  {error}: {len(euids)} ({listed})")
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1, help="0 = inline")
+    parser.add_argument("--user-data-dir", type=Path, help="defaults to USER_DATA_DIR")
+    parser.add_argument(
+        "--archive-dir", type=Path, help="defaults to FACE_REFERENCE_ARCHIVE_DIR (unset: none)"
+    )
+    parser.add_argument("--crop-dim", type=int, help="defaults to FACE_REFERENCE_CROP_DIM")
+    parser.add_argument("--dry-run", action="store_true", help="report only, write nothing")
+    args = parser.parse_args()
+
+    app = create_app()
+    cfg = app.config["APP_CONFIG"]
+    crop_dim = args.crop_dim or get_reference_crop_dim()
+    if crop_dim <= 0:
+        raise SystemExit("FACE_REFERENCE_CROP_DIM is 0: references are stored uncropped")
+    if args.archive_dir:
+        configure_reference_storage(crop_dim=crop_dim, archive_dir=args.archive_dir.resolve())
+
+    report = run_compaction(
+        user_data_dir=args.user_data_dir or cfg.user_data_dir,
+        crop_dim=crop_dim,
+        workers=max(0, args.workers),
+        backend_name=cfg.face_backend,
+        dry_run=args.dry_run,
+    )
+    _print_report(report, dry_run=args.dry_run)
+
+
+if __name__ == "__main__":
+    main()
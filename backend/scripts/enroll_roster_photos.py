@@ -0,0 +1,65 @@
+"""
+Bulk-enroll a class roster from a directory or zip of <euid>.jpg reference photos.
+
+Same path as POST /classes/<code>/roster/photos: photos are normalized and encoded in the
+face pool (FACE_WORKERS), and every usable one is committed in one transaction. Prints a
+per-student report.
+
+Usage:
+  python -m scripts.enroll_roster_photos csce_4900_500 ./roster_photos
+  python -m scripts.enroll_roster_photos csce_4900_500 ./roster_photos.zip
+"""
+
+from __future__ import annotations
+
+import argparse
+import zipfile
+from pathlib import Path
+
+from app.db.connection import get_db
+from app.factory import create_app
+from app.services.bulk_enrollment import (
+    BulkEnrollmentResult,
+    bulk_enroll_photos,
+    directory_roster_photos,
+    zip_roster_photos,
+)
+
+
+def _enroll(code: str, source: Path, user_data_dir: Path) -> BulkEnrollmentResult:
+    if source.is_dir():
+        return bulk_enroll_photos(
+            db=get_db(),
+            code=code,
+            photos=directory_roster_photos(source),
+            user_data_dir=user_data_dir,
+        )
+    with zipfile.ZipFile(source) as archive:
+        return bulk_enroll_photos(
+            db=get_db(),
+            code=code,
+            photos=zip_roster_photos(archive),
+            user_data_dir=user_data_dir,
+        )
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("code", help="class code")
+    parser.add_argument("source", type=Path, help="directory or zip of <euid>.jpg photos")
+    args = parser.parse_args()
+
+    app = create_app()
+    with app.app_context():
+        result = _enroll(args.code, args.source, app.config["APP_CONFIG"].user_data_dir)
+    if result.status != "success":
+        raise SystemExit(result.error)
+
+    for entry in result.entries:
+        outcome = "enrolled" + (" (new account)" if entry.created else "")
+        print(f"{entry.file:<24} {entry.euid or '-':<10} {entry.error or outcome}")
+    print(f"{result.enrolled} enrolled, {result.failed} failed")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,10 +1,11 @@
 from __future__ import annotations
 
-from datetime import datetime
+import time
+from datetime import UTC, datetime
 from pathlib import Path
 from unittest.mock import MagicMock, patch
 
-from app.db.repository import SessionRow
+from app.db.repository import AttendancePrecheck
 from app.services.attendance_service import add_attendance
 
 
@@ -12,9 +13,28 @@ def _today_str() -> str:
     return datetime.now().date().strftime("%Y-%m-%d")
 
 
-@patch("app.services.attendance_service.repository.get_class_by_code")
-def test_add_attendance_class_missing(mock_get_class_by_code, tmp_path: Path) -> None:
-    mock_get_class_by_code.return_value = None
+def _precheck(
+    *,
+    enrolled: bool = True,
+    session_id: int | None = 1,
+    session_start: int | None = None,
+    attended: bool = False,
+    templates: list[bytes] | None = None,
+) -> AttendancePrecheck:
+    return AttendancePrecheck(
+        lat=33.0,
+        lon=-97.0,
+        enrolled=enrolled,
+        session_id=session_id,
+        session_start=int(time.time()) if session_start is None else session_start,
+        attended=attended,
+        templates=templates or [],
+    )
+
+
+@patch("app.services.attendance_service.repository.get_attendance_precheck")
+def test_add_attendance_class_missing(mock_precheck, tmp_path: Path) -> None:
+    mock_precheck.return_value = None
 
     result = add_attendance(
         db=MagicMock(),
@@ -27,15 +47,10 @@ def test_add_attendance_class_missing(mock_get_class_by_code, tmp_path: Path) ->
     assert result.status == "error"
     assert result.error == "Class does not exist"
 
-@patch("app.services.attendance_service.repository.student_is_enrolled")
-@patch("app.services.attendance_service.repository.get_class_by_code")
-def test_add_attendance_rejected_when_not_enrolled(
-    mock_get_class_by_code,
-    mock_is_enrolled,
-    tmp_path: Path,
-) -> None:
-    mock_get_class_by_code.return_value = {"lat": 33.0, "lon": -97.0}
-    mock_is_enrolled.return_value = False
+
+@patch("app.services.attendance_service.repository.get_attendance_precheck")
+def test_add_attendance_rejected_when_not_enrolled(mock_precheck, tmp_path: Path) -> None:
+    mock_precheck.return_value = _precheck(enrolled=False, session_id=None)
 
     result = add_attendance(
         db=MagicMock(),
@@ -49,15 +64,9 @@ def test_add_attendance_rejected_when_not_enrolled(
     assert result.error == "Not enrolled in class"
 
 
-@patch("app.services.attendance_service.repository.student_is_enrolled")
-@patch("app.services.attendance_service.repository.get_session_for_date")
-@patch("app.services.attendance_service.repository.get_class_by_code")
-def test_add_attendance_no_class_today(
-    mock_get_class_by_code, mock_get_session, mock_is_enrolled, tmp_path: Path
-) -> None:
-    mock_get_class_by_code.return_value = {"lat": 33.0, "lon": -97.0}
-    mock_is_enrolled.return_value = True
-    mock_get_session.return_value = None
+@patch("app.services.attendance_service.repository.get_attendance_precheck")
+def test_add_attendance_no_class_today(mock_precheck, tmp_path: Path) -> None:
+    mock_precheck.return_value = _precheck(session_id=None)
 
     result = add_attendance(
         db=MagicMock(),
@@ -69,35 +78,22 @@ def test_add_attendance_no_class_today(
     )
     assert result.status == "error"
     assert result.error == "No class on date"
+    assert mock_precheck.call_args.kwargs["on_date"] == _today_str()
 
 
 @patch("app.services.attendance_service.verify_face_match")
 @patch("app.services.attendance_service.distance_feet")
 @patch("app.services.attendance_service.repository.upsert_attendance")
-@patch("app.services.attendance_service.repository.student_is_enrolled")
-@patch("app.services.attendance_service.repository.get_session_for_date")
-@patch("app.services.attendance_service.repository.get_class_by_code")
+@patch("app.services.attendance_service.repository.get_attendance_precheck")
 def test_add_attendance_success(
-    mock_get_class_by_code,
-    mock_get_session,
-    mock_is_enrolled,
+    mock_precheck,
     mock_upsert,
     mock_distance,
     mock_face,
     tmp_path: Path,
 ) -> None:
-    mock_get_class_by_code.return_value = {"lat": 33.0, "lon": -97.0}
-    mock_is_enrolled.return_value = True
-
-    # Put session time at "now" so it's within time window
-    now = datetime.now()
-    mock_get_session.return_value = SessionRow(
-        id=123,
-        code="csce_4900_500",
-        session_date=_today_str(),
-        session_time=now.strftime("%H:%M:%S"),
-    )
-
+    # Session starts "now" so it's within the time window
+    mock_precheck.return_value = _precheck(session_id=123)
     mock_distance.return_value = 10.0  # within 30 feet
     mock_face.return_value = type("R", (), {"status": "success", "error": None})()
 
@@ -111,24 +107,40 @@ def test_add_attendance_success(
     )
     assert result.status == "success"
     mock_upsert.assert_called_once()
+    assert mock_upsert.call_args.kwargs["session_id"] == 123
 
 
-@patch("app.services.attendance_service.repository.student_is_enrolled")
-@patch("app.services.attendance_service.repository.get_session_for_date")
-@patch("app.services.attendance_service.repository.get_class_by_code")
-def test_add_attendance_outside_time_window(
-    mock_get_class_by_code, mock_get_session, mock_is_enrolled, tmp_path: Path
-) -> None:
-    mock_get_class_by_code.return_value = {"lat": 33.0, "lon": -97.0}
-    mock_is_enrolled.return_value = True
+@patch("app.services.attendance_service.verify_face_match")
+@patch("app.services.attendance_service.repository.get_attendance_precheck")
+def test_add_attendance_outside_time_window(mock_precheck, mock_face, tmp_path: Path) -> None:
+    # Session started two hours ago
+    mock_precheck.return_value = _precheck(session_start=int(time.time()) - 2 * 3600)
 
-    # Session time far in the past (over 30 min)
-    mock_get_session.return_value = SessionRow(
-        id=1,
+    result = add_attendance(
+        db=MagicMock(),
         code="csce_4900_500",
-        session_date=_today_str(),
-        session_time="00:00:00",
+        euid="gdb2356",
+        student_location=(33.0, -97.0),
+        submitted_photo_b64="abc",
+        user_data_dir=tmp_path,
+        time_window_minutes=1,
     )
+    assert result.status == "error"
+    assert result.error == "Outside time range"
+    mock_face.assert_not_called()
+
+
+@patch("app.services.attendance_service.verify_face_match")
+@patch("app.services.attendance_service.distance_feet")
+@patch("app.services.attendance_service.repository.get_attendance_precheck")
+def test_add_attendance_too_far(
+    mock_precheck,
+    mock_distance,
+    mock_face,
+    tmp_path: Path,
+) -> None:
+    mock_precheck.return_value = _precheck()
+    mock_distance.return_value = 500.0  # too far
 
     result = add_attendance(
         db=MagicMock(),
@@ -137,37 +149,53 @@ def test_add_attendance_outside_time_window(
         student_location=(33.0, -97.0),
         submitted_photo_b64="abc",
         user_data_dir=tmp_path,
-        time_window_minutes=1,  # ensure it fails regardless of current time
+        max_distance_feet=30.0,
     )
     assert result.status == "error"
-    assert result.error == "Outside time range"
+    assert result.error == "Too far from class"
+    mock_face.assert_not_called()
 
 
 @patch("app.services.attendance_service.verify_face_match")
 @patch("app.services.attendance_service.distance_feet")
-@patch("app.services.attendance_service.repository.student_is_enrolled")
-@patch("app.services.attendance_service.repository.get_session_for_date")
-@patch("app.services.attendance_service.repository.get_class_by_code")
-def test_add_attendance_too_far(
-    mock_get_class_by_code,
-    mock_get_session,
-    mock_is_enrolled,
+@patch("app.services.attendance_service.repository.upsert_attendance")
+@patch("app.services.attendance_service.repository.get_attendance_precheck")
+def test_add_attendance_verifies_against_stored_templates(
+    mock_precheck,
+    mock_upsert,
     mock_distance,
     mock_face,
     tmp_path: Path,
 ) -> None:
-    mock_get_class_by_code.return_value = {"lat": 33.0, "lon": -97.0}
-    mock_is_enrolled.return_value = True
+    import numpy as np
+
+    from app.services.face_service import template_blobs
+
+    stored = np.full((2, 128), 0.05)
+    mock_precheck.return_value = _precheck(session_id=7, templates=template_blobs(stored))
+    mock_distance.return_value = 10.0
+    mock_face.return_value = type("R", (), {"status": "success", "error": None})()
 
-    now = datetime.now()
-    mock_get_session.return_value = SessionRow(
-        id=1,
+    result = add_attendance(
+        db=MagicMock(),
         code="csce_4900_500",
-        session_date=_today_str(),
-        session_time=now.strftime("%H:%M:%S"),
+        euid="gdb2356",
+        student_location=(33.0, -97.0),
+        submitted_photo_b64="abc",
+        user_data_dir=tmp_path,
     )
 
-    mock_distance.return_value = 500.0  # too far
+    assert result.status == "success"
+    assert np.allclose(mock_face.call_args.kwargs["templates"], stored)
+
+
+@patch("app.services.attendance_service.verify_face_match")
+@patch("app.services.attendance_service.repository.upsert_attendance")
+@patch("app.services.attendance_service.repository.get_attendance_precheck")
+def test_add_attendance_already_recorded_skips_face_check(
+    mock_precheck, mock_upsert, mock_face, tmp_path: Path
+) -> None:
+    mock_precheck.return_value = _precheck(attended=True)
 
     result = add_attendance(
         db=MagicMock(),
@@ -176,8 +204,281 @@ def test_add_attendance_too_far(
         student_location=(33.0, -97.0),
         submitted_photo_b64="abc",
         user_data_dir=tmp_path,
-        max_distance_feet=30.0,
     )
-    assert result.status == "error"
-    assert result.error == "Too far from class"
+
+    assert (result.status, result.already_recorded) == ("success", True)
     mock_face.assert_not_called()
+    mock_upsert.assert_not_called()
+
+
+@patch("app.services.attendance_service.verify_face_match")
+@patch("app.services.attendance_service.distance_feet")
+@patch("app.services.attendance_service.repository.upsert_attendance")
+@patch("app.services.attendance_service.repository.get_attendance_precheck")
+def test_add_attendance_force_reverify_checks_face_again(
+    mock_precheck, mock_upsert, mock_distance, mock_face, tmp_path: Path
+) -> None:
+    mock_precheck.return_value = _precheck(attended=True)
+    mock_distance.return_value = 10.0
+    mock_face.return_value = type("R", (), {"status": "error", "error": "Face does not match"})()
+
+    result = add_attendance(
+        db=MagicMock(),
+        code="csce_4900_500",
+        euid="gdb2356",
+        student_location=(33.0, -97.0),
+        submitted_photo_b64="abc",
+        user_data_dir=tmp_path,
+        force_reverify=True,
+    )
+
+    assert (result.status, result.error) == ("error", "Face does not match")
+    mock_face.assert_called_once()
+    mock_upsert.assert_not_called()
+
+
+def _seed_class_meeting_now(db) -> list[bytes]:
+    """
+    Class csce_4900_500 at (33.2, -97.1) with a session starting now and stu1234 enrolled.
+    Returns stu1234's stored template BLOBs.
+    """
+    import numpy as np
+
+    from app.db import repository
+    from app.services.face_service import ENCODING_DIM, ENCODING_MODEL, template_blobs
+
+    now = datetime.now().replace(microsecond=0)
+    repository.insert_class_info(
+        db,
+        code="csce_4900_500",
+        professor_euid="pro1234",
+        lat=33.2,
+        lon=-97.1,
+        start_date=_today_str(),
+        end_date=_today_str(),
+    )
+    repository.generate_sessions(
+        db,
+        code="csce_4900_500",
+        start_date=_today_str(),
+        end_date=_today_str(),
+        times={now.strftime("%A"): now.strftime("%H:%M:%S")},
+    )
+    repository.enroll_student(db, code="csce_4900_500", student_euid="stu1234")
+    stored = template_blobs(np.full((2, ENCODING_DIM), 0.1))
+    repository.replace_face_templates(
+        db, euid="stu1234", encodings=stored, dim=ENCODING_DIM, model=ENCODING_MODEL
+    )
+    db.commit()
+    return stored
+
+
+def test_attendance_precheck_is_one_query(app) -> None:
+    from app.db import repository
+    from app.db.connection import get_db
+    from app.services.face_service import ENCODING_MODEL
+
+    now = datetime.now().replace(microsecond=0)
+    with app.app_context():
+        db = get_db()
+        stored = _seed_class_meeting_now(db)
+
+        statements: list[str] = []
+        db.set_trace_callback(statements.append)
+        try:
+            precheck = repository.get_attendance_precheck(
+                db,
+                code="csce_4900_500",
+                student_euid="stu1234",
+                on_date=_today_str(),
+                model=ENCODING_MODEL,
+            )
+            other = repository.get_attendance_precheck(
+                db,
+                code="csce_4900_500",
+                student_euid="stu9999",
+                on_date="2000-01-01",
+                model=ENCODING_MODEL,
+            )
+            missing = repository.get_attendance_precheck(
+                db,
+                code="csce_4900_501",
+                student_euid="stu1234",
+                on_date=_today_str(),
+                model=ENCODING_MODEL,
+            )
+        finally:
+            db.set_trace_callback(None)
+
+        repository.upsert_attendance(
+            db, session_id=precheck.session_id, student_euid="stu1234", attended=1
+        )
+        again = repository.get_attendance_precheck(
+            db,
+            code="csce_4900_500",
+            student_euid="stu1234",
+            on_date=_today_str(),
+            model=ENCODING_MODEL,
+        )
+
+    assert len(statements) == 3
+    assert (precheck.lat, precheck.lon, precheck.enrolled) == (33.2, -97.1, True)
+    assert precheck.session_id is not None
+    assert precheck.session_start == int(now.timestamp())
+    assert precheck.templates == stored
+    assert (precheck.attended, again.attended, again.templates) == (False, True, stored)
+    assert (other.enrolled, other.session_id, other.templates) == (False, None, [])
+    assert missing is None
+
+
+def _login(client, euid: str) -> str:
+    resp = client.post("/auth/login", json={"euid": euid, "password": "password123"})
+    assert resp.status_code == 200, resp.json
+    return resp.json["access_token"]
+
+
+@patch("app.services.attendance_service.verify_face_match")
+def test_preflight_ticket_lets_attendance_skip_the_precheck(mock_face, client, app) -> None:
+    from app.db import repository
+    from app.db.connection import get_db
+
+    with app.app_context():
+        _seed_class_meeting_now(get_db())
+    token = _login(client, "stu1234")
+    headers = {"Authorization": f"Bearer {token}"}
+    check_in = {"code": "csce_4900_500", "euid": "stu1234", "location": [33.2, -97.1]}
+
+    far = client.post(
+        "/attendance/preflight", headers=headers, json={**check_in, "location": [33.3, -97.1]}
+    )
+    assert (far.status_code, far.json["error"]) == (400, "Too far from class")
+
+    resp = client.post("/attendance/preflight", headers=headers, json=check_in)
+    assert resp.status_code == 200, resp.json
+    ticket = resp.json["ticket"]
+    assert resp.json["expires_in"] == 120
+    # A ticket is not an access token
+    assert (
+        client.get(
+            "/students/me/attendance", headers={"Authorization": f"Bearer {ticket}"}
+        ).status_code
+        == 401
+    )
+
+    mock_face.return_value = type("R", (), {"status": "success", "error": None})()
+    with patch(
+        "app.services.attendance_service.repository.get_attendance_precheck",
+        wraps=repository.get_attendance_precheck,
+    ) as spy:
+        moved = client.post(
+            "/attendance",
+            headers=headers,
+            json={**check_in, "location": [33.3, -97.1], "photo": "aGVsbG8=", "ticket": ticket},
+        )
+        assert (moved.status_code, moved.json["error"]) == (400, "Too far from class")
+        ok = client.post(
+            "/attendance", headers=headers, json={**check_in, "photo": "aGVsbG8=", "ticket": ticket}
+        )
+        assert ok.status_code == 200, ok.json
+        assert spy.call_count == 0
+        assert mock_face.call_args.kwargs["templates"].shape == (2, 128)
+
+        # Re-submitting with the same ticket is a repeat tap, not another face check
+        repeat = client.post(
+            "/attendance", headers=headers, json={**check_in, "photo": "aGVsbG8=", "ticket": ticket}
+        )
+        assert (repeat.status_code, repeat.json["already_recorded"]) == (200, True)
+        assert mock_face.call_count == 1
+
+        # A tampered (or expired) ticket falls back to the full checks
+        client.post(
+            "/attendance",
+            headers=headers,
+            json={**check_in, "photo": "aGVsbG8=", "ticket": ticket + "x"},
+        )
+        assert spy.call_count == 1
+
+    again = client.post("/attendance/preflight", headers=headers, json=check_in)
+    assert again.json == {
+        "status": "success",
+        "already_recorded": True,
+        "request_id": again.json["request_id"],
+    }
+
+
+@patch("app.services.attendance_service.verify_face_matches")
+def test_batch_checks_each_item_at_its_capture_time(mock_faces, client, app) -> None:
+    from datetime import timedelta
+
+    from app.db import repository
+    from app.db.connection import get_db
+    from app.services.face_service import FaceMatchResult
+
+    with app.app_context():
+        _seed_class_meeting_now(get_db())
+    token = _login(client, "stu1234")
+    headers = {"Authorization": f"Bearer {token}"}
+    now = datetime.now(UTC)
+
+    def item(captured_at: datetime, **overrides) -> dict:
+        return {
+            "code": "csce_4900_500",
+            "location": [33.2, -97.1],
+            "photo": "aGVsbG8=",
+            "captured_at": captured_at.isoformat(),
+            **overrides,
+        }
+
+    items = [
+        item(now - timedelta(minutes=5)),  # face doesn't match
+        item(now - timedelta(minutes=4)),
+        item(now - timedelta(minutes=3)),  # same session again
+        item(now - timedelta(minutes=45)),  # session started after it
+        item(now, location=[33.3, -97.1]),
+        item(now + timedelta(hours=1)),
+        item(now - timedelta(days=3)),
+        item(now, code="csce_4900_501"),
+    ]
+    mock_faces.side_effect = lambda requests: (
+        [FaceMatchResult(status="error", error="Face does not match")]
+        + [FaceMatchResult(status="success")] * len(requests)
+    )[: len(requests)]
+
+    with patch(
+        "app.services.attendance_service.repository.upsert_attendance_rows",
+        wraps=repository.upsert_attendance_rows,
+    ) as spy:
+        resp = client.post(
+            "/attendance/batch", headers=headers, json={"euid": "stu1234", "items": items}
+        )
+    assert resp.status_code == 200, resp.json
+    assert resp.json["recorded"] == 1
+    assert [(r["index"], r["status"], r.get("error")) for r in resp.json["results"]] == [
+        (0, "error", "Face does not match"),
+        (1, "success", None),
+        (2, "success", None),
+        (3, "error", "Outside time range"),
+        (4, "error", "Too far from class"),
+        (5, "error", "Capture time is in the future"),
+        (6, "error", "Capture is too old to sync"),
+        (7, "error", "Class does not exist"),
+    ]
+    assert resp.json["results"][2]["already_recorded"] is True
+    assert len(mock_faces.call_args.args[0]) == 3  # one pool fan-out for the items that got there
+    spy.assert_called_once()
+
+    # Re-syncing is harmless: the session is already recorded, no face work runs
+    again = client.post(
+        "/attendance/batch", headers=headers, json={"euid": "stu1234", "items": items[1:2]}
+    )
+    assert again.json["recorded"] == 0
+    assert again.json["results"][0]["already_recorded"] is True
+    assert mock_faces.call_args.args[0] == []
+
+    too_many = client.post(
+        "/attendance/batch", headers=headers, json={"euid": "stu1234", "items": items * 2}
+    )
+    other = client.post(
+        "/attendance/batch", headers=headers, json={"euid": "stu9999", "items": items[:1]}
+    )
+    assert (too_many.status_code, other.status_code) == (400, 403)
@@ -0,0 +1,65 @@
+from __future__ import annotations
+
+from pathlib import Path
+
+import numpy as np
+from PIL import Image
+
+from app.services import face_service
+from app.services.face_service import ENCODING_MODEL, load_reference_templates
+
+
+def _write_reference(user_data_dir: Path, euid: str, size: int, seed: int) -> Path:
+    ref_path = user_data_dir / "Student" / euid / "reference_image.jpg"
+    ref_path.parent.mkdir(parents=True, exist_ok=True)
+    pixels = np.random.default_rng(seed).integers(0, 255, size=(size, size, 3), dtype=np.uint8)
+    Image.fromarray(pixels).save(ref_path, format="JPEG")
+    return ref_path
+
+
+def test_backfill_encodes_stores_rows_and_resumes(app, tmp_path: Path) -> None:
+    from app.db import repository
+    from app.db.connection import get_db
+    from scripts.backfill_face_encodings import run_backfill
+
+    user_data_dir = tmp_path / "backfill"
+    _write_reference(user_data_dir, "stu1234", 64, seed=1)
+    _write_reference(user_data_dir, "stu9999", 64, seed=2)
+    _write_reference(user_data_dir, "ghost01", 64, seed=3)  # no user row
+    _write_reference(user_data_dir, "stu0001", 1, seed=4)  # too small: no face
+    face_service.configure_face_backend("fake")
+    try:
+        with app.app_context():
+            db = get_db()
+            report = run_backfill(
+                db, user_data_dir=user_data_dir, workers=0, backend_name="fake", commit_every=1
+            )
+
+            assert (report.total, report.encoded, report.failed) == (4, 3, 1)
+            assert report.failures == {"No face detected in reference image": ["stu0001"]}
+            assert report.db_rows == 2
+            assert repository.get_euids_with_face_templates(db, model=ENCODING_MODEL) == {
+                "stu1234",
+                "stu9999",
+            }
+            stored = repository.get_student_face_templates(db, euid="stu1234", model=ENCODING_MODEL)
+            sidecar = load_reference_templates(
+                user_data_dir / "Student" / "stu1234" / "reference_image.jpg"
+            )
+            assert np.allclose(face_service.templates_from_blobs(stored), sidecar, atol=1e-6)
+
+            # A second run picks up from the checkpoint; only a replaced reference is redone.
+            _write_reference(user_data_dir, "stu9999", 80, seed=5)
+            again = run_backfill(db, user_data_dir=user_data_dir, workers=0, backend_name="fake")
+            assert (again.skipped, again.encoded, again.failed) == (3, 1, 0)
+
+            retried = run_backfill(
+                db,
+                user_data_dir=user_data_dir,
+                workers=0,
+                backend_name="fake",
+                retry_failed=True,
+            )
+            assert (retried.skipped, retried.failed) == (3, 1)
+    finally:
+        face_service.configure_face_backend("dlib")
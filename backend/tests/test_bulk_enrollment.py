@@ -0,0 +1,302 @@
+from __future__ import annotations
+
+import io
+import zipfile
+from pathlib import Path
+
+import numpy as np
+import pytest
+from PIL import Image
+
+from app.services import face_service
+
+CODE = "csce_4900_500"
+
+
+def _jpeg(size: int, seed: int) -> bytes:
+    pixels = np.random.default_rng(seed).integers(0, 255, size=(size, size, 3), dtype=np.uint8)
+    buf = io.BytesIO()
+    Image.fromarray(pixels).save(buf, format="JPEG")
+    return buf.getvalue()
+
+
+def _login(client, euid: str) -> str:
+    resp = client.post("/auth/login", json={"euid": euid, "password": "password123"})
+    assert resp.status_code == 200, resp.json
+    return resp.json["access_token"]
+
+
+def _create_class(client, token: str) -> None:
+    resp = client.post(
+        "/classes",
+        headers={"Authorization": f"Bearer {token}"},
+        json={
+            "code": CODE,
+            "euid": "pro1234",
+            "location": [33.214, -97.133],
+            "start_date": "2025-04-01",
+            "end_date": "2025-04-15",
+            "times": {"Monday": "09:00:00"},
+        },
+    )
+    assert resp.status_code == 201, resp.json
+
+
+def _enroll(app, euid: str) -> None:
+    from app.db import repository
+    from app.db.connection import get_db
+
+    with app.app_context():
+        db = get_db()
+        repository.enroll_student(db, code=CODE, student_euid=euid)
+        db.commit()
+
+
+def _zip(entries: dict[str, bytes]) -> io.BytesIO:
+    buf = io.BytesIO()
+    with zipfile.ZipFile(buf, "w") as zf:
+        for name, data in entries.items():
+            zf.writestr(name, data)
+    buf.seek(0)
+    return buf
+
+
+def test_bulk_enroll_from_zip_reports_each_student(client, app) -> None:
+    token = _login(client, "pro1234")
+    _create_class(client, token)
+    _enroll(app, "stu1234")
+    archive = _zip(
+        {
+            "stu1234.jpg": _jpeg(64, 1),  # existing student, already in the class
+            "photos/abc1234.jpg": _jpeg(64, 2),  # new account, nested folder
+            "pro1234.jpg": _jpeg(64, 3),  # a professor
+            "not-an-euid.jpg": _jpeg(64, 4),
+            "xyz9876.jpg": _jpeg(1, 5),  # too small: no face
+            "__MACOSX/._abc1234.jpg": b"resource fork",
+            "notes.txt": b"ignored",
+        }
+    )
+
+    face_service.configure_face_backend("fake")
+    try:
+        resp = client.post(
+            f"/classes/{CODE}/roster/photos",
+            headers={"Authorization": f"Bearer {token}"},
+            data={"archive": (archive, "roster.zip")},
+            content_type="multipart/form-data",
+        )
+    finally:
+        face_service.configure_face_backend("dlib")
+
+    assert resp.status_code == 200, resp.json
+    assert (resp.json["enrolled"], resp.json["failed"]) == (2, 3)
+    report = {s["file"]: s for s in resp.json["students"]}
+    assert set(report) == {
+        "stu1234.jpg",
+        "abc1234.jpg",
+        "pro1234.jpg",
+        "not-an-euid.jpg",
+        "xyz9876.jpg",
+    }
+    assert report["stu1234.jpg"]["status"] == "enrolled" and not report["stu1234.jpg"]["created"]
+    assert report["abc1234.jpg"]["status"] == "enrolled" and report["abc1234.jpg"]["created"]
+    assert report["pro1234.jpg"]["error"] == "euid belongs to a non-student account"
+    assert report["not-an-euid.jpg"]["error"] == "File name is not a valid euid"
+    assert report["xyz9876.jpg"]["error"] == "No face detected in reference image"
+
+    cfg = app.config["APP_CONFIG"]
+    with app.app_context():
+        from app.db import repository
+        from app.db.connection import get_db
+
+        db = get_db()
+        assert repository.get_class_roster(db, code=CODE) == ["abc1234", "stu1234"]
+        assert repository.get_user_role(db, euid="xyz9876") is None
+        templates = repository.get_enrolled_face_templates(
+            db, student_euid="abc1234", code=CODE, model=face_service.ENCODING_MODEL
+        )
+        assert len(templates) == 1
+    assert (Path(cfg.user_data_dir) / "Student" / "abc1234" / "reference_image.jpg").exists()
+    assert not (Path(cfg.user_data_dir) / "Student" / "pro1234").exists()
+
+
+def test_bulk_enroll_requires_owner_and_zip(client) -> None:
+    token = _login(client, "pro1234")
+    _create_class(client, token)
+
+    other = _login(client, "pro9999")
+    resp = client.post(
+        f"/classes/{CODE}/roster/photos",
+        headers={"Authorization": f"Bearer {other}"},
+        data={"archive": (_zip({}), "roster.zip")},
+        content_type="multipart/form-data",
+    )
+    assert resp.status_code == 403
+
+    resp = client.post(
+        f"/classes/{CODE}/roster/photos",
+        headers={"Authorization": f"Bearer {token}"},
+        data={"archive": (io.BytesIO(b"not a zip"), "roster.zip")},
+        content_type="multipart/form-data",
+    )
+    assert resp.status_code == 400
+    assert resp.json["error"] == "archive must be a zip file"
+
+
+def test_bulk_enroll_rejects_oversized_chunked_upload(client, app) -> None:
+    from dataclasses import replace
+
+    token = _login(client, "pro1234")
+    _create_class(client, token)
+    app.config["APP_CONFIG"] = replace(app.config["APP_CONFIG"], roster_archive_max_bytes=1024)
+    archive = _zip({"abc1234.jpg": _jpeg(64, 1) * 4}).getvalue()
+    body = (
+        b'--b\r\nContent-Disposition: form-data; name="archive"; filename="roster.zip"\r\n'
+        b"Content-Type: application/zip\r\n\r\n" + archive + b"\r\n--b--\r\n"
+    )
+
+    # No Content-Length, as waitress passes on a Transfer-Encoding: chunked upload
+    resp = client.post(
+        f"/classes/{CODE}/roster/photos",
+        headers={"Authorization": f"Bearer {token}", "Transfer-Encoding": "chunked"},
+        input_stream=io.BytesIO(body),
+        content_type="multipart/form-data; boundary=b",
+        environ_overrides={"wsgi.input_terminated": True},
+    )
+    assert resp.status_code == 413
+    assert resp.json["error"] == "Archive too large"
+
+
+def test_bulk_enroll_from_directory_skips_duplicates(client, app, tmp_path: Path) -> None:
+    from app.db.connection import get_db
+    from app.services.bulk_enrollment import bulk_enroll_photos, directory_roster_photos
+
+    _create_class(client, _login(client, "pro1234"))
+    photos = tmp_path / "photos"
+    photos.mkdir()
+    (photos / "abc1234.jpg").write_bytes(_jpeg(64, 1))
+    (photos / "abc1234.png").write_bytes(_jpeg(64, 2))
+    (photos / "def5678.jpeg").write_bytes(_jpeg(64, 3))
+
+    face_service.configure_face_backend("fake")
+    try:
+        with app.app_context():
+            result = bulk_enroll_photos(
+                db=get_db(),
+                code=CODE,
+                photos=directory_roster_photos(photos),
+                user_data_dir=tmp_path / "users",
+            )
+    finally:
+        face_service.configure_face_backend("dlib")
+
+    assert result.status == "success"
+    assert [(e.file, e.status, e.error) for e in result.entries] == [
+        ("abc1234.jpg", "enrolled", None),
+        ("abc1234.png", "error", "Duplicate photo for euid"),
+        ("def5678.jpeg", "enrolled", None),
+    ]
+
+
+def test_bulk_enroll_cannot_replace_a_student_outside_the_class(client, app) -> None:
+    from app.db import repository
+    from app.db.connection import get_db
+
+    token = _login(client, "pro1234")
+    _create_class(client, token)
+    cfg = app.config["APP_CONFIG"]
+    victim = face_service.reference_image_path(Path(cfg.user_data_dir), "stu9999")
+    victim.parent.mkdir(parents=True)
+    victim.write_bytes(b"their own face")
+
+    face_service.configure_face_backend("fake")
+    try:
+        resp = client.post(
+            f"/classes/{CODE}/roster/photos",
+            headers={"Authorization": f"Bearer {token}"},
+            data={"archive": (_zip({"stu9999.jpg": _jpeg(64, 1)}), "roster.zip")},
+            content_type="multipart/form-data",
+        )
+    finally:
+        face_service.configure_face_backend("dlib")
+
+    assert resp.status_code == 200, resp.json
+    assert resp.json["students"][0]["error"] == "Student is not enrolled in this class"
+    assert victim.read_bytes() == b"their own face"
+    with app.app_context():
+        db = get_db()
+        assert repository.get_class_roster(db, code=CODE) == []
+        assert not repository.get_student_face_templates(
+            db, euid="stu9999", model=face_service.ENCODING_MODEL
+        )
+
+
+class _DeferredPool:
+    """Several workers; a job runs when its result is collected, so results lag behind."""
+
+    workers = 4
+
+    def submit(self, fn, *args):
+        return (fn, args)
+
+    def result(self, fut):
+        fn, args = fut
+        return fn(*args)
+
+
+def test_bulk_enroll_keeps_archive_order_and_old_references_on_failed_commit(
+    client, app, tmp_path: Path
+) -> None:
+    import sqlite3
+    from unittest.mock import patch
+
+    from app.db.connection import get_db
+    from app.services.bulk_enrollment import bulk_enroll_photos, directory_roster_photos
+
+    _create_class(client, _login(client, "pro1234"))
+    _enroll(app, "stu1234")
+    photos = tmp_path / "photos"
+    photos.mkdir()
+    (photos / "abc1234.jpg").write_bytes(_jpeg(64, 1))
+    (photos / "bad-name.jpg").write_bytes(_jpeg(64, 2))
+    (photos / "def5678.jpg").write_bytes(_jpeg(64, 3))
+    (photos / "stu1234.jpg").write_bytes(_jpeg(64, 4))
+    users = tmp_path / "users"
+    existing = face_service.reference_image_path(users, "stu1234")
+    existing.parent.mkdir(parents=True)
+    existing.write_bytes(b"previous reference")
+
+    def enroll():
+        return bulk_enroll_photos(
+            db=get_db(), code=CODE, photos=directory_roster_photos(photos), user_data_dir=users
+        )
+
+    face_service.configure_face_backend("fake")
+    try:
+        with (
+            app.app_context(),
+            patch("app.services.bulk_enrollment.get_face_pool", return_value=_DeferredPool()),
+        ):
+            with patch(
+                "app.services.bulk_enrollment.repository.replace_face_templates",
+                side_effect=sqlite3.OperationalError("disk I/O error"),
+            ):
+                with pytest.raises(sqlite3.OperationalError):
+                    enroll()
+            # Nothing staged was put in place or left behind
+            assert existing.read_bytes() == b"previous reference"
+            assert [p.name for p in (users / "Student").iterdir()] == ["stu1234"]
+            assert [p.name for p in existing.parent.iterdir()] == ["reference_image.jpg"]
+
+            result = enroll()
+    finally:
+        face_service.configure_face_backend("dlib")
+
+    assert [(e.file, e.status) for e in result.entries] == [
+        ("abc1234.jpg", "enrolled"),
+        ("bad-name.jpg", "error"),
+        ("def5678.jpg", "enrolled"),
+        ("stu1234.jpg", "enrolled"),
+    ]
+    assert existing.read_bytes() != b"previous reference"
+    assert not list(users.rglob("*.staged"))
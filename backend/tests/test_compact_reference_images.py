@@ -0,0 +1,90 @@
+from __future__ import annotations
+
+from pathlib import Path
+
+import numpy as np
+from PIL import Image
+
+from app.services import face_service
+from app.services.face_service import load_reference_templates, write_reference_templates
+
+
+def _write_reference(user_data_dir: Path, euid: str, size: int, seed: int) -> Path:
+    ref_path = user_data_dir / "Student" / euid / "reference_image.jpg"
+    ref_path.parent.mkdir(parents=True, exist_ok=True)
+    pixels = np.random.default_rng(seed).integers(0, 255, size=(size, size, 3), dtype=np.uint8)
+    Image.fromarray(pixels).save(ref_path, format="JPEG")
+    return ref_path
+
+
+def test_compaction_crops_archives_and_keeps_templates(tmp_path: Path) -> None:
+    from scripts.compact_reference_images import run_compaction
+
+    user_data_dir = tmp_path / "users"
+    big = _write_reference(user_data_dir, "stu1234", 256, seed=1)
+    templates = np.random.default_rng(7).normal(size=(2, 128))
+    write_reference_templates(reference_image_path=big, encodings=templates)
+    small = _write_reference(user_data_dir, "stu9999", 32, seed=2)  # already compact
+    _write_reference(user_data_dir, "stu0001", 256, seed=3)
+    original = big.read_bytes()
+
+    face_service.configure_face_backend("fake")
+    face_service.configure_reference_storage(crop_dim=64, archive_dir=tmp_path / "archive")
+    try:
+        dry = run_compaction(
+            user_data_dir=user_data_dir, crop_dim=64, workers=0, backend_name="fake", dry_run=True
+        )
+        assert (dry.total, dry.compacted, dry.skipped) == (3, 2, 1)
+        assert big.read_bytes() == original
+
+        report = run_compaction(
+            user_data_dir=user_data_dir, crop_dim=64, workers=0, backend_name="fake"
+        )
+    finally:
+        face_service.configure_face_backend("dlib")
+        face_service.configure_reference_storage(
+            crop_dim=face_service.DEFAULT_REFERENCE_CROP_DIM, archive_dir=None
+        )
+
+    assert (report.compacted, report.failed, report.skipped) == (2, 0, 1)
+    assert report.bytes_after < report.bytes_before
+    with Image.open(big) as img:
+        assert max(img.size) <= 64
+    assert (tmp_path / "archive" / "stu1234" / "reference_original.jpg").read_bytes() == original
+    # The encodings carry over to the sidecar of the new file.
+    assert np.allclose(load_reference_templates(big), templates)
+    assert (
+        load_reference_templates(user_data_dir / "Student" / "stu0001" / "reference_image.jpg")
+        is not None
+    )
+    with Image.open(small) as img:
+        assert img.size == (32, 32)
+
+
+def test_compaction_keeps_original_when_archiving_fails(tmp_path: Path) -> None:
+    from scripts.compact_reference_images import run_compaction
+
+    user_data_dir = tmp_path / "users"
+    ref_path = _write_reference(user_data_dir, "stu1234", 256, seed=1)
+    original = ref_path.read_bytes()
+    archive_dir = tmp_path / "archive"
+    archive_dir.write_bytes(b"")  # a file where the archive directory should be
+
+    face_service.configure_face_backend("fake")
+    face_service.configure_reference_storage(crop_dim=64, archive_dir=archive_dir)
+    try:
+        report = run_compaction(
+            user_data_dir=user_data_dir, crop_dim=64, workers=0, backend_name="fake"
+        )
+    finally:
+        face_service.configure_face_backend("dlib")
+        face_service.configure_reference_storage(
+            crop_dim=face_service.DEFAULT_REFERENCE_CROP_DIM, archive_dir=None
+        )
+
+    assert (report.compacted, report.failed) == (0, 1)
+    assert report.failures == {
+        "Unable to store reference: original could not be archived": ["stu1234"]
+    }
+    assert ref_path.read_bytes() == original
+    assert [p.name for p in ref_path.parent.iterdir()] == ["reference_image.jpg"]
@@ -0,0 +1,61 @@
+from __future__ import annotations
+
+import numpy as np
+
+from app.services.encoding_cache import EncodingCache
+
+
+def _vec(value: float = 0.0) -> np.ndarray:
+    return np.full(128, value)  # float64 -> 1024 bytes
+
+
+def test_hit_and_miss_counters() -> None:
+    cache = EncodingCache(max_entries=4, max_bytes=1 << 20)
+
+    assert cache.get("stu1234", 1) is None
+    cache.put("stu1234", 1, _vec(0.5))
+    hit = cache.get("stu1234", 1)
+
+    assert hit is not None and np.allclose(hit, 0.5)
+    stats = cache.stats()
+    assert (stats["hits"], stats["misses"], stats["entries"]) == (1, 1, 1)
+
+
+def test_version_change_invalidates_entry() -> None:
+    cache = EncodingCache(max_entries=4, max_bytes=1 << 20)
+    cache.put("stu1234", (100, 10), _vec())
+
+    assert cache.get("stu1234", (200, 10)) is None
+    stats = cache.stats()
+    assert stats["invalidations"] == 1
+    assert stats["entries"] == 0
+
+
+def test_evicts_least_recently_used_by_entry_count() -> None:
+    cache = EncodingCache(max_entries=2, max_bytes=1 << 20)
+    cache.put("a", 1, _vec())
+    cache.put("b", 1, _vec())
+    cache.get("a", 1)  # "b" is now the LRU entry
+    cache.put("c", 1, _vec())
+
+    assert cache.get("b", 1) is None
+    assert cache.get("a", 1) is not None
+    assert cache.stats()["evictions"] == 1
+
+
+def test_evicts_to_stay_within_byte_budget() -> None:
+    cache = EncodingCache(max_entries=100, max_bytes=2048)
+    for key in ("a", "b", "c"):
+        cache.put(key, 1, _vec())
+
+    stats = cache.stats()
+    assert stats["entries"] == 2
+    assert stats["bytes"] <= 2048
+    assert cache.get("a", 1) is None
+
+
+def test_cached_encodings_are_read_only() -> None:
+    cache = EncodingCache(max_entries=4, max_bytes=1 << 20)
+    cache.put("stu1234", 1, _vec())
+
+    assert cache.get("stu1234", 1).flags.writeable is False
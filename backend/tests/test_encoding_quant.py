@@ -0,0 +1,92 @@
+from __future__ import annotations
+
+import numpy as np
+import pytest
+
+from app.services.encoding_quant import (
+    QuantizedEncodings,
+    encoding_arrays,
+    encodings_from_arrays,
+    quantize_encodings,
+)
+from app.services.face_service import face_distances, pairwise_face_distances
+
+TOLERANCE = 0.6
+
+
+def _gallery(size: int = 2000, seed: int = 0) -> tuple[np.ndarray, np.ndarray]:
+    # dlib-scale values; probes are noisy recaptures of the first few people.
+    rng = np.random.default_rng(seed)
+    people = rng.normal(0.0, 0.09, size=(size, 128))
+    n = min(size, 200)
+    probes = people[:n] + rng.normal(0.0, 0.03, size=(n, 128))
+    return people, probes
+
+
+@pytest.mark.parametrize(
+    ("dtype", "max_error", "ratio"),
+    [("float32", 1e-5, 1.9), ("float16", 5e-4, 3.5), ("int8", 1e-2, 7.0)],
+)
+def test_distance_error_against_float64(dtype: str, max_error: float, ratio: float) -> None:
+    gallery, probes = _gallery()
+    exact = pairwise_face_distances(probes, gallery)
+
+    stored = quantize_encodings(gallery, dtype)
+    approx = pairwise_face_distances(probes, stored)
+
+    error = np.abs(approx - exact)
+    assert error.max() < max_error
+    # Match decisions at the verification tolerance are unchanged except within the error band.
+    flipped = (approx <= TOLERANCE) != (exact <= TOLERANCE)
+    assert np.all(np.abs(exact[flipped] - TOLERANCE) < max_error)
+    # Same nearest neighbour for every probe.
+    assert np.array_equal(approx.argmin(axis=1), exact.argmin(axis=1))
+    # Memory saved, counting the per-row scale and precomputed norms.
+    assert gallery.nbytes / stored.nbytes >= ratio
+
+
+def test_single_probe_distances_match_pairwise() -> None:
+    gallery, probes = _gallery(size=300)
+    stored = quantize_encodings(gallery, "int8")
+
+    assert np.allclose(
+        face_distances(stored, probes[0]), pairwise_face_distances(probes, stored)[0]
+    )
+
+
+def test_distances_span_multiple_chunks(monkeypatch) -> None:
+    from app.services import encoding_quant
+
+    monkeypatch.setattr(encoding_quant, "_CHUNK_ROWS", 64)
+    gallery, probes = _gallery(size=1000)
+    stored = quantize_encodings(gallery, "float16")
+
+    exact = np.linalg.norm(gallery - probes[3], axis=1)
+    assert np.abs(stored.distances(probes[3]) - exact).max() < 2e-3
+
+
+def test_int8_round_trip_and_row_access() -> None:
+    gallery, _ = _gallery(size=10)
+    stored = QuantizedEncodings.from_float(gallery, "int8")
+
+    assert stored.shape == (10, 128) and len(stored) == 10
+    assert np.abs(stored.dequantize() - gallery).max() < np.abs(gallery).max() / 127
+    assert np.allclose(stored[3], stored.dequantize()[3])
+
+    restored = encodings_from_arrays(**_as_kwargs(encoding_arrays(stored)))
+    assert np.array_equal(restored, stored.dequantize())
+
+
+def test_zero_row_and_float64_passthrough() -> None:
+    stored = quantize_encodings(np.zeros((1, 128)), "int8")
+    assert np.array_equal(stored.dequantize(), np.zeros((1, 128)))
+
+    plain = quantize_encodings(np.ones((2, 128)), "float64")
+    assert isinstance(plain, np.ndarray) and not plain.flags.writeable
+
+    with pytest.raises(ValueError):
+        quantize_encodings(np.ones((2, 128)), "int4")
+
+
+def _as_kwargs(arrays: dict) -> dict:
+    return {"data": arrays["encodings"], "scale": arrays.get("scale")}
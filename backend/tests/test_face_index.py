@@ -0,0 +1,167 @@
+from __future__ import annotations
+
+import base64
+from io import BytesIO
+from pathlib import Path
+from unittest.mock import patch
+
+import numpy as np
+import pytest
+from PIL import Image
+
+from app.services import face_service
+from app.services.face_index import FaceIndex
+from app.services.face_service import (
+    PhotoEncoding,
+    identify_enrolled_face,
+    reference_image_path,
+    write_reference_encoding,
+)
+
+
+def _img_b64() -> str:
+    buf = BytesIO()
+    Image.new("RGB", (1, 1)).save(buf, format="JPEG")
+    return base64.b64encode(buf.getvalue()).decode("utf-8")
+
+
+def _enroll_reference(user_data_dir: Path, euid: str, encoding: np.ndarray) -> None:
+    ref_path = reference_image_path(user_data_dir, euid)
+    ref_path.parent.mkdir(parents=True, exist_ok=True)
+    ref_path.write_bytes(b"dummy")
+    write_reference_encoding(reference_image_path=ref_path, encoding=encoding)
+
+
+def _gallery(n: int, seed: int = 0) -> dict[str, np.ndarray]:
+    rng = np.random.default_rng(seed)
+    return {f"s{i:05d}": v for i, v in enumerate(rng.normal(0.0, 0.1, size=(n, 128)))}
+
+
+def test_trained_index_matches_brute_force(tmp_path: Path) -> None:
+    gallery = _gallery(400)
+    index = FaceIndex(tmp_path / "index.npz", dim=128, nprobe=4, min_train_size=100)
+    index.rebuild(gallery)
+
+    euids = list(gallery)
+    matrix = np.stack(list(gallery.values()))
+    rng = np.random.default_rng(1)
+    hits = 0
+    for i in rng.integers(0, len(euids), size=50):
+        probe = matrix[i] + rng.normal(0.0, 0.01, size=128)
+        hits += index.search(probe, k=1)[0][0] == euids[i]
+    assert hits >= 48
+
+
+def test_flat_index_is_exact_and_sorted(tmp_path: Path) -> None:
+    index = FaceIndex(tmp_path / "index.npz", dim=128)
+    index.rebuild({"a": np.zeros(128), "b": np.ones(128), "c": np.full(128, 0.1)})
+
+    results = index.search(np.zeros(128), k=2)
+
+    assert [euid for euid, _ in results] == ["a", "c"]
+    assert results[0][1] == 0.0
+
+
+def test_upsert_and_remove_persist_across_instances(tmp_path: Path) -> None:
+    path = tmp_path / "index.npz"
+    index = FaceIndex(path, dim=128)
+    index.upsert("a", np.zeros(128))
+    index.upsert("b", np.ones(128))
+    index.upsert("a", np.full(128, 2.0))  # re-enrollment replaces the vector
+    assert index.remove("b")
+    assert not index.remove("missing")
+
+    reloaded = FaceIndex(path, dim=128)
+    assert len(reloaded) == 1
+    assert reloaded.search(np.full(128, 2.0))[0] == ("a", 0.0)
+
+    # Another worker's write is picked up on the next query.
+    reloaded.upsert("c", np.ones(128))
+    assert "c" in index
+
+
+def test_int8_index_file_is_smaller_and_searches_the_same(tmp_path: Path) -> None:
+    rng = np.random.default_rng(3)
+    entries = {f"s{i:03d}": v for i, v in enumerate(rng.normal(0.0, 0.09, size=(300, 128)))}
+
+    full = FaceIndex(tmp_path / "full.npz", dim=128)
+    full.rebuild(entries)
+    small = FaceIndex(tmp_path / "small.npz", dim=128, dtype="int8")
+    small.rebuild(entries)
+
+    assert small.path.stat().st_size < full.path.stat().st_size / 2
+    reloaded = FaceIndex(small.path, dim=128)
+    probe = entries["s042"] + rng.normal(0.0, 0.02, size=128)
+    assert reloaded.search(probe)[0][0] == full.search(probe)[0][0] == "s042"
+
+
+def test_incremental_inserts_retrain_when_population_doubles(tmp_path: Path) -> None:
+    index = FaceIndex(tmp_path / "index.npz", dim=128, nprobe=2, min_train_size=50)
+    gallery = _gallery(121)
+    index.rebuild(dict(list(gallery.items())[:60]))
+    trained = index._centroids.copy()
+
+    for euid, vec in list(gallery.items())[60:]:
+        index.upsert(euid, vec)
+
+    assert len(index) == 121
+    assert index._trained_size == 121
+    assert len(index._centroids) != len(trained)
+
+
+def test_identify_enrolled_face_builds_index_in_the_background(tmp_path: Path) -> None:
+    _enroll_reference(tmp_path, "stu1234", np.zeros(128))
+    _enroll_reference(tmp_path, "stu9999", np.ones(128))
+    legacy = reference_image_path(tmp_path, "stu5678")  # no sidecar: left to the backfill
+    legacy.parent.mkdir(parents=True)
+    legacy.write_bytes(b"dummy")
+
+    probe = PhotoEncoding(encoding=np.full(128, 0.98))
+    with patch.object(face_service, "encode_photo", return_value=probe) as encode:
+        with pytest.raises(face_service.FaceIndexUnavailable) as unavailable:
+            identify_enrolled_face(submitted_photo_b64=_img_b64(), user_data_dir=tmp_path)
+        assert unavailable.value.status_code == 503 and unavailable.value.retry_after > 0
+        face_service.start_face_index_build(tmp_path).join(5)
+        assert encode.call_count == 0  # nothing was encoded to build the index
+
+        result = identify_enrolled_face(submitted_photo_b64=_img_b64(), user_data_dir=tmp_path)
+
+    assert result.status == "success"
+    assert result.euid == "stu9999"
+    assert len(face_service.enrolled_face_index(tmp_path)) == 2
+
+
+def test_identify_rechecks_stale_index_entries(tmp_path: Path) -> None:
+    _enroll_reference(tmp_path, "stu1234", np.zeros(128))
+    face_service.rebuild_face_index(tmp_path)
+
+    # Re-enrolled without the index hearing about it: the old vector must not match.
+    _enroll_reference(tmp_path, "stu1234", np.ones(128))
+
+    probe = PhotoEncoding(encoding=np.zeros(128))
+    with patch.object(face_service, "encode_photo", return_value=probe):
+        result = identify_enrolled_face(submitted_photo_b64=_img_b64(), user_data_dir=tmp_path)
+
+    assert result.status == "error"
+    assert result.error == "No matching student"
+
+
+def test_face_login_without_euid_identifies_student(client, app) -> None:
+    cfg = app.config["APP_CONFIG"]
+    _enroll_reference(cfg.user_data_dir, "stu1234", np.zeros(128))
+    _enroll_reference(cfg.user_data_dir, "stu9999", np.ones(128))
+
+    probe = PhotoEncoding(encoding=np.full(128, 0.99))
+    with patch.object(face_service, "encode_photo", return_value=probe):
+        building = client.post("/auth/face-login", json={"photo": _img_b64()})
+        assert building.status_code == 503
+        assert int(building.headers["Retry-After"]) > 0
+        face_service.start_face_index_build(cfg.user_data_dir).join(5)
+        resp = client.post("/auth/face-login", json={"photo": _img_b64()})
+
+    assert resp.status_code == 200, resp.json
+    me = client.get(
+        "/students/stu9999/attendance",
+        headers={"Authorization": f"Bearer {resp.json['access_token']}"},
+    )
+    assert me.status_code == 200
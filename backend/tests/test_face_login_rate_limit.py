@@ -95,4 +95,29 @@ def test_face_login_rate_limit_is_per_user(client, app, monkeypatch) -> None:
     # stu9999 should still get "normal" attempts (verify_face_match called)
     before = mock_verify.call_count
     assert client.post("/auth/face-login", json=p2).status_code == 401
-    assert mock_verify.call_count == before + 1
\ No newline at end of file
+    assert mock_verify.call_count == before + 1
+
+def test_identify_rate_limit_is_per_device_behind_one_address(client, app, monkeypatch) -> None:
+    """
+    Students behind one NAT share an address: identify mode limits each device separately,
+    with a larger cap for the whole address.
+    """
+    import app.services.auth_service as auth_service
+
+    monkeypatch.setattr(auth_service, "_FACE_LOGIN_ATTEMPTS", defaultdict(list))
+    monkeypatch.setattr(auth_service, "_FACE_LOGIN_MAX_ATTEMPTS", 2)
+    mock_identify = Mock(return_value=type("R", (), {"status": "error", "euid": None})())
+    monkeypatch.setattr(auth_service, "identify_enrolled_face", mock_identify)
+
+    def attempt(device_id: str) -> None:
+        resp = client.post("/auth/face-login", json={"photo": _img_b64(), "device_id": device_id})
+        assert resp.status_code == 401
+
+    for _ in range(3):
+        attempt("phone-a")  # the third one is rate limited
+    assert mock_identify.call_count == 2
+    attempt("phone-b")
+    assert mock_identify.call_count == 3
+
+    bad = client.post("/auth/face-login", json={"photo": _img_b64(), "device_id": "has space"})
+    assert bad.status_code == 400
@@ -0,0 +1,188 @@
+from __future__ import annotations
+
+import base64
+import os
+import subprocess
+import sys
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from io import BytesIO
+from pathlib import Path
+
+import pytest
+from PIL import Image
+
+from app.services.face_pool import FacePool, FacePoolBroken, FacePoolBusy, FacePoolTimeout
+from app.services.face_service import init_face_worker
+
+
+def _thread_pool(workers: int) -> ThreadPoolExecutor:
+    return ThreadPoolExecutor(max_workers=workers)
+
+
+def _pool(**overrides) -> FacePool:
+    kwargs = dict(
+        workers=1,
+        max_queue=1,
+        timeout_seconds=5.0,
+        retry_after_seconds=3,
+        executor_factory=_thread_pool,
+    )
+    kwargs.update(overrides)
+    return FacePool(**kwargs)
+
+
+def test_inline_pool_runs_on_calling_thread() -> None:
+    pool = FacePool(workers=0, max_queue=0, timeout_seconds=1.0)
+    assert pool.run(threading.get_ident) == threading.get_ident()
+
+
+def test_inline_pool_propagates_job_errors() -> None:
+    pool = FacePool(workers=0, max_queue=0, timeout_seconds=1.0)
+
+    def boom():
+        raise RuntimeError("bad image")
+
+    with pytest.raises(RuntimeError):
+        pool.run(boom)
+
+
+def test_rejects_when_workers_and_queue_are_full() -> None:
+    pool = _pool(workers=1, max_queue=1)
+    release = threading.Event()
+
+    try:
+        running = pool.submit(release.wait)
+        queued = pool.submit(release.wait)
+
+        with pytest.raises(FacePoolBusy) as exc:
+            pool.submit(release.wait)
+        assert exc.value.retry_after == 3
+        assert exc.value.status_code == 429
+        assert pool.stats()["rejected"] == 1
+
+        release.set()
+        assert running.result() is True
+        assert queued.result() is True
+    finally:
+        release.set()
+        pool.shutdown()
+
+
+def test_capacity_is_released_when_jobs_finish() -> None:
+    pool = _pool(workers=1, max_queue=0)
+    try:
+        for _ in range(3):
+            assert pool.run(lambda: 42) == 42
+        assert pool.stats()["completed"] == 3
+    finally:
+        pool.shutdown()
+
+
+def test_deadline_raises_timeout() -> None:
+    pool = _pool(timeout_seconds=0.05)
+    release = threading.Event()
+    try:
+        with pytest.raises(FacePoolTimeout):
+            pool.run(release.wait)
+        assert pool.stats()["timeouts"] == 1
+    finally:
+        release.set()
+        pool.shutdown()
+
+
+def _img_b64() -> str:
+    buf = BytesIO()
+    Image.new("RGB", (1, 1)).save(buf, format="JPEG")
+    return base64.b64encode(buf.getvalue()).decode("utf-8")
+
+
+def test_busy_pool_maps_to_429_with_retry_after(client, app, monkeypatch) -> None:
+    import app.services.auth_service as auth_service
+
+    cfg = app.config["APP_CONFIG"]
+    ref_path = Path(cfg.user_data_dir) / "Student" / "stu1234" / "reference_image.jpg"
+    ref_path.parent.mkdir(parents=True, exist_ok=True)
+    ref_path.write_bytes(b"dummy")
+
+    def busy(**_kwargs):
+        raise FacePoolBusy("Face verification busy", retry_after=7)
+
+    monkeypatch.setattr(auth_service, "verify_face_match", busy)
+
+    resp = client.post("/auth/face-login", json={"euid": "stu1234", "photo": _img_b64()})
+    assert resp.status_code == 429
+    assert resp.headers["Retry-After"] == "7"
+    assert resp.json["status"] == "error"
+
+
+def test_prestart_starts_executor_and_reports_ready() -> None:
+    pool = _pool(workers=2)
+    try:
+        assert pool.prestart(timeout_seconds=5.0) is True
+        assert pool._executor is not None
+    finally:
+        pool.shutdown()
+
+    assert _pool(workers=0).prestart(timeout_seconds=0.1) is True
+
+
+def test_dead_worker_is_replaced_on_next_job() -> None:
+    pool = FacePool(
+        workers=1,
+        max_queue=1,
+        timeout_seconds=30.0,
+        initializer=init_face_worker,
+        initargs=("fake", False),
+    )
+    try:
+        first = pool.run(os.getpid)
+        with pytest.raises(FacePoolBroken) as exc:
+            pool.run(os._exit, 1)
+        assert exc.value.status_code == 503
+        assert pool.stats()["broken"] == 1
+
+        assert pool.run(os.getpid) not in (first, os.getpid())
+    finally:
+        pool.shutdown()
+
+
+# Serves run.py the way `python run.py` does, with waitress swapped for one face job: spawned
+# workers re-import the main module, which must not build (and warm up) an app of its own.
+_SERVE_RUN_PY = """
+import os, runpy, waitress
+from app.services.face_pool import get_face_pool
+
+def serve(app, **_kwargs):
+    print("job ran in", "worker" if get_face_pool().run(os.getpid) != os.getpid() else "parent")
+
+waitress.serve = serve
+runpy.run_path("run.py", run_name="__main__")
+"""
+
+
+def test_run_py_workers_do_not_build_the_app(tmp_path: Path) -> None:
+    backend_dir = Path(__file__).resolve().parents[1]
+    env = {
+        **os.environ,
+        "PYTHONPATH": str(backend_dir),
+        "USER_DATA_DIR": str(tmp_path / "users"),
+        "DATABASE_PATH": str(tmp_path / "app.db"),
+        "FACE_BACKEND": "fake",
+        "FACE_WORKERS": "1",
+        "FACE_WARMUP": "1",
+        "FACE_WARMUP_TIMEOUT_SECONDS": "60",
+    }
+
+    proc = subprocess.run(
+        [sys.executable, "-c", _SERVE_RUN_PY],
+        cwd=backend_dir,
+        env=env,
+        capture_output=True,
+        text=True,
+        timeout=120,
+    )
+
+    assert proc.returncode == 0, proc.stderr
+    assert proc.stdout.strip() == "job ran in worker"
+    assert "not ready" not in proc.stderr
@@ -1,10 +1,23 @@
 from __future__ import annotations
 
 import base64
+import json
+from io import BytesIO
 from pathlib import Path
 from unittest.mock import patch
 
-from app.services.face_service import verify_face_match
+import numpy as np
+import pytest
+from PIL import Image
+
+from app.services import face_service
+from app.services.face_service import (
+    load_reference_encoding,
+    reference_encoding_path,
+    save_reference_image,
+    verify_face_match,
+    write_reference_encoding,
+)
 
 
 class FakeFR:
@@ -19,6 +32,10 @@ class FakeFR:
             return self._load_side_effect.pop(0)
         return "img_arr"
 
+    def face_locations(self, image, *_args, **_kwargs):
+        height, width = np.asarray(image).shape[:2]
+        return [(0, width, height, 0)]
+
     def face_encodings(self, *_args, **_kwargs):
         if self._enc_side_effect:
             return self._enc_side_effect.pop(0)
@@ -33,6 +50,12 @@ def _b64(data: bytes) -> str:
     return base64.b64encode(data).decode("utf-8")
 
 
+def _jpeg_bytes() -> bytes:
+    buf = BytesIO()
+    Image.new("RGB", (4, 4)).save(buf, format="JPEG")
+    return buf.getvalue()
+
+
 def test_reference_image_missing(tmp_path: Path) -> None:
     result = verify_face_match(
         submitted_photo_b64=_b64(b"fake"),
@@ -120,9 +143,697 @@ def test_invalid_base64_rejected(tmp_path: Path) -> None:
     assert "base64" in (result.error or "").lower()
 
 
+@patch("app.services.face_service._fr")
+def test_save_reference_image_writes_encoding_sidecar(mock_fr, tmp_path: Path) -> None:
+    fake_fr = FakeFR()
+    fake_fr._enc_side_effect = [[np.full(128, 0.25)]]
+    mock_fr.return_value = fake_fr
+
+    ref_path = tmp_path / "stu1234" / "reference_image.jpg"
+    stored = save_reference_image(photo_b64=_b64(_jpeg_bytes()), dest_path=ref_path)
+
+    assert stored is True
+    assert reference_encoding_path(ref_path).exists()
+    encoding = load_reference_encoding(ref_path)
+    assert encoding is not None
+    assert np.allclose(encoding, 0.25)
+
+
+@patch("app.services.face_service._fr")
+def test_save_reference_image_without_face_skips_sidecar(mock_fr, tmp_path: Path) -> None:
+    fake_fr = FakeFR()
+    fake_fr._enc_side_effect = [[]]
+    mock_fr.return_value = fake_fr
+
+    ref_path = tmp_path / "stu1234" / "reference_image.jpg"
+    stored = save_reference_image(photo_b64=_b64(_jpeg_bytes()), dest_path=ref_path)
+
+    assert stored is False
+    assert ref_path.exists()
+    assert not reference_encoding_path(ref_path).exists()
+
+
+@patch("app.services.face_service.Image.open")
+@patch("app.services.face_service._fr")
+def test_verify_uses_sidecar_instead_of_reference_image(
+    mock_fr, mock_image_open, tmp_path: Path
+) -> None:
+    ref_path = tmp_path / "reference_image.jpg"
+    ref_path.write_bytes(b"dummy")
+    write_reference_encoding(reference_image_path=ref_path, encoding=np.zeros(128))
+
+    mock_image_open.return_value = _FakePILImage()
+
+    fake_fr = FakeFR()
+    fake_fr._enc_side_effect = [[np.zeros(128)]]  # only the submitted photo is encoded
+    mock_fr.return_value = fake_fr
+
+    with patch.object(fake_fr, "load_image_file", wraps=fake_fr.load_image_file) as load:
+        result = verify_face_match(
+            submitted_photo_b64=_b64(b"submitted-image-bytes"),
+            reference_image_path=ref_path,
+        )
+
+    assert result.status == "success"
+    assert all(str(ref_path) not in map(str, c.args) for c in load.call_args_list)
+
+
+@patch("app.services.face_service.Image.open")
+@patch("app.services.face_service._fr")
+def test_repeat_verification_served_from_encoding_cache(
+    mock_fr, mock_image_open, tmp_path: Path
+) -> None:
+    ref_path = tmp_path / "reference_image.jpg"
+    ref_path.write_bytes(b"dummy")
+    write_reference_encoding(reference_image_path=ref_path, encoding=np.zeros(128))
+
+    mock_image_open.return_value = _FakePILImage()
+    fake_fr = FakeFR()
+    fake_fr._enc_side_effect = [[np.zeros(128)], [np.zeros(128)]]
+    mock_fr.return_value = fake_fr
+
+    with patch(
+        "app.services.face_service.load_reference_templates",
+        wraps=face_service.load_reference_templates,
+    ) as load:
+        for i in range(2):
+            # distinct photos, so the verification result cache doesn't short-circuit
+            result = verify_face_match(
+                submitted_photo_b64=_b64(b"submitted-image-bytes-%d" % i),
+                reference_image_path=ref_path,
+            )
+            assert result.status == "success"
+
+    # Second call is a cache hit: the sidecar is only read once.
+    assert load.call_count == 1
+
+
+def test_sidecar_is_stale_after_reference_image_changes(tmp_path: Path) -> None:
+    ref_path = tmp_path / "reference_image.jpg"
+    ref_path.write_bytes(b"dummy")
+    write_reference_encoding(reference_image_path=ref_path, encoding=np.zeros(128))
+    assert load_reference_encoding(ref_path) is not None
+
+    ref_path.write_bytes(b"re-enrolled reference")
+    assert load_reference_encoding(ref_path) is None
+
+
+class PipelineFR:
+    """
+    Decodes real arrays and records what detection/encoding were called with.
+    """
+
+    def __init__(self, boxes):
+        self.boxes = boxes
+        self.detect_shapes = []
+        self.encode_calls = []
+
+    def load_image_file(self, f):
+        return np.asarray(Image.open(f).convert("RGB"))
+
+    def face_locations(self, arr, *_args, **_kwargs):
+        self.detect_shapes.append(arr.shape)
+        return self.boxes
+
+    def face_encodings(self, arr, known_face_locations=None, **_kwargs):
+        self.encode_calls.append((arr.shape, known_face_locations))
+        return [np.zeros(128) for _ in known_face_locations or []]
+
+
+def _jpeg(size: tuple[int, int]) -> bytes:
+    buf = BytesIO()
+    Image.new("RGB", size).save(buf, format="JPEG")
+    return buf.getvalue()
+
+
+@patch("app.services.face_service._fr")
+def test_encode_photo_detects_on_downscaled_copy(mock_fr) -> None:
+    # Box in detection coordinates (640x320 copy of a 2000x1000 capture).
+    fake_fr = PipelineFR(boxes=[(100, 300, 200, 200)])
+    mock_fr.return_value = fake_fr
+
+    result = face_service.encode_photo(
+        _jpeg((2000, 1000)),
+        face_service.FacePipelineOptions(detect_max_dim=640, encode_max_dim=1280),
+    )
+
+    assert result.error is None
+    assert fake_fr.detect_shapes == [(320, 640, 3)]
+    encode_shape, boxes = fake_fr.encode_calls[0]
+    assert encode_shape == (640, 1280, 3)
+    assert boxes == [(200, 600, 400, 400)]  # mapped back by 2x
+    assert {"decode_ms", "detect_ms", "encode_ms"} <= set(result.timings)
+
+
+@patch("app.services.face_service._fr")
+def test_encode_photo_small_image_is_not_resized(mock_fr) -> None:
+    fake_fr = PipelineFR(boxes=[(1, 5, 5, 1)])
+    mock_fr.return_value = fake_fr
+
+    result = face_service.encode_photo(_jpeg((320, 240)))
+
+    assert result.error is None
+    assert fake_fr.detect_shapes == [(240, 320, 3)]
+    assert fake_fr.encode_calls[0] == ((240, 320, 3), [(1, 5, 5, 1)])
+
+
+@patch("app.services.face_service._fr")
+def test_encode_photo_reports_no_face(mock_fr) -> None:
+    mock_fr.return_value = PipelineFR(boxes=[])
+
+    result = face_service.encode_photo(_jpeg((1600, 1200)))
+
+    assert result.encoding is None
+    assert result.error == "No face detected in submitted image"
+    assert "encode_ms" not in result.timings
+
+
+def test_load_image_from_bytes_converts_without_jpeg_round_trip() -> None:
+    src = Image.new("RGB", (6, 4), (10, 20, 30))
+    buf = BytesIO()
+    src.save(buf, format="PNG")
+
+    class NoLoadFR:
+        def load_image_file(self, *_args, **_kwargs):
+            raise AssertionError("PIL images must not be re-encoded")
+
+    arr = face_service._load_image_from_bytes(buf.getvalue(), NoLoadFR())
+
+    assert arr.shape == (4, 6, 3)
+    assert arr.dtype == np.uint8
+    assert arr.flags.c_contiguous and arr.flags.writeable
+    assert (arr == np.array([10, 20, 30], dtype=np.uint8)).all()  # lossless: exact pixels
+
+
+def test_oversized_jpeg_is_draft_decoded_at_reduced_scale() -> None:
+    img = face_service._open_normalized_image(_jpeg((2000, 1600)), target_dim=640)
+
+    # 1/2 scale is the smallest DCT scale that keeps the longest edge >= 640.
+    assert img.size == (1000, 800)
+    assert img.mode == "RGB"
+
+
+def test_small_jpeg_is_decoded_at_native_size() -> None:
+    img = face_service._open_normalized_image(_jpeg((320, 240)), target_dim=640)
+    assert img.size == (320, 240)
+
+
+def test_exif_orientation_is_applied_after_draft_decode() -> None:
+    src = Image.new("RGB", (2000, 1000))
+    exif = src.getexif()
+    exif[0x0112] = 6  # rotate 90 CW on display
+    buf = BytesIO()
+    src.save(buf, format="JPEG", exif=exif.tobytes())
+
+    img = face_service._open_normalized_image(buf.getvalue(), target_dim=500)
+
+    assert img.size == (250, 500)  # 1/4 scale (500x250), then transposed to portrait
+
+
+@patch("app.services.face_service._fr")
+def test_save_reference_image_bounds_oversized_capture(mock_fr, tmp_path: Path) -> None:
+    mock_fr.return_value = FakeFR()
+    ref_path = tmp_path / "reference_image.jpg"
+
+    face_service.configure_reference_storage(crop_dim=0, archive_dir=None)  # whole frame
+    try:
+        save_reference_image(
+            photo_b64=_b64(_jpeg((3000, 2000))), dest_path=ref_path, target_dim=1000
+        )
+    finally:
+        face_service.configure_reference_storage(
+            crop_dim=face_service.DEFAULT_REFERENCE_CROP_DIM, archive_dir=None
+        )
+
+    with Image.open(ref_path) as stored:
+        assert stored.size == (1000, 667)
+
+
+@patch("app.services.face_service._fr")
+def test_save_reference_image_stores_face_crop_and_archives_original(
+    mock_fr, tmp_path: Path
+) -> None:
+    # A 200px face on the 640x320 detection copy of a 2000x1000 capture (1280x640 frame).
+    mock_fr.return_value = PipelineFR(boxes=[(100, 300, 200, 200)])
+    ref_path = tmp_path / "users" / "stu1234" / "reference_image.jpg"
+    original = _jpeg((2000, 1000))
+
+    face_service.configure_reference_storage(crop_dim=100, archive_dir=tmp_path / "archive")
+    try:
+        assert save_reference_image(photo_b64=_b64(original), dest_path=ref_path) is True
+    finally:
+        face_service.configure_reference_storage(
+            crop_dim=face_service.DEFAULT_REFERENCE_CROP_DIM, archive_dir=None
+        )
+
+    with Image.open(ref_path) as stored:
+        assert stored.size == (100, 100)  # 400px square around the face, bounded
+    archived = tmp_path / "archive" / "stu1234" / "reference_original.jpg"
+    assert archived.read_bytes() == original
+    assert face_service.load_reference_templates(ref_path) is not None
+
+
 class _FakePILImage:
     def convert(self, mode: str):
         return self
 
     def save(self, buf, format: str = "JPEG", quality: int = 95):
         buf.write(b"fake-jpeg")
+
+
+@patch("app.services.face_service._fr")
+def test_encode_photo_faces_encodes_every_face_in_one_call(mock_fr) -> None:
+    # Two faces found on the 640x320 detection copy of a 2000x1000 classroom photo.
+    fake_fr = PipelineFR(boxes=[(100, 300, 200, 200), (50, 600, 150, 500)])
+    mock_fr.return_value = fake_fr
+
+    result = face_service.encode_photo_faces(
+        _jpeg((2000, 1000)),
+        face_service.FacePipelineOptions(detect_max_dim=640, encode_max_dim=1280),
+    )
+
+    assert result.error is None
+    assert result.encodings.shape == (2, 128)
+    assert len(fake_fr.encode_calls) == 1
+    assert fake_fr.encode_calls[0][1] == [(200, 600, 400, 400), (100, 1200, 300, 1000)]
+
+
+class RecordingFR(PipelineFR):
+    def __init__(self, boxes):
+        super().__init__(boxes)
+        self.detect_kwargs = []
+        self.encode_kwargs = []
+
+    def face_locations(self, arr, *args, **kwargs):
+        self.detect_kwargs.append(kwargs)
+        return super().face_locations(arr, *args, **kwargs)
+
+    def face_encodings(self, arr, known_face_locations=None, **kwargs):
+        self.encode_kwargs.append(kwargs)
+        return super().face_encodings(arr, known_face_locations, **kwargs)
+
+
+@patch("app.services.face_service._fr")
+def test_preset_knobs_reach_detection_and_encoding(mock_fr) -> None:
+    fake_fr = RecordingFR(boxes=[(10, 60, 60, 10)])
+    mock_fr.return_value = fake_fr
+    options = face_service.apply_face_preset(face_service.FacePipelineOptions(), "accurate")
+
+    result = face_service.encode_photo(_jpeg((320, 240)), options)
+
+    assert result.error is None
+    assert fake_fr.detect_kwargs == [{"number_of_times_to_upsample": 1, "model": "cnn"}]
+    assert fake_fr.encode_kwargs == [{"num_jitters": 5, "model": "large"}]
+
+
+def test_unknown_preset_is_rejected() -> None:
+    with pytest.raises(ValueError, match="Unknown face preset"):
+        face_service.apply_face_preset(face_service.FacePipelineOptions(), "turbo")
+
+
+def test_endpoint_options_fall_back_to_defaults() -> None:
+    default = face_service.FacePipelineOptions()
+    fast = face_service.apply_face_preset(default, "fast")
+    try:
+        face_service.configure_face_pipeline(default, endpoints={"face_login": fast})
+        assert face_service.get_face_pipeline_options("face_login") is fast
+        assert face_service.get_face_pipeline_options("attendance") is default
+    finally:
+        face_service.configure_face_pipeline(default, endpoints={})
+
+
+@patch("app.services.face_service._fr")
+def test_face_box_skips_full_frame_detection(mock_fr) -> None:
+    # Face found in the middle of the 200px verification crop.
+    fake_fr = RecordingFR(boxes=[(50, 150, 150, 50)])
+    mock_fr.return_value = fake_fr
+
+    result = face_service.encode_photo(
+        _jpeg((2000, 1000)),
+        face_service.FacePipelineOptions(detect_max_dim=640, encode_max_dim=1280),
+        (0.25, 0.6, 0.75, 0.4),
+    )
+
+    assert result.error is None
+    assert len(fake_fr.detect_shapes) == 1
+    assert max(fake_fr.detect_shapes[0][:2]) <= face_service.FACE_BOX_VERIFY_DIM
+    ((encode_shape, locations),) = fake_fr.encode_calls
+    assert encode_shape[:2] != (640, 1280)  # encoded on the crop, not the frame
+    assert len(locations) == 1
+
+
+@patch("app.services.face_service._fr")
+def test_face_box_without_face_falls_back_to_full_frame(mock_fr) -> None:
+    class EmptyCropFR(PipelineFR):
+        def face_locations(self, arr, *args, **kwargs):
+            found = super().face_locations(arr, *args, **kwargs)
+            return [] if len(self.detect_shapes) == 1 else found
+
+    fake_fr = EmptyCropFR(boxes=[(100, 300, 200, 200)])
+    mock_fr.return_value = fake_fr
+
+    result = face_service.encode_photo(
+        _jpeg((2000, 1000)),
+        face_service.FacePipelineOptions(detect_max_dim=640, encode_max_dim=1280),
+        (0.1, 0.2, 0.3, 0.1),
+    )
+
+    assert result.error is None
+    assert fake_fr.detect_shapes[-1] == (320, 640, 3)
+
+
+def test_fake_backend_is_deterministic() -> None:
+    backend = face_service.FakeFaceBackend()
+    photo = np.zeros((120, 160, 3), dtype=np.uint8)
+    photo[40:80, 60:100] = 200
+    other = np.full((120, 160, 3), 90, dtype=np.uint8)
+    other[10:30, 10:150] = 10
+
+    (first,) = backend.encode(photo)
+    (again,) = backend.encode(photo.copy())
+    (different,) = backend.encode(other)
+
+    assert first.shape == (128,)
+    assert backend.compare([first], again, tolerance=0.6) == [True]
+    assert backend.compare([first], different, tolerance=0.6) == [False]
+
+
+def test_configure_face_backend_switches_pipeline_engine() -> None:
+    try:
+        face_service.configure_face_backend("fake")
+        result = face_service.encode_photo(_jpeg((320, 240)))
+        assert result.error is None
+        assert result.encoding.shape == (128,)
+    finally:
+        face_service.configure_face_backend("dlib")
+
+
+def test_unknown_face_backend_is_rejected() -> None:
+    with pytest.raises(ValueError, match="Unknown face backend"):
+        face_service.configure_face_backend("onnx")
+
+
+@patch("app.services.face_service.Image.open")
+@patch("app.services.face_service._fr")
+def test_retried_photo_served_from_match_cache(mock_fr, mock_image_open, tmp_path: Path) -> None:
+    ref_path = tmp_path / "reference_image.jpg"
+    ref_path.write_bytes(b"dummy")
+    write_reference_encoding(reference_image_path=ref_path, encoding=np.zeros(128))
+
+    mock_image_open.return_value = _FakePILImage()
+    fake_fr = FakeFR()
+    mock_fr.return_value = fake_fr
+    face_service.configure_match_cache(max_entries=16, ttl_seconds=60)
+    try:
+        with patch(
+            "app.services.face_service.encode_photo", wraps=face_service.encode_photo
+        ) as encode:
+            for _ in range(3):
+                result = verify_face_match(
+                    submitted_photo_b64=_b64(b"same-photo"),
+                    reference_image_path=ref_path,
+                )
+                assert result.status == "success"
+            assert encode.call_count == 1
+
+            # Re-enrolling changes the reference version, so the retry is verified again.
+            ref_path.write_bytes(b"new reference")
+            write_reference_encoding(reference_image_path=ref_path, encoding=np.zeros(128))
+            verify_face_match(
+                submitted_photo_b64=_b64(b"same-photo"), reference_image_path=ref_path
+            )
+            assert encode.call_count == 2
+
+        stats = face_service.match_cache_stats()
+        assert (stats["hits"], stats["invalidations"]) == (2, 1)
+    finally:
+        face_service.configure_match_cache(max_entries=1024, ttl_seconds=120)
+
+
+class GalleryFR(FakeFR):
+    """Encodes every photo as a fixed probe; compare_faces is the real distance check."""
+
+    def __init__(self, probe: np.ndarray):
+        super().__init__()
+        self.probe = probe
+        self.compared_rows: list[int] = []
+
+    def face_encodings(self, *_args, **_kwargs):
+        return [self.probe]
+
+    def compare_faces(self, known, candidate, tolerance=0.6):
+        known = np.asarray(known)
+        self.compared_rows.append(len(known))
+        return list(np.linalg.norm(known - candidate, axis=1) <= tolerance)
+
+
+def _unit(axis: int, scale: float = 1.0) -> np.ndarray:
+    vec = np.zeros(128)
+    vec[axis] = scale
+    return vec
+
+
+def test_templates_round_trip_and_legacy_sidecar_is_readable(tmp_path: Path) -> None:
+    ref_path = tmp_path / "reference_image.jpg"
+    ref_path.write_bytes(b"dummy")
+    templates = np.stack([_unit(0), _unit(1)])
+
+    face_service.write_reference_templates(reference_image_path=ref_path, encodings=templates)
+    assert np.array_equal(face_service.load_reference_templates(ref_path), templates)
+
+    # v1 sidecars hold a single "encoding" vector
+    st = ref_path.stat()
+    meta = {
+        "version": 1,
+        "model": face_service.ENCODING_MODEL,
+        "reference_mtime_ns": st.st_mtime_ns,
+        "reference_size": st.st_size,
+    }
+    with reference_encoding_path(ref_path).open("wb") as f:
+        np.savez(f, encoding=_unit(2), meta=np.array(json.dumps(meta)))
+    loaded = face_service.load_reference_templates(ref_path)
+    assert loaded.shape == (1, 128) and loaded[0, 2] == 1.0
+
+
+@patch("app.services.face_service.Image.open")
+@patch("app.services.face_service._fr")
+def test_verify_matches_any_template_in_one_compare(
+    mock_fr, mock_image_open, tmp_path: Path
+) -> None:
+    ref_path = tmp_path / "reference_image.jpg"
+    ref_path.write_bytes(b"dummy")
+    face_service.write_reference_templates(
+        reference_image_path=ref_path, encodings=np.stack([_unit(0), _unit(1)])
+    )
+    mock_image_open.return_value = _FakePILImage()
+    fake_fr = GalleryFR(probe=_unit(1, 0.9))  # close to the second template only
+    mock_fr.return_value = fake_fr
+
+    result = verify_face_match(
+        submitted_photo_b64=_b64(b"dim-lighting"), reference_image_path=ref_path
+    )
+
+    assert result.status == "success"
+    assert fake_fr.compared_rows == [3]  # both templates and their centroid, one call
+
+
+@patch("app.services.face_service.Image.open")
+@patch("app.services.face_service._fr")
+def test_add_reference_template_caps_gallery_and_keeps_enrollment(
+    mock_fr, mock_image_open, tmp_path: Path
+) -> None:
+    ref_path = tmp_path / "reference_image.jpg"
+    ref_path.write_bytes(b"dummy")
+    write_reference_encoding(reference_image_path=ref_path, encoding=_unit(0))
+    mock_image_open.return_value = _FakePILImage()
+    face_service.configure_reference_templates(max_templates=3, centroid=True)
+    try:
+        for i in range(1, 4):
+            mock_fr.return_value = GalleryFR(probe=_unit(0, 1.0) + _unit(5, 0.1 * i))
+            result = face_service.add_reference_template(
+                photo_b64=_b64(b"capture"), reference_image_path=ref_path
+            )
+            assert result.status == "success"
+
+        templates = face_service.load_reference_templates(ref_path)
+        assert result.templates == len(templates) == 3
+        assert np.array_equal(templates[0], _unit(0))  # enrollment template is kept
+        assert np.allclose(templates[1:, 5], [0.2, 0.3])  # the oldest addition was dropped
+
+        mock_fr.return_value = GalleryFR(probe=_unit(7))
+        rejected = face_service.add_reference_template(
+            photo_b64=_b64(b"someone-else"), reference_image_path=ref_path
+        )
+        assert rejected.error == "Face does not match reference"
+        assert len(face_service.load_reference_templates(ref_path)) == 3
+    finally:
+        face_service.configure_reference_templates(max_templates=5, centroid=True)
+
+
+def test_int8_sidecar_round_trip(tmp_path: Path) -> None:
+    ref_path = tmp_path / "reference_image.jpg"
+    ref_path.write_bytes(b"dummy")
+    templates = np.random.default_rng(0).normal(0.0, 0.09, size=(3, 128))
+
+    face_service.configure_encoding_storage("int8")
+    try:
+        face_service.write_reference_templates(reference_image_path=ref_path, encodings=templates)
+        with np.load(reference_encoding_path(ref_path)) as data:
+            assert data["encodings"].dtype == np.int8
+        loaded = face_service.load_reference_templates(ref_path)
+    finally:
+        face_service.configure_encoding_storage("float64")
+
+    assert loaded.dtype == np.float64
+    assert np.abs(loaded - templates).max() < np.abs(templates).max() / 127
+
+
+def test_unknown_encoding_dtype_is_rejected() -> None:
+    with pytest.raises(ValueError, match="Unknown encoding dtype"):
+        face_service.configure_encoding_storage("bfloat16")
+
+
+def test_template_blobs_round_trip_as_float32() -> None:
+    templates = np.stack([_unit(0, 0.1234567), _unit(5, -0.25)])
+
+    blobs = face_service.template_blobs(templates)
+
+    assert [len(b) for b in blobs] == [512, 512]
+    restored = face_service.templates_from_blobs(blobs)
+    assert restored.dtype == np.float64 and np.allclose(restored, templates, atol=1e-7)
+    assert face_service.templates_from_blobs([]) is None
+    assert face_service.templates_from_blobs([b"\x00" * 12]) is None
+
+
+@patch("app.services.face_service.Image.open")
+@patch("app.services.face_service._fr")
+def test_verify_with_preloaded_templates_skips_reference_files(
+    mock_fr, mock_image_open, tmp_path: Path
+) -> None:
+    mock_image_open.return_value = _FakePILImage()
+    fake_fr = GalleryFR(probe=_unit(1, 0.9))
+    mock_fr.return_value = fake_fr
+
+    result = verify_face_match(
+        submitted_photo_b64=_b64(b"from-db"),
+        reference_image_path=tmp_path / "missing.jpg",  # never touched
+        templates=np.stack([_unit(0), _unit(1)]),
+    )
+
+    assert result.status == "success"
+    assert fake_fr.compared_rows == [3]
+
+
+class _StubPool:
+    """Reports four workers but admits two jobs; jobs run when their result is collected."""
+
+    workers = 4
+
+    def __init__(self):
+        self.outstanding = 0
+        self.busy = 0
+
+    def submit(self, fn, *args):
+        if self.outstanding >= 2:
+            self.busy += 1
+            raise face_service.FacePoolBusy("busy", retry_after=1)
+        self.outstanding += 1
+        return (fn, args)
+
+    def result(self, fut):
+        self.outstanding -= 1
+        fn, args = fut
+        return fn(*args)
+
+
+def _pattern_jpeg(seed: int) -> bytes:
+    pixels = np.random.default_rng(seed).integers(0, 255, size=(120, 160, 3), dtype=np.uint8)
+    buf = BytesIO()
+    Image.fromarray(pixels).save(buf, format="JPEG")
+    return buf.getvalue()
+
+
+def test_verify_face_matches_fans_out_and_keeps_order(tmp_path: Path) -> None:
+    pool = _StubPool()
+    photos = [_pattern_jpeg(seed) for seed in (1, 2, 1, 1)]
+    try:
+        face_service.configure_face_backend("fake")
+        enrolled = face_service.encode_photo(photos[0]).encoding
+        requests = [
+            face_service.FaceMatchRequest(
+                submitted_photo_b64=_b64(photo),
+                reference_image_path=tmp_path / "missing.jpg",
+                templates=enrolled[None, :],
+            )
+            for photo in photos
+        ]
+        requests.append(
+            face_service.FaceMatchRequest(
+                submitted_photo_b64="!!!notbase64!!!", reference_image_path=tmp_path / "x.jpg"
+            )
+        )
+        with patch("app.services.face_service.get_face_pool", return_value=pool):
+            results = face_service.verify_face_matches(requests)
+    finally:
+        face_service.configure_face_backend("dlib")
+
+    assert [r.status for r in results] == ["success", "error", "success", "success", "error"]
+    assert results[4].error == "Reference image not found"
+    assert pool.busy > 0  # the oldest job was collected to make room
+    assert pool.outstanding == 0
+
+
+def test_reference_without_sidecar_is_encoded_in_the_face_pool(tmp_path: Path) -> None:
+    from concurrent.futures import ThreadPoolExecutor
+
+    from app.services.face_pool import FacePool
+
+    ref_path = tmp_path / "reference_image.jpg"
+    ref_path.write_bytes(_pattern_jpeg(3))
+    pool = FacePool(
+        workers=1, max_queue=0, timeout_seconds=5.0, executor_factory=ThreadPoolExecutor
+    )
+    try:
+        face_service.configure_face_backend("fake")
+        with patch("app.services.face_service.get_face_pool", return_value=pool):
+            templates, error = face_service.resolve_reference_templates(ref_path)
+            again, _error = face_service.resolve_reference_templates(ref_path)
+    finally:
+        face_service.configure_face_backend("dlib")
+        pool.shutdown()
+
+    assert error is None and templates.shape == (1, face_service.ENCODING_DIM)
+    assert np.allclose(again, templates)
+    assert pool.stats()["submitted"] == 1  # the second lookup came from the sidecar
+
+
+@patch("app.services.face_service.Image.open")
+@patch("app.services.face_service._fr")
+def test_add_reference_template_cannot_drift_to_another_face(
+    mock_fr, mock_image_open, tmp_path: Path
+) -> None:
+    ref_path = tmp_path / "reference_image.jpg"
+    ref_path.write_bytes(b"dummy")
+    write_reference_encoding(reference_image_path=ref_path, encoding=_unit(0))
+    mock_image_open.return_value = _FakePILImage()
+    other = _unit(1)  # someone else, 1.41 away from the enrollment template
+    face_service.configure_reference_templates(max_templates=20, centroid=True)
+    try:
+        statuses = []
+        for step in range(1, 9):
+            # Each capture is 1/8 of the way closer to the other face: always within
+            # tolerance of the previous one
+            mock_fr.return_value = GalleryFR(probe=_unit(0) + (other - _unit(0)) * step / 8)
+            statuses.append(
+                face_service.add_reference_template(
+                    photo_b64=_b64(b"capture"), reference_image_path=ref_path
+                ).status
+            )
+        templates = face_service.load_reference_templates(ref_path)
+    finally:
+        face_service.configure_reference_templates(max_templates=5, centroid=True)
+
+    assert statuses[:3] == ["success"] * 3
+    assert "error" in statuses
+    assert np.linalg.norm(templates - _unit(0), axis=1).max() <= 0.6
+    assert np.linalg.norm(templates - other, axis=1).min() > 0.6
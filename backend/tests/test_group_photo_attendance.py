@@ -0,0 +1,148 @@
+from __future__ import annotations
+
+import base64
+from datetime import datetime
+from io import BytesIO
+from pathlib import Path
+from unittest.mock import patch
+
+import numpy as np
+from PIL import Image
+
+from app.services import face_service
+from app.services.face_service import (
+    PhotoFaces,
+    assign_faces,
+    pairwise_face_distances,
+    reference_image_path,
+    write_reference_encoding,
+)
+
+
+def _img_b64() -> str:
+    buf = BytesIO()
+    Image.new("RGB", (1, 1)).save(buf, format="JPEG")
+    return base64.b64encode(buf.getvalue()).decode("utf-8")
+
+
+def _enroll_reference(user_data_dir: Path, euid: str, encoding: np.ndarray) -> None:
+    ref_path = reference_image_path(user_data_dir, euid)
+    ref_path.parent.mkdir(parents=True, exist_ok=True)
+    ref_path.write_bytes(b"dummy")
+    write_reference_encoding(reference_image_path=ref_path, encoding=encoding)
+
+
+def _login(client, euid: str) -> str:
+    resp = client.post("/auth/login", json={"euid": euid, "password": "password123"})
+    assert resp.status_code == 200, resp.json
+    return resp.json["access_token"]
+
+
+def _create_class_meeting_now(client, token: str, code: str) -> None:
+    now = datetime.now()
+    today = now.strftime("%Y-%m-%d")
+    resp = client.post(
+        "/classes",
+        headers={"Authorization": f"Bearer {token}"},
+        json={
+            "code": code,
+            "euid": "pro1234",
+            "location": [33.214, -97.133],
+            "start_date": today,
+            "end_date": today,
+            "times": {now.strftime("%A"): now.strftime("%H:%M:%S")},
+        },
+    )
+    assert resp.status_code == 201, resp.json
+
+
+def test_pairwise_face_distances_match_norm() -> None:
+    rng = np.random.default_rng(0)
+    probes = rng.normal(size=(3, 128))
+    gallery = rng.normal(size=(5, 128))
+
+    expected = np.linalg.norm(probes[:, None, :] - gallery[None, :, :], axis=2)
+    assert np.allclose(pairwise_face_distances(probes, gallery), expected)
+
+
+def test_assign_faces_is_one_to_one() -> None:
+    # Both faces are closest to student 0; face 1 is closer, so face 0 falls back to student 1.
+    distances = np.array(
+        [
+            [0.30, 0.50, 0.90],
+            [0.10, 0.90, 0.90],
+            [0.90, 0.90, 0.95],
+        ]
+    )
+
+    matches = assign_faces(distances, tolerance=0.6)
+
+    assert [(m.face_index, m.gallery_index) for m in matches] == [(1, 0), (0, 1)]
+
+
+def _enroll_roster(app, code: str, encodings: dict[str, np.ndarray]) -> None:
+    cfg = app.config["APP_CONFIG"]
+    with app.app_context():
+        from app.db import repository
+        from app.db.connection import get_db
+
+        db = get_db()
+        for euid, encoding in encodings.items():
+            _enroll_reference(cfg.user_data_dir, euid, encoding)
+            repository.enroll_student(db, code=code, student_euid=euid)
+        db.commit()
+
+
+def test_group_photo_marks_every_recognized_student(client, app) -> None:
+    token = _login(client, "pro1234")
+    _create_class_meeting_now(client, token, "csce_4900_520")
+    _enroll_roster(app, "csce_4900_520", {"stu1234": np.zeros(128), "stu9999": np.ones(128)})
+
+    # Three faces: both students plus a visitor who matches nobody.
+    faces = PhotoFaces(encodings=np.stack([np.ones(128), np.zeros(128), np.full(128, 0.5)]))
+    with patch.object(face_service, "encode_photo_faces", return_value=faces) as encode:
+        resp = client.post(
+            "/classes/csce_4900_520/attendance/group-photo",
+            headers={"Authorization": f"Bearer {token}"},
+            json={"photo": _img_b64()},
+        )
+
+    assert resp.status_code == 200, resp.json
+    assert sorted(resp.json["present"]) == ["stu1234", "stu9999"]
+    assert resp.json["faces_detected"] == 3
+    assert resp.json["unmatched_faces"] == 1
+    assert encode.call_count == 1
+
+    attendance = client.get("/classes/csce_4900_520/attendance")
+    students = attendance.json["attendance"][0]["students"]
+    assert sorted(students.split(", ")) == ["stu1234", "stu9999"]
+
+
+def test_group_photo_without_faces_is_rejected(client, app) -> None:
+    token = _login(client, "pro1234")
+    _create_class_meeting_now(client, token, "csce_4900_521")
+    _enroll_roster(app, "csce_4900_521", {"stu1234": np.zeros(128)})
+
+    faces = PhotoFaces(encodings=np.empty((0, 128)), error="No faces detected")
+    with patch.object(face_service, "encode_photo_faces", return_value=faces):
+        resp = client.post(
+            "/classes/csce_4900_521/attendance/group-photo",
+            headers={"Authorization": f"Bearer {token}"},
+            json={"photo": _img_b64()},
+        )
+
+    assert resp.status_code == 400
+    assert resp.json["error"] == "No faces detected"
+
+
+def test_group_photo_requires_class_owner(client) -> None:
+    owner = _login(client, "pro1234")
+    _create_class_meeting_now(client, owner, "csce_4900_522")
+
+    other = _login(client, "pro9999")
+    resp = client.post(
+        "/classes/csce_4900_522/attendance/group-photo",
+        headers={"Authorization": f"Bearer {other}"},
+        json={"photo": _img_b64()},
+    )
+    assert resp.status_code == 403
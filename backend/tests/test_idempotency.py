@@ -0,0 +1,206 @@
+from __future__ import annotations
+
+import sqlite3
+import threading
+from pathlib import Path
+from unittest.mock import patch
+
+import pytest
+
+from app.services.attendance_service import AttendanceResult
+from app.services.idempotency import (
+    IdempotencyKeyReused,
+    IdempotencyStore,
+    request_fingerprint,
+)
+
+
+def _connect(db_path: Path) -> sqlite3.Connection:
+    conn = sqlite3.connect(db_path)
+    conn.row_factory = sqlite3.Row
+    return conn
+
+
+@pytest.fixture()
+def db_path(tmp_path: Path) -> Path:
+    path = tmp_path / "test.db"
+    schema_path = Path(__file__).resolve().parents[1] / "app" / "db" / "schema.sql"
+    with _connect(path) as conn:
+        conn.executescript(schema_path.read_text(encoding="utf-8"))
+    return path
+
+
+def _store(**kwargs) -> IdempotencyStore:
+    return IdempotencyStore(**{"ttl_seconds": 60, "max_entries": 16, "wait_seconds": 5.0, **kwargs})
+
+
+def test_concurrent_duplicates_wait_for_the_first_request(db_path: Path) -> None:
+    store = _store()
+    started = threading.Event()
+    release = threading.Event()
+    calls = []
+
+    def handler():
+        calls.append(1)
+        started.set()
+        release.wait(5)
+        return {"status": "success"}, 200
+
+    results = {}
+
+    def send(name: str) -> None:
+        conn = _connect(db_path)
+        try:
+            results[name] = store.execute(
+                conn, scope="attendance", key="k1", euid="stu1234", fingerprint="f", handler=handler
+            )
+        finally:
+            conn.close()
+
+    first = threading.Thread(target=send, args=("first",))
+    first.start()
+    assert started.wait(5)
+    second = threading.Thread(target=send, args=("second",))
+    second.start()
+    second.join(0.2)
+    assert second.is_alive()  # waiting on the first request, not running in parallel
+    release.set()
+    first.join(5)
+    second.join(5)
+
+    assert len(calls) == 1
+    assert results["first"] == ({"status": "success"}, 200, False)
+    assert results["second"] == ({"status": "success"}, 200, True)
+    assert store.stats()["waits"] == 1
+
+
+def test_stored_response_survives_a_restart_and_is_bound_to_the_request(db_path: Path) -> None:
+    conn = _connect(db_path)
+    _store().execute(
+        conn,
+        scope="attendance",
+        key="k1",
+        euid="stu1234",
+        fingerprint="f",
+        handler=lambda: ({"status": "error", "error": "Too far from class"}, 400),
+    )
+
+    restarted = _store()  # empty in-memory front: read back from tbl_idempotency_keys
+    replay = restarted.execute(
+        conn, scope="attendance", key="k1", euid="stu1234", fingerprint="f", handler=None
+    )
+    assert replay == ({"status": "error", "error": "Too far from class"}, 400, True)
+
+    with pytest.raises(IdempotencyKeyReused):
+        restarted.execute(
+            conn, scope="attendance", key="k1", euid="stu1234", fingerprint="g", handler=None
+        )
+    with pytest.raises(IdempotencyKeyReused):
+        restarted.execute(
+            conn, scope="attendance", key="k1", euid="stu9999", fingerprint="f", handler=None
+        )
+    # Keys are per endpoint
+    other = restarted.execute(
+        conn,
+        scope="face_login",
+        key="k1",
+        euid="stu1234",
+        fingerprint="f",
+        handler=lambda: ({"status": "success"}, 200),
+    )
+    assert other[2] is False
+    conn.close()
+
+
+def test_transient_failures_and_expired_keys_run_again(db_path: Path) -> None:
+    clock = [1000.0]
+    store = _store(ttl_seconds=60, clock=lambda: clock[0])
+    conn = _connect(db_path)
+    responses = iter([({"status": "error"}, 503), ({"status": "success"}, 200), ({}, 200)])
+    calls = []
+
+    def handler():
+        calls.append(1)
+        return next(responses)
+
+    def send():
+        return store.execute(
+            conn, scope="attendance", key="k1", euid="stu1234", fingerprint="f", handler=handler
+        )
+
+    assert send()[1:] == (503, False)  # not stored
+    assert send()[1:] == (200, False)
+    assert send()[1:] == (200, True)
+    clock[0] += 61
+    assert send() == ({}, 200, False)
+    assert len(calls) == 3
+    conn.close()
+
+
+def _login(client, euid: str) -> str:
+    resp = client.post("/auth/login", json={"euid": euid, "password": "password123"})
+    assert resp.status_code == 200, resp.json
+    return resp.json["access_token"]
+
+
+def test_attendance_retry_with_idempotency_key_is_replayed(client) -> None:
+    token = _login(client, "stu1234")
+    payload = {
+        "code": "csce_4900_500",
+        "euid": "stu1234",
+        "location": [33.214, -97.133],
+        "photo": "aGVsbG8=",
+    }
+
+    def post(body: dict, key: str):
+        return client.post(
+            "/attendance",
+            headers={"Authorization": f"Bearer {token}", "Idempotency-Key": key},
+            json=body,
+        )
+
+    with patch("app.routes.add_attendance") as mock_add:
+        mock_add.return_value = AttendanceResult(status="success")
+        first = post(payload, "retry-1")
+        second = post(payload, "retry-1")
+        reused = post({**payload, "location": [33.0, -97.0]}, "retry-1")
+        invalid = post(payload, "has spaces")
+
+    assert first.status_code == second.status_code == 200
+    assert mock_add.call_count == 1
+    assert "Idempotent-Replayed" not in first.headers
+    assert second.headers["Idempotent-Replayed"] == "true"
+    assert second.json["request_id"] == second.headers["X-Request-ID"]
+    assert reused.status_code == 422
+    assert invalid.status_code == 400
+
+
+def test_request_fingerprint_is_stable() -> None:
+    assert request_fingerprint(b"body") == request_fingerprint(b"body")
+    assert request_fingerprint(b"body") != request_fingerprint(b"other")
+
+
+def test_face_login_replays_only_successes_and_never_stores_tokens(client, app) -> None:
+    cfg = app.config["APP_CONFIG"]
+    payload = {"euid": "stu1234", "photo": "aGVsbG8="}
+    tokens = {"access_token": "a", "refresh_token": "r", "token_type": "Bearer"}
+
+    def post(key: str):
+        return client.post("/auth/face-login", headers={"Idempotency-Key": key}, json=payload)
+
+    with patch("app.routes.face_login_student") as mock_login:
+        mock_login.return_value = None  # e.g. rate limited: may pass on the next try
+        failed = post("login-1")
+        mock_login.return_value = tokens
+        retried = post("login-1")
+        replayed = post("login-1")
+
+    assert (failed.status_code, retried.status_code, replayed.status_code) == (401, 200, 200)
+    assert mock_login.call_count == 2
+    assert replayed.headers["Idempotent-Replayed"] == "true"
+    assert replayed.json["access_token"] == "a"
+    with sqlite3.connect(cfg.database_path) as conn:
+        rows = conn.execute(
+            "SELECT COUNT(*) FROM tbl_idempotency_keys WHERE fld_ik_scope = 'face_login'"
+        ).fetchone()[0]
+    assert rows == 0
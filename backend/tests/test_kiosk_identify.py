@@ -0,0 +1,270 @@
+from __future__ import annotations
+
+import base64
+from datetime import datetime
+from io import BytesIO
+from pathlib import Path
+from unittest.mock import patch
+
+import numpy as np
+from PIL import Image
+
+from app.services import face_service, roster_service
+from app.services.face_service import (
+    PhotoEncoding,
+    reference_image_path,
+    write_reference_encoding,
+)
+from app.services.roster_service import get_roster_matrix, invalidate_roster_matrix, roster_dir
+
+
+def _img_b64() -> str:
+    buf = BytesIO()
+    Image.new("RGB", (1, 1)).save(buf, format="JPEG")
+    return base64.b64encode(buf.getvalue()).decode("utf-8")
+
+
+def _enroll_reference(user_data_dir: Path, euid: str, encoding: np.ndarray) -> None:
+    ref_path = reference_image_path(user_data_dir, euid)
+    ref_path.parent.mkdir(parents=True, exist_ok=True)
+    ref_path.write_bytes(b"dummy")
+    write_reference_encoding(reference_image_path=ref_path, encoding=encoding)
+
+
+def _login(client, euid: str) -> str:
+    resp = client.post("/auth/login", json={"euid": euid, "password": "password123"})
+    assert resp.status_code == 200, resp.json
+    return resp.json["access_token"]
+
+
+def _create_class_meeting_now(client, token: str, code: str) -> None:
+    now = datetime.now()
+    today = now.strftime("%Y-%m-%d")
+    resp = client.post(
+        "/classes",
+        headers={"Authorization": f"Bearer {token}"},
+        json={
+            "code": code,
+            "euid": "pro1234",
+            "location": [33.214, -97.133],
+            "start_date": today,
+            "end_date": today,
+            "times": {now.strftime("%A"): now.strftime("%H:%M:%S")},
+        },
+    )
+    assert resp.status_code == 201, resp.json
+
+
+def test_roster_matrix_is_reused_until_a_reference_changes(tmp_path: Path) -> None:
+    _enroll_reference(tmp_path, "stu1234", np.zeros(128))
+    _enroll_reference(tmp_path, "stu9999", np.ones(128))
+
+    roster = ["stu1234", "stu9999"]
+
+    first = get_roster_matrix(code="csce_4900_501", euids=roster, user_data_dir=tmp_path)
+    with patch(
+        "app.services.roster_service.reference_version", wraps=roster_service.reference_version
+    ) as version:
+        again = get_roster_matrix(code="csce_4900_501", euids=roster, user_data_dir=tmp_path)
+    assert again is first
+    assert version.call_count == 0  # no per-student stats on a lookup
+    assert first.encodings.shape == (2, 128)
+
+    # Re-enrollment rewrites the reference image (new version) and its sidecar, then
+    # refreshes the student's rosters.
+    reenrolled = reference_image_path(tmp_path, "stu9999")
+    reenrolled.write_bytes(b"re-enrolled")
+    write_reference_encoding(reference_image_path=reenrolled, encoding=np.full(128, 0.5))
+
+    rebuilt = get_roster_matrix(
+        code="csce_4900_501", euids=roster, user_data_dir=tmp_path, refresh=True
+    )
+    assert rebuilt is not first
+    assert np.allclose(rebuilt.encodings[1], 0.5)
+    # Other workers pick up the new generation from index.json
+    assert get_roster_matrix(code="csce_4900_501", euids=roster, user_data_dir=tmp_path) is rebuilt
+
+
+def test_roster_matrix_reports_students_without_reference(tmp_path: Path) -> None:
+    _enroll_reference(tmp_path, "stu1234", np.zeros(128))
+
+    roster = get_roster_matrix(
+        code="csce_4900_502", euids=["abc0001", "stu1234"], user_data_dir=tmp_path
+    )
+
+    assert roster.euids == ("stu1234",)
+    assert roster.missing == ("abc0001",)
+
+
+def test_roster_matrix_is_a_shared_memory_mapped_file(tmp_path: Path) -> None:
+    _enroll_reference(tmp_path, "stu9999", np.ones(128))
+    _enroll_reference(tmp_path, "stu1234", np.zeros(128))
+
+    matrix = get_roster_matrix(
+        code="csce_4900_503", euids=["stu9999", "stu1234"], user_data_dir=tmp_path
+    )
+
+    assert isinstance(matrix.encodings, np.memmap)
+    assert matrix.euids == ("stu1234", "stu9999")  # sorted, so row() is a binary search
+    assert matrix.row("stu9999") == 1 and matrix.row("abc0001") is None
+    assert (roster_dir(tmp_path, "csce_4900_503") / "index.json").exists()
+
+    # Another worker maps the same file instead of rebuilding it.
+    invalidate_roster_matrix("csce_4900_503")
+    with patch(
+        "app.services.roster_service.resolve_reference_encoding",
+        wraps=roster_service.resolve_reference_encoding,
+    ) as resolve:
+        again = get_roster_matrix(
+            code="csce_4900_503", euids=["stu1234", "stu9999"], user_data_dir=tmp_path
+        )
+    assert resolve.call_count == 0
+    assert again.encodings.filename == matrix.encodings.filename
+
+
+def test_roster_matrix_rebuild_is_incremental(tmp_path: Path) -> None:
+    for i, euid in enumerate(["stu1234", "stu5678", "stu9999"]):
+        _enroll_reference(tmp_path, euid, np.full(128, float(i)))
+    code = "csce_4900_504"
+    directory = roster_dir(tmp_path, code)
+    get_roster_matrix(code=code, euids=["stu1234", "stu5678"], user_data_dir=tmp_path)
+    first_generation = sorted(p.name for p in directory.glob("encodings-*.npy"))
+
+    with patch(
+        "app.services.roster_service.resolve_reference_encoding",
+        wraps=roster_service.resolve_reference_encoding,
+    ) as resolve:
+        grown = get_roster_matrix(
+            code=code, euids=["stu1234", "stu5678", "stu9999"], user_data_dir=tmp_path
+        )
+
+    assert [c.args[0].parent.name for c in resolve.call_args_list] == ["stu9999"]
+    assert np.allclose(grown.encodings[grown.row("stu9999")], 2.0)
+    assert np.allclose(grown.encodings[grown.row("stu5678")], 1.0)
+    # The replaced generation stays for readers that read the old index.json; the one
+    # before it is removed by the next rebuild.
+    current = sorted(p.name for p in directory.glob("encodings-*.npy"))
+    assert len(current) == 2 and set(first_generation) < set(current)
+    get_roster_matrix(code=code, euids=["stu1234"], user_data_dir=tmp_path)
+    assert not set(first_generation) & {p.name for p in directory.glob("encodings-*.npy")}
+
+
+def test_roster_rebuild_encodes_before_taking_the_lock(tmp_path: Path) -> None:
+    _enroll_reference(tmp_path, "stu1234", np.zeros(128))
+    lock = roster_dir(tmp_path, "csce_4900_505") / ".lock"
+    resolve = roster_service.resolve_reference_encoding
+    locked_during_encode = []
+
+    def encode(*args, **kwargs):
+        locked_during_encode.append(lock.exists())
+        return resolve(*args, **kwargs)
+
+    with patch("app.services.roster_service.resolve_reference_encoding", side_effect=encode):
+        roster = get_roster_matrix(code="csce_4900_505", euids=["stu1234"], user_data_dir=tmp_path)
+
+    assert roster.euids == ("stu1234",)
+    assert locked_during_encode == [False]
+
+
+def test_file_lock_only_releases_its_own_lock(tmp_path: Path) -> None:
+    import os
+
+    from app.services.file_lock import file_lock
+
+    lock = tmp_path / ".lock"
+    slow = file_lock(lock, timeout=0.05)
+    slow.__enter__()
+    os.utime(lock, (0, 0))  # held past the timeout: another worker treats it as stale
+    with file_lock(lock, timeout=0.05):
+        slow.__exit__(None, None, None)
+        assert lock.exists()  # the late holder left the new holder's lock alone
+    assert not lock.exists()
+
+
+def test_int8_roster_matrix_identifies_nearest_student(tmp_path: Path) -> None:
+    _enroll_reference(tmp_path, "stu1234", np.full(128, -0.05))
+    _enroll_reference(tmp_path, "stu9999", np.full(128, 0.05))
+
+    face_service.configure_encoding_storage("int8")
+    try:
+        roster = get_roster_matrix(
+            code="csce_4900_502", euids=["stu1234", "stu9999"], user_data_dir=tmp_path
+        )
+    finally:
+        face_service.configure_encoding_storage("float64")
+
+    assert roster.encodings.dtype == "int8"
+    distances = face_service.face_distances(roster.encodings, np.full(128, 0.04))
+    assert int(np.argmin(distances)) == 1
+    assert np.isclose(distances[1], np.sqrt(128) * 0.01, atol=1e-3)
+
+
+def test_kiosk_identifies_student_and_records_attendance(client, app) -> None:
+    token = _login(client, "pro1234")
+    _create_class_meeting_now(client, token, "csce_4900_510")
+
+    cfg = app.config["APP_CONFIG"]
+    _enroll_reference(cfg.user_data_dir, "stu1234", np.zeros(128))
+    _enroll_reference(cfg.user_data_dir, "stu9999", np.ones(128))
+    with app.app_context():
+        from app.db import repository
+        from app.db.connection import get_db
+
+        db = get_db()
+        repository.enroll_student(db, code="csce_4900_510", student_euid="stu1234")
+        repository.enroll_student(db, code="csce_4900_510", student_euid="stu9999")
+        db.commit()
+
+    probe = PhotoEncoding(encoding=np.full(128, 0.98))
+    with patch.object(face_service, "encode_photo", return_value=probe) as encode:
+        resp = client.post(
+            "/classes/csce_4900_510/kiosk/identify",
+            headers={"Authorization": f"Bearer {token}"},
+            json={"photo": _img_b64()},
+        )
+
+    assert resp.status_code == 200, resp.json
+    assert resp.json["euid"] == "stu9999"
+    assert encode.call_count == 1
+
+    attendance = client.get("/classes/csce_4900_510/attendance")
+    assert attendance.json["attendance"][0]["students"] == "stu9999"
+
+
+def test_kiosk_rejects_unknown_face(client, app) -> None:
+    token = _login(client, "pro1234")
+    _create_class_meeting_now(client, token, "csce_4900_511")
+
+    cfg = app.config["APP_CONFIG"]
+    _enroll_reference(cfg.user_data_dir, "stu1234", np.zeros(128))
+    with app.app_context():
+        from app.db import repository
+        from app.db.connection import get_db
+
+        db = get_db()
+        repository.enroll_student(db, code="csce_4900_511", student_euid="stu1234")
+        db.commit()
+
+    probe = PhotoEncoding(encoding=np.ones(128))
+    with patch.object(face_service, "encode_photo", return_value=probe):
+        resp = client.post(
+            "/classes/csce_4900_511/kiosk/identify",
+            headers={"Authorization": f"Bearer {token}"},
+            json={"photo": _img_b64()},
+        )
+
+    assert resp.status_code == 400
+    assert resp.json["error"] == "No matching student"
+
+
+def test_kiosk_requires_class_owner(client) -> None:
+    owner = _login(client, "pro1234")
+    _create_class_meeting_now(client, owner, "csce_4900_512")
+
+    other = _login(client, "pro9999")
+    resp = client.post(
+        "/classes/csce_4900_512/kiosk/identify",
+        headers={"Authorization": f"Bearer {other}"},
+        json={"photo": _img_b64()},
+    )
+    assert resp.status_code == 403
@@ -0,0 +1,56 @@
+from __future__ import annotations
+
+from app.services.result_cache import ResultCache
+
+
+class _Clock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self) -> float:
+        return self.now
+
+
+def test_hit_until_ttl_expires() -> None:
+    clock = _Clock()
+    cache = ResultCache(max_entries=4, ttl_seconds=30, clock=clock)
+    cache.put("k", 1, "result")
+
+    clock.now += 29
+    assert cache.get("k", 1) == "result"
+    clock.now += 2
+    assert cache.get("k", 1) is None
+
+    stats = cache.stats()
+    assert (stats["hits"], stats["misses"], stats["expirations"]) == (1, 1, 1)
+    assert stats["entries"] == 0
+
+
+def test_version_change_invalidates_entry() -> None:
+    cache = ResultCache(max_entries=4, ttl_seconds=30)
+    cache.put("k", (100, 10), "result")
+
+    assert cache.get("k", (200, 10)) is None
+    assert cache.stats()["invalidations"] == 1
+    assert cache.get("k", (100, 10)) is None
+
+
+def test_evicts_least_recently_used() -> None:
+    cache = ResultCache(max_entries=2, ttl_seconds=30)
+    cache.put("a", 1, "A")
+    cache.put("b", 1, "B")
+    cache.get("a", 1)  # "b" is now the LRU entry
+    cache.put("c", 1, "C")
+
+    assert cache.get("b", 1) is None
+    assert cache.get("a", 1) == "A"
+    assert cache.get("c", 1) == "C"
+    assert cache.stats()["evictions"] == 1
+
+
+def test_zero_ttl_disables_cache() -> None:
+    cache = ResultCache(max_entries=4, ttl_seconds=0)
+    cache.put("k", 1, "result")
+
+    assert cache.get("k", 1) is None
+    assert cache.stats()["entries"] == 0
@@ -29,4 +29,13 @@ def test_post_attendance_validation_error_when_authenticated(app, client):
         json={},
     )
     assert resp.status_code == 400
-    assert resp.json["status"] == "error"
\ No newline at end of file
+    assert resp.json["status"] == "error"
+
+
+def test_face_login_null_face_box_item_is_a_validation_error(client):
+    resp = client.post(
+        "/auth/face-login",
+        json={"euid": "stu1234", "photo": "aGVsbG8=", "face_box": [None, 1, 2, 3]},
+    )
+    assert resp.status_code == 400
+    assert resp.json["error"] == "Validation error"
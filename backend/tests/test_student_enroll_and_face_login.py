@@ -66,6 +66,8 @@ def test_student_enroll_writes_reference_image_and_returns_tokens(client, app):
     cfg = app.config["APP_CONFIG"]
     ref_path = Path(cfg.user_data_dir) / "Student" / "stu9999" / "reference_image.jpg"
     assert ref_path.exists()
+    # the class's roster matrix file was brought up to date
+    assert (Path(cfg.user_data_dir) / "Roster" / "csce_4900_500" / "index.json").exists()
 
 
 @patch("app.services.auth_service.verify_face_match")
@@ -90,4 +92,77 @@ def test_enroll_rejects_bad_join_code(client):
             "photo": _img_b64(),
         },
     )
-    assert resp.status_code in (400, 401)
\ No newline at end of file
+    assert resp.status_code in (400, 401)
+
+
+@patch("app.services.auth_service.add_reference_template")
+def test_student_adds_face_template(mock_add, client, app):
+    from app.services.face_service import FaceTemplateResult
+
+    mock_add.return_value = FaceTemplateResult(status="success", templates=2)
+    tokens = _login(client, "stu1234", "password123")
+
+    resp = client.post(
+        "/students/me/face-templates",
+        headers={"Authorization": f"Bearer {tokens['access_token']}"},
+        json={"photo": _img_b64()},
+    )
+    assert resp.status_code == 201, resp.json
+    assert resp.json["templates"] == 2
+
+    cfg = app.config["APP_CONFIG"]
+    kwargs = mock_add.call_args.kwargs
+    assert kwargs["reference_image_path"] == (
+        Path(cfg.user_data_dir) / "Student" / "stu1234" / "reference_image.jpg"
+    )
+    assert kwargs["tolerance"] == cfg.face_tolerance
+
+
+@patch("app.services.auth_service.add_reference_template")
+def test_face_template_rejected_when_face_does_not_match(mock_add, client):
+    from app.services.face_service import FaceTemplateResult
+
+    mock_add.return_value = FaceTemplateResult(
+        status="error", error="Face does not match reference"
+    )
+    tokens = _login(client, "stu1234", "password123")
+
+    resp = client.post(
+        "/students/me/face-templates",
+        headers={"Authorization": f"Bearer {tokens['access_token']}"},
+        json={"photo": _img_b64()},
+    )
+    assert resp.status_code == 400
+    assert resp.json["error"] == "Face does not match reference"
+
+
+@patch("app.services.auth_service.verify_face_match")
+def test_face_login_uses_templates_stored_with_user_row(mock_verify, client, app):
+    import numpy as np
+
+    from app.services.face_service import ENCODING_DIM, ENCODING_MODEL, template_blobs
+
+    stored = np.full((1, ENCODING_DIM), 0.1)
+    with app.app_context():
+        from app.db import repository
+        from app.db.connection import get_db
+
+        db = get_db()
+        repository.replace_face_templates(
+            db,
+            euid="stu1234",
+            encodings=template_blobs(stored),
+            dim=ENCODING_DIM,
+            model=ENCODING_MODEL,
+        )
+        db.commit()
+        professor = repository.get_student_face_templates(db, euid="pro1234", model=ENCODING_MODEL)
+        assert professor is None
+
+    mock_verify.return_value = type("R", (), {"status": "success", "error": None})()
+
+    # No reference image on disk: the stored templates are enough.
+    resp = client.post("/auth/face-login", json={"euid": "stu1234", "photo": _img_b64()})
+
+    assert resp.status_code == 200, resp.json
+    assert np.allclose(mock_verify.call_args.kwargs["templates"], stored)
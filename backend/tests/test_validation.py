@@ -106,3 +106,40 @@ def test_valid_add_attendance_request_passes() -> None:
     req = AddAttendanceRequest.model_validate(payload)
     assert req.code == "csce_4900_500"
     assert req.euid == "gdb2356"
+
+
+@pytest.mark.parametrize(
+    "bad_box",
+    [
+        [0.2, 0.7, 0.6],  # wrong length
+        [0.2, 0.7, 0.6, -0.1],  # outside the image
+        [0.6, 0.7, 0.2, 0.3],  # top below bottom
+        [0.2, 0.31, 0.21, 0.3],  # too small
+        [None, 0.7, 0.6, 0.3],  # null item
+        [{"top": 0.2}, 0.7, 0.6, 0.3],  # object item
+        ["top", 0.7, 0.6, 0.3],  # not a number
+    ],
+)
+def test_face_box_rejected(bad_box: list[float]) -> None:
+    payload = {
+        "code": "csce_4900_500",
+        "euid": "gdb2356",
+        "location": [33.214, -97.133],
+        "photo": base64.b64encode(b"\xff\xd8\xff\xe0fakejpg").decode("utf-8"),
+        "face_box": bad_box,
+    }
+    with pytest.raises(ValidationError):
+        AddAttendanceRequest.model_validate(payload)
+
+
+def test_face_box_is_optional_and_parsed() -> None:
+    payload = {
+        "code": "csce_4900_500",
+        "euid": "gdb2356",
+        "location": [33.214, -97.133],
+        "photo": base64.b64encode(b"\xff\xd8\xff\xe0fakejpg").decode("utf-8"),
+    }
+    assert AddAttendanceRequest.model_validate(payload).face_box is None
+
+    payload["face_box"] = [0.2, 0.7, 0.65, 0.3]
+    assert AddAttendanceRequest.model_validate(payload).face_box == (0.2, 0.7, 0.65, 0.3)